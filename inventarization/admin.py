@@ -46,7 +46,7 @@ class InventoryCountItemInline(admin.TabularInline):
 class InventoryCountAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'user', 'status', 'created_at', 'completed_at', 'item_count')
     list_filter = ('status', 'user')
-    readonly_fields = ('created_at', 'completed_at')
+    readonly_fields = ('created_at', 'completed_at', 'snapshot_scope', 'snapshot_taken_at')
     inlines = [InventoryCountItemInline]
 
     @admin.display(description="Кол-во позиций")
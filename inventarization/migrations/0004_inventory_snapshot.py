@@ -0,0 +1,40 @@
+# Generated by Django 4.2.26 on 2026-10-19 11:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('inventarization', '0003_inventorycountitem_manager_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorycount',
+            name='snapshot_scope',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Область снимка остатков'),
+        ),
+        migrations.AddField(
+            model_name='inventorycount',
+            name='snapshot_taken_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Снимок остатков сделан'),
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshotItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('system_quantity', models.IntegerField(verbose_name='Кол-во по системе на начало')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Тип объекта')),
+                ('inventory_count', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_items', to='inventarization.inventorycount', verbose_name='Переучет')),
+            ],
+            options={
+                'verbose_name': 'Остаток на начало переучета',
+                'verbose_name_plural': 'Остатки на начало переучета',
+                'unique_together': {('inventory_count', 'content_type', 'object_id')},
+            },
+        ),
+    ]
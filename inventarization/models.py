@@ -18,6 +18,10 @@ class InventoryCount(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата начала")
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата завершения")
     notes = models.TextField(blank=True, verbose_name="Примечания к переучету")
+    # Остатки на начало (InventorySnapshotItem): область вида 'all', 'products',
+    # 'materials', 'product_category:5', 'material_category:3'; пусто — без снимка
+    snapshot_scope = models.CharField(max_length=50, blank=True, verbose_name="Область снимка остатков")
+    snapshot_taken_at = models.DateTimeField(null=True, blank=True, verbose_name="Снимок остатков сделан")
 
     def __str__(self):
         return f"Переучет №{self.id} от {self.created_at.strftime('%d.%m.%Y')}"
@@ -82,4 +86,27 @@ class InventoryCountItem(models.Model):
     class Meta:
         verbose_name = "Позиция переучета"
         verbose_name_plural = "Позиции переучета"
-        unique_together = ('inventory_count', 'content_type', 'object_id')
\ No newline at end of file
+        # Уникальный индекс (inventory_count, content_type, object_id) заодно обслуживает
+        # поиск позиций по кандидатам (counted_quantities, ingest_scans) — отдельный Index не нужен
+        unique_together = ('inventory_count', 'content_type', 'object_id')
+
+
+class InventorySnapshotItem(models.Model):
+    """
+    Остаток по системе на момент начала переучета.
+    Сканы берут system_quantity отсюда: база сверки не плывет от отгрузок во время пересчета.
+    """
+    inventory_count = models.ForeignKey(
+        InventoryCount,
+        on_delete=models.CASCADE,
+        related_name='snapshot_items',
+        verbose_name="Переучет"
+    )
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name="Тип объекта")
+    object_id = models.PositiveIntegerField(verbose_name="ID объекта")
+    system_quantity = models.IntegerField(verbose_name="Кол-во по системе на начало")
+
+    class Meta:
+        verbose_name = "Остаток на начало переучета"
+        verbose_name_plural = "Остатки на начало переучета"
+        unique_together = ('inventory_count', 'content_type', 'object_id')
@@ -0,0 +1,415 @@
+"""
+Массовый ввод результатов сканирования в переучет.
+
+Сканер (или планшет кладовщика) копит отсканированные коды и отправляет их
+пачкой: каждый код — идентификатор из поиска ('product-12', 'material-3',
+'package-5') или штрихкод. Коды разрешаются одним запросом на модель,
+позиции переучета пишутся одним bulk_create(update_conflicts=True).
+"""
+import re
+from collections import defaultdict
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from warehouse1.models import Material, MaterialOperation
+from warehouse2.models import Product, Package, ProductOperation
+from warehouse2.tasks import update_stocks_in_keycrm
+from .models import InventoryCount, InventoryCountItem, InventorySnapshotItem
+
+IDENTIFIER_RE = re.compile(r'^(product|material|package)-(\d+)$')
+
+SCAN_MODE_ADD = 'add'
+SCAN_MODE_SET = 'set'
+
+# Статусы переучета, в которых кладовщик может вносить позиции
+EDITABLE_STATUSES = (InventoryCount.Status.IN_PROGRESS, InventoryCount.Status.FIXING)
+
+
+class InventoryScanError(ValueError):
+    """Пачку сканов нельзя принять целиком (переучет закрыт и т.п.)"""
+
+
+class InventoryScopeError(ValueError):
+    """Неизвестная область снимка остатков"""
+
+
+class InventoryReconcileError(ValueError):
+    """Корректировку по переучету провести нельзя"""
+
+
+def system_quantity_of(obj):
+    """Остаток по системе: доступное количество товара или количество материала."""
+    return getattr(obj, 'available_quantity', getattr(obj, 'quantity', 0))
+
+
+def attach_content_objects(items):
+    """
+    Подставляет позициям объекты учета: один запрос на тип (материалы — сразу
+    с единицей измерения) вместо запроса через GenericForeignKey на каждую строку.
+    """
+    items = list(items)
+    ids_by_type = defaultdict(set)
+    for item in items:
+        ids_by_type[item.content_type_id].add(item.object_id)
+
+    loaded = {}
+    for content_type_id, ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        queryset = model._default_manager.filter(pk__in=ids)
+        if model is Material:
+            queryset = queryset.select_related('unit')
+        loaded[content_type_id] = queryset.in_bulk()
+
+    for item in items:
+        obj = loaded[item.content_type_id].get(item.object_id)
+        if obj is not None:
+            item.content_object = obj
+    return items
+
+
+def counted_quantities(inventory_count_id, objects):
+    """
+    Уже посчитанное в переучете по найденным объектам: {(модель, pk): количество}.
+    Выборка только по кандидатам — через уникальный индекс
+    (inventory_count, content_type, object_id), без чтения всего переучета.
+    """
+    ids_by_model = defaultdict(set)
+    for obj in objects:
+        ids_by_model[type(obj)].add(obj.pk)
+    if not ids_by_model:
+        return {}
+    content_types = ContentType.objects.get_for_models(*ids_by_model)
+    model_by_ct = {ct.pk: model for model, ct in content_types.items()}
+    condition = Q()
+    for model, ids in ids_by_model.items():
+        condition |= Q(content_type=content_types[model], object_id__in=ids)
+    rows = InventoryCountItem.objects.filter(condition, inventory_count_id=inventory_count_id).values_list(
+        'content_type_id', 'object_id', 'actual_quantity'
+    )
+    return {(model_by_ct[content_type_id], object_id): quantity for content_type_id, object_id, quantity in rows}
+
+
+def resolve_codes(codes):
+    """
+    Разрешает коды в объекты учета: {код: Product | Material}.
+    Упаковка считается своим товаром. Одинаковый штрихкод ищется по порядку:
+    товар, упаковка, материал. Неизвестные коды в ответ не попадают.
+    """
+    ids = {'product': set(), 'material': set(), 'package': set()}
+    barcodes = set()
+    for code in codes:
+        match = IDENTIFIER_RE.match(code)
+        if match:
+            ids[match.group(1)].add(int(match.group(2)))
+        else:
+            barcodes.add(code)
+
+    def lookup(prefix, queryset):
+        if not ids[prefix] and not barcodes:
+            return {}, {}
+        found = list(queryset.filter(Q(pk__in=ids[prefix]) | Q(barcode__in=barcodes)))
+        return {obj.pk: obj for obj in found}, {obj.barcode: obj for obj in found}
+
+    products, product_barcodes = lookup('product', Product.objects.all())
+    packages, package_barcodes = lookup('package', Package.objects.select_related('product'))
+    materials, material_barcodes = lookup('material', Material.objects.all())
+
+    resolved = {}
+    for code in codes:
+        match = IDENTIFIER_RE.match(code)
+        if match:
+            prefix, pk = match.group(1), int(match.group(2))
+            obj = {'product': products, 'material': materials, 'package': packages}[prefix].get(pk)
+        else:
+            obj = product_barcodes.get(code) or package_barcodes.get(code) or material_barcodes.get(code)
+        if isinstance(obj, Package):
+            obj = obj.product
+        if obj is not None:
+            resolved[code] = obj
+    return resolved
+
+
+def _parse_scan(raw):
+    if not isinstance(raw, dict):
+        raise ValueError
+    code = str(raw.get('code') or raw.get('barcode') or raw.get('identifier') or '').strip()
+    quantity = int(raw.get('quantity', 1))
+    mode = raw.get('mode', SCAN_MODE_ADD)
+    if not code or quantity < 0 or mode not in (SCAN_MODE_ADD, SCAN_MODE_SET):
+        raise ValueError
+    return code, quantity, mode
+
+
+def ingest_scans(inventory_count_id, scans):
+    """
+    Применяет пачку сканов к переучету.
+    scans: [{'code': '4820000000012', 'quantity': 1, 'mode': 'add' | 'set'}, ...]
+    'add' прибавляет к уже посчитанному, 'set' задает количество; сканы одного
+    объекта применяются по порядку. Возвращает (позиции, ошибки {индекс: сообщение}).
+    """
+    errors = {}
+    parsed = []
+    for index, raw in enumerate(scans):
+        try:
+            parsed.append((index, *_parse_scan(raw)))
+        except (ValueError, TypeError):
+            errors[index] = "Некорректный скан"
+
+    with transaction.atomic():
+        # Блокируем сам переучет: пачки одного переучета применяются по очереди
+        inventory_count = InventoryCount.objects.select_for_update().get(pk=inventory_count_id)
+        if inventory_count.status not in EDITABLE_STATUSES:
+            raise InventoryScanError("Этот переучет нельзя редактировать в текущем статусе.")
+
+        resolved = resolve_codes([code for _, code, _, _ in parsed])
+        content_types = ContentType.objects.get_for_models(Product, Material)
+
+        # Итог по каждому объекту: (базовое количество из 'set' или None, прибавка)
+        targets = {}
+        for index, code, quantity, mode in parsed:
+            obj = resolved.get(code)
+            if obj is None:
+                errors[index] = f"Не найдено: {code}"
+                continue
+            key = (content_types[type(obj)].pk, obj.pk)
+            base, added = targets.get(key, (None, 0, obj))[:2]
+            if mode == SCAN_MODE_SET:
+                base, added = quantity, 0
+            else:
+                added += quantity
+            targets[key] = (base, added, obj)
+
+        if not targets:
+            return [], errors
+
+        # Пересечение по двум спискам может захватить лишние строки — отсекаем по ключу
+        existing = inventory_count.items.filter(
+            content_type_id__in={key[0] for key in targets}, object_id__in={key[1] for key in targets}
+        )
+        counted = {
+            (content_type_id, object_id): quantity
+            for content_type_id, object_id, quantity in existing.values_list('content_type_id', 'object_id', 'actual_quantity')
+            if (content_type_id, object_id) in targets
+        }
+        # Со снимком остатков база сверки — остаток на начало, а не текущий
+        baseline = {}
+        if inventory_count.snapshot_taken_at:
+            baseline = {
+                (content_type_id, object_id): quantity
+                for content_type_id, object_id, quantity in inventory_count.snapshot_items.filter(
+                    content_type_id__in={key[0] for key in targets}, object_id__in={key[1] for key in targets}
+                ).values_list('content_type_id', 'object_id', 'system_quantity')
+            }
+
+        items = []
+        for (content_type_id, object_id), (base, added, obj) in targets.items():
+            start = base if base is not None else counted.get((content_type_id, object_id), 0)
+            item = InventoryCountItem(
+                inventory_count=inventory_count,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                system_quantity=baseline.get((content_type_id, object_id), system_quantity_of(obj)),
+                actual_quantity=start + added,
+                # Кладовщик пересчитал — позиция снова ждет сверки
+                reconciliation_status=InventoryCountItem.ReconciliationStatus.PENDING,
+            )
+            item.content_object = obj
+            item.created = (content_type_id, object_id) not in counted
+            items.append(item)
+
+        # Со снимком сканы пишут только факт: система зафиксирована при первом скане
+        update_fields = ['actual_quantity', 'reconciliation_status']
+        if not inventory_count.snapshot_taken_at:
+            update_fields.append('system_quantity')
+        InventoryCountItem.objects.bulk_create(
+            items,
+            update_conflicts=True,
+            unique_fields=['inventory_count', 'content_type', 'object_id'],
+            update_fields=update_fields,
+        )
+        # bulk_create с update_conflicts (Django 4.2) не проставляет pk — добираем одним запросом
+        pks = {
+            (content_type_id, object_id): pk
+            for content_type_id, object_id, pk in existing.values_list('content_type_id', 'object_id', 'pk')
+        }
+        for item in items:
+            item.pk = pks[(item.content_type_id, item.object_id)]
+    return items, errors
+
+
+# ==============================================================================
+# Снимок остатков на начало переучета
+# ==============================================================================
+
+SNAPSHOT_SCOPES = {
+    'all': 'Все товары и материалы',
+    'products': 'Склад готовой продукции',
+    'materials': 'Склад материалов',
+}
+
+
+def parse_snapshot_scope(scope):
+    """
+    'all' | 'products' | 'materials' | 'product_category:<id>' | 'material_category:<id>'
+    -> (фильтр товаров, фильтр материалов): None — не входит, {} — все, {'category_id': id} — категория.
+    """
+    if scope == 'all':
+        return {}, {}
+    if scope == 'products':
+        return {}, None
+    if scope == 'materials':
+        return None, {}
+    kind, _, category_id = scope.partition(':')
+    if category_id.isdigit():
+        if kind == 'product_category':
+            return {'category_id': int(category_id)}, None
+        if kind == 'material_category':
+            return None, {'category_id': int(category_id)}
+    raise InventoryScopeError(f"Неизвестная область снимка: {scope}")
+
+
+def take_stock_snapshot(inventory_count, scope):
+    """
+    Фиксирует остатки по системе для области переучета одним INSERT ... SELECT
+    (один оператор — согласованный срез, даже если в это время идут отгрузки).
+    Возвращает число зафиксированных позиций.
+    """
+    product_filter, material_filter = parse_snapshot_scope(scope)
+    content_types = ContentType.objects.get_for_models(Product, Material)
+
+    branches, params = [], []
+    if product_filter is not None:
+        # Как и при скане без снимка: доступный остаток (без резерва), архив не считаем
+        sql = (
+            f"SELECT %s, %s, id, total_quantity - reserved_quantity FROM {Product._meta.db_table} "
+            "WHERE NOT is_archived"
+        )
+        params += [inventory_count.pk, content_types[Product].pk]
+        if 'category_id' in product_filter:
+            sql += " AND category_id = %s"
+            params.append(product_filter['category_id'])
+        branches.append(sql)
+    if material_filter is not None:
+        sql = f"SELECT %s, %s, id, quantity FROM {Material._meta.db_table}"
+        params += [inventory_count.pk, content_types[Material].pk]
+        if 'category_id' in material_filter:
+            sql += " WHERE category_id = %s"
+            params.append(material_filter['category_id'])
+        branches.append(sql)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {InventorySnapshotItem._meta.db_table} "
+                "(inventory_count_id, content_type_id, object_id, system_quantity) "
+                + " UNION ALL ".join(branches)
+                + " ON CONFLICT (inventory_count_id, content_type_id, object_id) DO NOTHING",
+                params,
+            )
+            taken = cursor.rowcount
+        InventoryCount.objects.filter(pk=inventory_count.pk).update(
+            snapshot_scope=scope, snapshot_taken_at=timezone.now()
+        )
+    return taken
+
+
+# ==============================================================================
+# Сверка: корректировка остатков по расхождениям
+# ==============================================================================
+
+# Сколько строк товаров/материалов блокируется одним SELECT ... FOR UPDATE
+RECONCILE_LOCK_BATCH_SIZE = 500
+
+
+def apply_adjustments(user, inventory_count, items):
+    """
+    Приводит остатки к факту по позициям переучета и пишет журнал корректировок.
+    Возвращает число сверенных позиций.
+
+    Товары и материалы блокируются пачками в порядке pk (тот же порядок у любой
+    параллельной сверки — без взаимных блокировок), остатки — bulk_update,
+    операции — bulk_create, статусы позиций — один UPDATE. Остатки в CRM —
+    одной задачей после коммита (bulk_create не шлет post_save операций).
+    """
+    content_types = ContentType.objects.get_for_models(Product, Material)
+    model_by_ct = {ct.pk: model for model, ct in content_types.items()}
+    targets = {Product: {}, Material: {}}
+    for item in items:
+        model = model_by_ct.get(item.content_type_id)
+        if model is not None:
+            targets[model][item.object_id] = item
+
+    comment = f"Корректировка по переучету №{inventory_count.id}"
+    product_operations, material_operations = [], []
+
+    with transaction.atomic():
+        for model, field in ((Product, 'total_quantity'), (Material, 'quantity')):
+            ids = sorted(targets[model])
+            for start in range(0, len(ids), RECONCILE_LOCK_BATCH_SIZE):
+                batch = ids[start:start + RECONCILE_LOCK_BATCH_SIZE]
+                locked = list(model.objects.select_for_update().filter(pk__in=batch).order_by('pk').only('pk', field))
+                if len(locked) != len(batch):
+                    missing = set(batch) - {obj.pk for obj in locked}
+                    raise InventoryReconcileError(
+                        f"{model._meta.verbose_name}: не найдены объекты {', '.join(map(str, sorted(missing)))}"
+                    )
+                for obj in locked:
+                    item = targets[model][obj.pk]
+                    # В журнал — сдвиг от текущего остатка, а не variance: system_quantity
+                    # мог быть снят снимком до отгрузок/приходов за время пересчета
+                    delta = item.actual_quantity - getattr(obj, field)
+                    setattr(obj, field, item.actual_quantity)
+                    if not delta:
+                        continue
+                    if model is Product:
+                        product_operations.append(ProductOperation(
+                            product=obj,
+                            operation_type=ProductOperation.OperationType.ADJUSTMENT,
+                            quantity=delta,
+                            content_type_id=item.content_type_id,
+                            object_id=inventory_count.id,
+                            user=user,
+                            comment=comment,
+                        ))
+                    else:
+                        material_operations.append(MaterialOperation(
+                            material=obj,
+                            operation_type='adjustment',
+                            quantity=delta,
+                            user=user,
+                            comment=f"{comment}. Корректировка: {delta}",
+                        ))
+                model.objects.bulk_update(locked, [field])
+
+        ProductOperation.objects.bulk_create(product_operations, batch_size=RECONCILE_LOCK_BATCH_SIZE)
+        MaterialOperation.objects.bulk_create(material_operations, batch_size=RECONCILE_LOCK_BATCH_SIZE)
+        InventoryCountItem.objects.filter(pk__in=[item.pk for item in items]).update(
+            reconciliation_status=InventoryCountItem.ReconciliationStatus.RECONCILED
+        )
+
+        product_ids = sorted(targets[Product])
+        if product_ids:
+            transaction.on_commit(lambda: update_stocks_in_keycrm.delay(product_ids))
+    return len(targets[Product]) + len(targets[Material])
+
+
+def pending_variances(inventory_count):
+    """Позиции, ожидающие сверки, у которых факт не совпал с системой"""
+    return inventory_count.items.filter(
+        reconciliation_status=InventoryCountItem.ReconciliationStatus.PENDING
+    ).exclude(actual_quantity=F('system_quantity'))
+
+
+def apply_all_variances(inventory_count_id, user):
+    """
+    Проводит все необработанные расхождения переучета одной транзакцией.
+    Возвращает число проведенных корректировок.
+    """
+    with transaction.atomic():
+        # Блокировка переучета: две одновременные «провести все» не задвоят корректировки
+        inventory_count = InventoryCount.objects.select_for_update().get(pk=inventory_count_id)
+        if inventory_count.status != InventoryCount.Status.COMPLETED:
+            raise InventoryReconcileError("Статус не позволяет правки")
+        items = list(pending_variances(inventory_count))
+        return apply_adjustments(user, inventory_count, items)
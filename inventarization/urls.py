@@ -11,6 +11,10 @@ urlpatterns = [
     path('<int:pk>/complete/', views.complete_inventory_count, name='count_complete'),
     # Главная рабочая страница для проведения переучета
     path('<int:pk>/', views.InventoryCountWorkView.as_view(), name='count_work'),
+    # Пакетный ввод сканов (JSON)
+    path('<int:pk>/scan/batch/', views.inventory_scan_batch, name='inventory_scan_batch'),
+    # Догрузка позиций постранично (JSON)
+    path('<int:pk>/items/', views.inventory_count_items, name='inventory_count_items'),
     # URL для обновления и удаления конкретной позиции
     path('item/<int:pk>/update/', views.update_inventory_item, name='item_update'),
     path('item/<int:pk>/delete/', views.delete_inventory_item, name='item_delete'),
@@ -2,19 +2,27 @@ from django.shortcuts import redirect, get_object_or_404
 from django.views.generic import ListView, FormView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.conf import settings
+from django.http import Http404
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
 from django.contrib import messages
-from django.contrib.contenttypes.models import ContentType
 from django.http import JsonResponse
 from django.db.models import Q, F, Case, When, Value, IntegerField
 from django.utils import timezone
 from .models import InventoryCount, InventoryCountItem
 from .forms import InventoryItemForm, InventoryItemUpdateForm
-from warehouse1.models import Material
-from warehouse2.models import Product, Package
+from warehouse1.models import Material, MaterialCategory
+from warehouse2.models import Product, ProductCategory
 from django.views.generic import DetailView, View
 from django.db import transaction
-from warehouse1.models import MaterialOperation
-from warehouse2.models import ProductOperation
+from .servises import (
+    ingest_scans, take_stock_snapshot, attach_content_objects, counted_quantities, apply_adjustments, apply_all_variances, pending_variances,
+    InventoryScanError, InventoryScopeError, InventoryReconcileError, SNAPSHOT_SCOPES,
+)
+import json
 
 class InventoryCountListView(LoginRequiredMixin, ListView):
     model = InventoryCount
@@ -23,6 +31,14 @@ class InventoryCountListView(LoginRequiredMixin, ListView):
     ordering = ['-created_at']
     paginate_by = 20
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Варианты области снимка остатков для нового переучета
+        context['snapshot_scopes'] = SNAPSHOT_SCOPES
+        context['product_categories'] = ProductCategory.objects.order_by('name')
+        context['material_categories'] = MaterialCategory.objects.order_by('name')
+        return context
+
 class StartInventoryCountView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         active_count = InventoryCount.objects.filter(user=request.user, status='in_progress').first()
@@ -30,100 +46,178 @@ class StartInventoryCountView(LoginRequiredMixin, View):
             messages.warning(request, "У вас уже есть незавершенный переучет. Вы были перенаправлены на него.")
             return redirect('count_work', pk=active_count.pk)
         
-        new_count = InventoryCount.objects.create(user=request.user)
+        # Необязательный снимок остатков на начало: сверка пойдет с ним, а не с текущим остатком
+        snapshot_scope = request.POST.get('snapshot_scope', '').strip()
+        try:
+            with transaction.atomic():
+                new_count = InventoryCount.objects.create(user=request.user)
+                if snapshot_scope:
+                    take_stock_snapshot(new_count, snapshot_scope)
+        except InventoryScopeError as e:
+            messages.error(request, str(e))
+            return redirect('count_list')
         messages.success(request, f"Начат новый переучет №{new_count.id}")
         return redirect('count_work', pk=new_count.pk)
 
+def _work_items(inventory_count):
+    """Позиции для экрана пересчета в порядке показа"""
+    items = inventory_count.items.all()
+    # Если мы в режиме исправления, показываем ТОЛЬКО то, что нужно пересчитать
+    if inventory_count.status == InventoryCount.Status.FIXING:
+        return items.filter(reconciliation_status=InventoryCountItem.ReconciliationStatus.RECOUNT).order_by('-id')
+    # В обычном режиме сортируем: сначала новые/приоритетные
+    return items.annotate(
+        recount_priority=Case(
+            When(reconciliation_status=InventoryCountItem.ReconciliationStatus.RECOUNT, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('recount_priority', '-id')
+
+
+def _reconcile_items(inventory_count):
+    return inventory_count.items.order_by('id')
+
+
+def _items_page(items, page_number):
+    """Страница позиций с подгруженными объектами учета (без запроса на строку)"""
+    page = Paginator(items, getattr(settings, 'INVENTORY_ITEMS_PAGE_SIZE', 100)).get_page(page_number)
+    page.object_list = attach_content_objects(page.object_list)
+    return page
+
+
 class InventoryCountWorkView(LoginRequiredMixin, FormView):
     template_name = 'inventarization/count_work.html'
     form_class = InventoryItemForm
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        inventory_count = get_object_or_404(
-            InventoryCount.objects.prefetch_related('items__content_type'), 
-            pk=self.kwargs['pk']
-        )
-        # Базовый QuerySet
-        items = inventory_count.items.all()
-        # Если мы в режиме исправления, показываем ТОЛЬКО то, что нужно пересчитать
-        if inventory_count.status == InventoryCount.Status.FIXING:
-            items = items.filter(reconciliation_status=InventoryCountItem.ReconciliationStatus.RECOUNT)
-        else:
-            # В обычном режиме сортируем: сначала новые/приоритетные
-            items = items.annotate(
-                recount_priority=Case(
-                    When(reconciliation_status=InventoryCountItem.ReconciliationStatus.RECOUNT, then=Value(0)),
-                    default=Value(1),
-                    output_field=IntegerField(),
-                )
-            ).order_by('recount_priority', '-id')
-
-        # Подготовка форм
-        for item in items:
-            item.update_form = InventoryItemUpdateForm(initial={'quantity': item.actual_quantity})
+        inventory_count = get_object_or_404(InventoryCount, pk=self.kwargs['pk'])
+        # Первая страница позиций; дальше список догружается из inventory_count_items
+        page = _items_page(_work_items(inventory_count), self.request.GET.get('page'))
 
         context['inventory_count'] = inventory_count
-        context['items'] = items
+        context['items'] = page.object_list
+        context['items_total'] = page.paginator.count
+        context['page_obj'] = page
         return context
 
     def form_valid(self, form):
         inventory_count = get_object_or_404(InventoryCount, pk=self.kwargs['pk'])
-        
-        # Разрешаем правки и в процессе, и в режиме "исправления"
-        allowed_statuses = [InventoryCount.Status.IN_PROGRESS, InventoryCount.Status.FIXING]
-        if inventory_count.status not in allowed_statuses:
-            messages.error(self.request, "Этот переучет нельзя редактировать в текущем статусе.")
-            return redirect('count_work', pk=inventory_count.pk)
-            
         identifier = form.cleaned_data['item_identifier']
         actual_quantity = form.cleaned_data['quantity']
 
-        # Избавляемся от "ёлочки" через словарь (Strategy-like pattern)
-        model_map = {
-            'product': Product,
-            'material': Material,
-            'package': Package,
-        }
-
+        # Ручной ввод — та же пачка сканов из одного элемента: одна логика
+        # остатка по системе (в т.ч. снимок на начало) для формы и для сканера
         try:
-            prefix, obj_id = identifier.split('-')
-            model_class = model_map.get(prefix)
-            
-            if not model_class:
-                raise ValueError(f"Неизвестный тип: {prefix}")
-
-            target_obj = get_object_or_404(model_class, pk=obj_id)
-            
-            # Если это упаковка, работаем с привязанным товаром
-            if prefix == 'package':
-                target_obj = target_obj.product
-                model_class = Product
-                obj_id = target_obj.id
-
-            # Логика получения системного остатка
-            sys_qty = getattr(target_obj, 'available_quantity', getattr(target_obj, 'quantity', 0))
-
-            item, created = InventoryCountItem.objects.update_or_create(
-                inventory_count=inventory_count,
-                content_type=ContentType.objects.get_for_model(model_class),
-                object_id=obj_id,
-                defaults={
-                    'system_quantity': sys_qty,
-                    'actual_quantity': actual_quantity,
-                    # ВАЖНО: Если кладовщик пересчитал, сбрасываем статус "RECOUNT" на "PENDING"
-                    'reconciliation_status': InventoryCountItem.ReconciliationStatus.PENDING
-                }
+            items, errors = ingest_scans(
+                inventory_count.pk, [{'code': identifier, 'quantity': actual_quantity, 'mode': 'set'}]
             )
+        except InventoryScanError as e:
+            messages.error(self.request, str(e))
+            return redirect('count_work', pk=inventory_count.pk)
 
-            msg = f"Позиция '{target_obj.name}' добавлена." if created else f"Обновлено: {target_obj.name}"
+        if errors:
+            messages.error(self.request, f"Ошибка: {errors[0]}")
+        else:
+            item = items[0]
+            name = item.content_object.name
+            msg = f"Позиция '{name}' добавлена." if item.created else f"Обновлено: {name}"
             messages.success(self.request, msg)
 
-        except Exception as e:
-            messages.error(self.request, f"Ошибка: {e}")
-        
         return redirect('count_work', pk=inventory_count.pk)
 
+def _item_payload(item):
+    return {
+        'id': item.pk,
+        'identifier': f"{item.content_type.model}-{item.object_id}",
+        'name': item.content_object.name if item.content_object else '',
+        'actual_quantity': item.actual_quantity,
+        'system_quantity': item.system_quantity,
+        'variance': item.variance,
+        'reconciliation_status': item.reconciliation_status,
+    }
+
+
+@login_required
+@require_POST
+def inventory_scan_batch(request, pk):
+    """
+    Пакетный ввод сканов в переучет (скорость сканера, без перезагрузки страницы).
+    Принимает JSON: {'scans': [{'code': 'product-12' | штрихкод, 'quantity': 1, 'mode': 'add' | 'set'}, ...]}
+    ?partial=1 — в ответе еще и готовый HTML строк списка.
+    """
+    try:
+        scans = json.loads(request.body).get('scans')
+    except (ValueError, AttributeError):
+        scans = None
+    if not isinstance(scans, list) or not scans:
+        return JsonResponse({'success': False, 'message': 'Ожидается непустой список scans'}, status=400)
+    batch_max = getattr(settings, 'INVENTORY_SCAN_BATCH_MAX', 500)
+    if len(scans) > batch_max:
+        return JsonResponse({'success': False, 'message': f'Не больше {batch_max} сканов за раз'}, status=400)
+
+    try:
+        items, errors = ingest_scans(pk, scans)
+    except InventoryCount.DoesNotExist:
+        raise Http404
+    except InventoryScanError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    payload = {
+        'success': not errors,
+        'message': f'Принято позиций: {len(items)}' + (f', ошибок: {len(errors)}' if errors else ''),
+        'items': [dict(_item_payload(item), created=item.created) for item in items],
+        'errors': errors,
+    }
+    if request.GET.get('partial'):
+        html = {}
+        for item in items:
+            html[item.pk] = render_to_string(
+                'inventarization/count_work_item.html',
+                {'item': item, 'inventory_count': item.inventory_count},
+                request=request,
+            )
+        payload['html'] = html
+    return JsonResponse(payload)
+
+
+ITEM_SCREENS = {
+    # экран: (выборка позиций, шаблон строки, нужно право сверки)
+    'work': (_work_items, 'inventarization/count_work_item.html', False),
+    'reconcile': (_reconcile_items, 'inventarization/count_reconcile_item.html', True),
+}
+
+
+@login_required
+def inventory_count_items(request, pk):
+    """
+    Постраничная выдача позиций переучета для догрузки списка на экранах пересчета и сверки.
+    ?screen=work|reconcile&page=N; ?partial=1 — еще и готовый HTML строк (в порядке показа).
+    """
+    inventory_count = get_object_or_404(InventoryCount, pk=pk)
+    screen = ITEM_SCREENS.get(request.GET.get('screen', 'work'))
+    if screen is None:
+        return JsonResponse({'success': False, 'message': 'Неизвестный экран'}, status=400)
+    get_items, row_template, needs_permission = screen
+    if needs_permission and not request.user.has_perm('inventarization.can_reconcile_inventory'):
+        raise PermissionDenied
+
+    page = _items_page(get_items(inventory_count), request.GET.get('page'))
+    payload = {
+        'success': True,
+        'items': [_item_payload(item) for item in page.object_list],
+        'total': page.paginator.count,
+        'next_page': page.next_page_number() if page.has_next() else None,
+    }
+    if request.GET.get('partial'):
+        payload['html'] = [
+            render_to_string(row_template, {'item': item, 'inventory_count': inventory_count}, request=request)
+            for item in page.object_list
+        ]
+    return JsonResponse(payload)
+
+
 class InventoryReconciliationView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     """
     Представление для сверки завершенного переучета.
@@ -135,13 +229,14 @@ class InventoryReconciliationView(LoginRequiredMixin, PermissionRequiredMixin, D
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Оптимизируем запрос
-        items = self.object.items.select_related('content_type').all()
-        
-        # Считаем статистику для дашборда сверху
-        context['total_items'] = items.count()
-        context['discrepancy_count'] = sum(1 for item in items if item.variance != 0)
-        context['items'] = items
+        items = _reconcile_items(self.object)
+        page = _items_page(items, self.request.GET.get('page'))
+
+        # Считаем статистику для дашборда сверху (в БД, без выборки всех строк)
+        context['total_items'] = page.paginator.count
+        context['discrepancy_count'] = items.exclude(actual_quantity=F('system_quantity')).count()
+        context['items'] = page.object_list
+        context['page_obj'] = page
         return context
 
 
@@ -181,6 +276,14 @@ class InventoryAjaxActions(LoginRequiredMixin, PermissionRequiredMixin, View):
             ).update(reconciliation_status=InventoryCountItem.ReconciliationStatus.RECONCILED)
             return JsonResponse({'status': 'success'})
         
+        elif action == 'apply_all_variances':
+            # Все расхождения одним запросом вместо запроса на каждую строку
+            try:
+                applied = apply_all_variances(inventory_count.pk, request.user)
+            except InventoryReconcileError as e:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            return JsonResponse({'status': 'success', 'applied': applied})
+
         elif action == 'mark_recount':
             item = get_object_or_404(inventory_count.items, pk=item_id)
             item.reconciliation_status = InventoryCountItem.ReconciliationStatus.RECOUNT
@@ -201,38 +304,7 @@ class InventoryAjaxActions(LoginRequiredMixin, PermissionRequiredMixin, View):
 
     def _adjust_stock_logic(self, user, inventory_count, item):
         """ Логика корректировки """
-        with transaction.atomic():
-            model_class = item.content_type.model_class()
-            content_object = model_class.objects.select_for_update().get(pk=item.object_id)
-            
-            variance = item.variance
-            comment = f"Корректировка по переучету №{inventory_count.id}"
-
-            if isinstance(content_object, Product):
-                content_object.total_quantity = item.actual_quantity
-                content_object.save(update_fields=['total_quantity'])
-                ProductOperation.objects.create(
-                    product=content_object,
-                    operation_type=ProductOperation.OperationType.ADJUSTMENT,
-                    quantity=variance,
-                    content_type=item.content_type,
-                    object_id=inventory_count.id,
-                    user=user,
-                    comment=comment
-                )
-            elif isinstance(content_object, Material):
-                content_object.quantity = item.actual_quantity
-                content_object.save(update_fields=['quantity'])
-                MaterialOperation.objects.create(
-                    material=content_object,
-                    operation_type='adjustment',
-                    quantity=variance,
-                    user=user,
-                    comment=f"{comment}. Корректировка: {variance}"
-                )
-            
-            item.reconciliation_status = InventoryCountItem.ReconciliationStatus.RECONCILED
-            item.save(update_fields=['reconciliation_status'])
+        apply_adjustments(user, inventory_count, [item])
 
 
 class SendToFixingView(LoginRequiredMixin, PermissionRequiredMixin, View):
@@ -266,14 +338,8 @@ class FinalizeInventoryView(LoginRequiredMixin, PermissionRequiredMixin, View):
             InventoryCount, pk=pk, status=InventoryCount.Status.COMPLETED
         )
         
-        # Проверяем, что все позиции с расхождениями обработаны
-        pending_items = []
-        for item in inventory_count.items.all():
-            # Вычисляем расхождение для каждого элемента
-            if item.actual_quantity != item.system_quantity and item.reconciliation_status == 'pending':
-                pending_items.append(item)
-        
-        if pending_items:
+        # Проверяем, что все позиции с расхождениями обработаны (один EXISTS)
+        if pending_variances(inventory_count).exists():
             messages.error(request, "Не все позиции с расхождениями были обработаны.")
             return redirect('count_reconcile', pk=pk)
 
@@ -358,16 +424,9 @@ def complete_inventory_count(request, pk):
 @login_required
 def inventory_stock_search(request):
     query = request.GET.get('q', '').strip()
-    inventory_count_id = request.GET.get('inventory_count_id')
+    inventory_count_id = request.GET.get('inventory_count_id', '')
     results = []
 
-    counted_items = {}
-    if inventory_count_id:
-        items = InventoryCountItem.objects.filter(inventory_count_id=inventory_count_id)
-        for item in items:
-            item_key = f"{item.content_type.model}-{item.object_id}"
-            counted_items[item_key] = item.actual_quantity
-
     if len(query) < 2:
         return JsonResponse({'results': results})
 
@@ -376,28 +435,35 @@ def inventory_stock_search(request):
         Q(name__icontains=query) | Q(sku__icontains=query) |
         Q(barcode__exact=query) | Q(packages__barcode__exact=query)
     )
-    products_found = Product.objects.filter(product_query).distinct()[:5]
-    for p in products_found:
-        item_key = f"product-{p.id}"
-        results.append({
-            'id': item_key,
-            'name': f"{p.name}",
-            'info': f"Посчитано: <strong>{counted_items.get(item_key, 0)} шт.</strong>",
-            'counted_quantity': counted_items.get(item_key, 0)
-        })
+    products_found = list(Product.objects.filter(product_query).distinct()[:5])
 
     # Затем ищем материалы
     material_query = (
         Q(name__icontains=query) | Q(article__icontains=query) | Q(barcode__exact=query)
     )
-    materials_found = Material.objects.filter(material_query)[:5]
+    materials_found = list(Material.objects.select_related('unit').filter(material_query)[:5])
+
+    # Посчитанное — только по найденным кандидатам, а не по всему переучету
+    counted = {}
+    if inventory_count_id.isdigit():
+        counted = counted_quantities(int(inventory_count_id), products_found + materials_found)
+
+    for p in products_found:
+        quantity = counted.get((Product, p.id), 0)
+        results.append({
+            'id': f"product-{p.id}",
+            'name': f"{p.name}",
+            'info': f"Посчитано: <strong>{quantity} шт.</strong>",
+            'counted_quantity': quantity
+        })
+
     for m in materials_found:
-        item_key = f"material-{m.id}"
+        quantity = counted.get((Material, m.id), 0)
         results.append({
-            'id': item_key,
+            'id': f"material-{m.id}",
             'name': f"{m.name}",
-            'info': f"Посчитано: <strong>{counted_items.get(item_key, 0)} {m.unit.short_name}</strong>",
-            'counted_quantity': counted_items.get(item_key, 0)
+            'info': f"Посчитано: <strong>{quantity} {m.unit.short_name}</strong>",
+            'counted_quantity': quantity
         })
 
-    return JsonResponse({'results': results})
\ No newline at end of file
+    return JsonResponse({'results': results})
@@ -30,6 +30,7 @@ from django.conf import settings
 from django.db import transaction
 from django.core.files.base import ContentFile
 from main.models import UserProfile
+from reports.analytics import get_stockout_risks
 
 
 # ==============================================================================
@@ -167,7 +168,14 @@ class IndexView(LoginRequiredMixin, View):
             min_quantity__gt=0 # Учитываем только те, где мин. остаток задан
             ).count()
         
-        production_orders = ProductionOrder.objects.prefetch_related('items').order_by('-created_at')[:10]
+        production_orders = ProductionOrder.objects.with_totals().order_by('-created_at')[:10]
+        # Суммы заказов для заданий на доске — одним запросом, а не по заказу на строку
+        ProductionOrder.attach_totals(
+            wo.order_item.production_order for wo in pending_workorders if wo.order_item
+        )
+
+        # Готовый прогноз исчерпания (пересчитывается периодической задачей)
+        stockout_risk_count = get_stockout_risks().count()
 
         context = {
             'user': request.user,
@@ -176,6 +184,7 @@ class IndexView(LoginRequiredMixin, View):
             'pending_shipments_count': Shipment.objects.filter(status__in=['pending', 'packaged']).count(),
             'pending_workorders_count': WorkOrder.objects.filter(status__in=['new', 'in_progress']).count(),
             'low_stock_materials_count': low_stock_materials_count,
+            'stockout_risk_count': stockout_risk_count,
             'production_orders': production_orders,
         }
         return render(request, 'index.html', context)
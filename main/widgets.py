@@ -0,0 +1,67 @@
+"""
+Выбор объекта через поиск на сервере (товары, материалы и т.п.).
+
+Обычный ModelChoiceField рисует <option> на каждую строку queryset'а.
+RemoteModelChoiceField рисует только выбранное значение, проверяет его
+одним запросом по pk, а варианты подгружает JS (static/js/remote_select.js)
+из JSON-поиска вида {'results': [{'id': ..., 'name': ...}, ...]}.
+"""
+from urllib.parse import urlencode
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class RemoteSelect(forms.Select):
+    """
+    <select> только с выбранным вариантом.
+    search_url_name + search_params — адрес поиска (строится при отрисовке).
+    manual=True — не подключать стандартную строку поиска (у страницы свой интерфейс,
+    значение выставляется через RemoteSelect.setValue).
+    """
+
+    class Media:
+        js = ('js/remote_select.js',)
+
+    def __init__(self, search_url_name, search_params=None, min_length=2, manual=False, attrs=None):
+        super().__init__(attrs)
+        self.search_url_name = search_url_name
+        self.search_params = search_params or {}
+        self.min_length = min_length
+        self.manual = manual
+
+    def search_url(self):
+        url = reverse(self.search_url_name)
+        return f"{url}?{urlencode(self.search_params)}" if self.search_params else url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        widget_attrs = context['widget']['attrs']
+        widget_attrs['data-remote-url'] = self.search_url()
+        widget_attrs['data-min-length'] = self.min_length
+        if self.manual:
+            widget_attrs['data-remote-manual'] = '1'
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        # Пустой вариант + выбранные объекты (один запрос), без перебора всего queryset
+        options = [self.create_option(name, '', getattr(self.choices.field, 'empty_label', None) or '', not value, 0)]
+        values = [v for v in value if v not in (None, '')]
+        if values:
+            try:
+                selected = list(self.choices.queryset.filter(pk__in=values))
+            except (ValueError, TypeError, ValidationError):
+                selected = []
+            for index, obj in enumerate(selected, start=1):
+                options.append(self.create_option(
+                    name, self.choices.field.prepare_value(obj), self.choices.field.label_from_instance(obj), True, index,
+                ))
+        return [(None, options, 0)]
+
+
+class RemoteModelChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField с RemoteSelect: проверка значения — один поиск по pk в queryset"""
+
+    def __init__(self, queryset, search_url_name, search_params=None, manual=False, **kwargs):
+        kwargs.setdefault('widget', RemoteSelect(search_url_name, search_params, manual=manual))
+        super().__init__(queryset, **kwargs)
@@ -1,3 +1,65 @@
 from django.contrib import admin
+from .models import PayrollLedgerEntry, WorkerBalance, PayrollPeriod, PayrollSnapshot, PayrollSnapshotLine
 
-# Register your models here.
+
+@admin.register(PayrollLedgerEntry)
+class PayrollLedgerEntryAdmin(admin.ModelAdmin):
+    """Журнал только для просмотра: правки идут через работы, премии и выплаты"""
+    list_display = ('worker', 'kind', 'amount', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('worker__username',)
+    raw_id_fields = ('worker', 'work_entry', 'penalty_bonus', 'payout')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WorkerBalance)
+class WorkerBalanceAdmin(admin.ModelAdmin):
+    list_display = ('worker', 'earned', 'bonuses', 'penalties', 'paid', 'updated_at')
+    search_fields = ('worker__username',)
+    readonly_fields = ('worker', 'earned', 'bonuses', 'penalties', 'paid', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PayrollPeriod)
+class PayrollPeriodAdmin(admin.ModelAdmin):
+    """Периоды закрываются через бухгалтерию (см. payroll/servises.py), здесь только просмотр"""
+    list_display = ('__str__', 'closed_at', 'closed_by')
+    readonly_fields = ('start_date', 'end_date', 'closed_at', 'closed_by')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class PayrollSnapshotLineInline(admin.TabularInline):
+    model = PayrollSnapshotLine
+    readonly_fields = ('operation', 'quantity', 'earned')
+    extra = 0
+    can_delete = False
+
+
+@admin.register(PayrollSnapshot)
+class PayrollSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('worker', 'period', 'opening_balance', 'earned', 'bonuses', 'penalties', 'paid', 'closing_balance')
+    list_filter = ('period',)
+    search_fields = ('worker__username',)
+    readonly_fields = ('period', 'worker', 'opening_balance', 'earned', 'bonuses', 'penalties', 'paid', 'closing_balance')
+    inlines = [PayrollSnapshotLineInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
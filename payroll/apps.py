@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class PayrollConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payroll'
-    verbose_name = 'Зарплата'
\ No newline at end of file
+    verbose_name = 'Зарплата'
+
+    def ready(self):
+        # Сигналы сброса кэша ставок
+        import payroll.signals
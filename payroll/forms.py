@@ -4,6 +4,7 @@ from django.forms import inlineformset_factory
 from .models import TechCardGroup, TechCardOperation
 from django import forms
 from warehouse2.models import Product
+from main.widgets import RemoteModelChoiceField
 
 
 class OperationForm(forms.ModelForm):
@@ -78,6 +79,15 @@ class HourlyWorkForm(forms.ModelForm):
         self.fields['operation'].queryset = Operation.objects.filter(payment_type='hourly')
 
 class PieceWorkForm(forms.ModelForm):
+    # Товары с техкартой ищутся на сервере: в форме только выбранный, проверка — по pk
+    product = RemoteModelChoiceField(
+        queryset=Product.objects.filter(tech_card__isnull=False),
+        search_url_name='product_search_json',
+        search_params={'tech_card': '1'},
+        manual=True,  # у страницы свой поиск со сканером (work_entry_form.html)
+        label='Поиск изделия',
+    )
+
     class Meta:
         model = WorkEntry
         fields = ['product', 'operation', 'quantity', 'date_performed']
@@ -88,7 +98,6 @@ class PieceWorkForm(forms.ModelForm):
             'date_performed': 'Дата работы'
         }
         widgets = {
-            'product': forms.Select(attrs={'class': 'form-select select2'}), # Будем использовать поиск
             'operation': forms.Select(attrs={'class': 'form-select'}),
             'quantity': forms.NumberInput(attrs={'class': 'form-control'}),
             'date_performed': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
@@ -97,7 +106,6 @@ class PieceWorkForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['operation'].queryset = Operation.objects.none()
-        self.fields['product'].queryset = Product.objects.filter(tech_card__isnull=False)
 
         # Исправленная логика фильтрации операций
         if 'product' in self.data:
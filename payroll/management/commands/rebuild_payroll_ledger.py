@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payroll.servises import rebuild_payroll_ledger, recount_work_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет журнал по зарплате с работами, премиями/штрафами и выплатами (исправляющими проводками), пересчитывает балансы и счетчики для проверки работ'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Сверка журнала по зарплате...'))
+        count = rebuild_payroll_ledger()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Исправляющих проводок: {count}.'))
+        pairs = recount_work_counters()
+        self.stdout.write(self.style.SUCCESS(f'Счетчики проверки работ пересчитаны: {pairs} пар товар-операция.'))
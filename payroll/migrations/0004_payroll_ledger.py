@@ -0,0 +1,78 @@
+# Generated by Django 4.2.26 on 2026-10-19 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Начальное заполнение журнала и балансов из существующих данных
+# (на пустом журнале дает то же, что и сверка payroll.servises.rebuild_payroll_ledger)
+BACKFILL_LEDGER_SQL = """
+INSERT INTO payroll_payrollledgerentry (worker_id, kind, amount, work_entry_id, created_at)
+SELECT worker_id, 'earning', quantity * final_rate, id, now()
+FROM payroll_workentry WHERE is_verified AND quantity * final_rate <> 0;
+
+INSERT INTO payroll_payrollledgerentry (worker_id, kind, amount, penalty_bonus_id, created_at)
+SELECT worker_id, type, amount, id, now()
+FROM payroll_penaltybonus WHERE amount <> 0;
+
+INSERT INTO payroll_payrollledgerentry (worker_id, kind, amount, payout_id, created_at)
+SELECT worker_id, 'payout', amount, id, now()
+FROM payroll_payout WHERE amount <> 0;
+
+INSERT INTO payroll_workerbalance (worker_id, earned, bonuses, penalties, paid, updated_at)
+SELECT worker_id,
+       COALESCE(SUM(amount) FILTER (WHERE kind = 'earning'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE kind = 'bonus'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE kind = 'penalty'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE kind = 'payout'), 0),
+       now()
+FROM payroll_payrollledgerentry
+GROUP BY worker_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('payroll', '0003_payout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerBalance',
+            fields=[
+                ('worker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payroll_balance', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Заработано')),
+                ('bonuses', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Премии')),
+                ('penalties', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Штрафы')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выплачено')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Баланс работника',
+                'verbose_name_plural': 'Балансы работников',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('earning', 'Начисление за работу'), ('bonus', 'Премия'), ('penalty', 'Штраф'), ('payout', 'Выплата')], max_length=10, verbose_name='Тип')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Проведено')),
+                ('payout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payroll.payout', verbose_name='Выплата')),
+                ('penalty_bonus', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payroll.penaltybonus', verbose_name='Премия/Штраф')),
+                ('work_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payroll.workentry', verbose_name='Работа')),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_ledger', to=settings.AUTH_USER_MODEL, verbose_name='Работник')),
+            ],
+            options={
+                'verbose_name': 'Проводка по зарплате',
+                'verbose_name_plural': 'Журнал по зарплате',
+                'indexes': [models.Index(fields=['worker', 'created_at'], name='payroll_ledger_worker_idx')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_LEDGER_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 4.2.26 on 2026-10-19 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payroll', '0004_payroll_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='Начало (пусто — с начала учета)')),
+                ('end_date', models.DateField(unique=True, verbose_name='Конец периода')),
+                ('closed_at', models.DateTimeField(auto_now_add=True, verbose_name='Закрыт')),
+            ],
+            options={
+                'verbose_name': 'Расчетный период',
+                'verbose_name_plural': 'Расчетные периоды',
+                'ordering': ['-end_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Остаток на начало')),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Заработано')),
+                ('bonuses', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Премии')),
+                ('penalties', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Штрафы')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выплачено')),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Остаток на конец')),
+            ],
+            options={
+                'verbose_name': 'Итоги работника за период',
+                'verbose_name_plural': 'Итоги работников за периоды',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollSnapshotLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Кол-во (шт/час)')),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Заработано')),
+            ],
+            options={
+                'verbose_name': 'Заработок по операции',
+                'verbose_name_plural': 'Заработок по операциям',
+            },
+        ),
+        migrations.AddField(
+            model_name='payrollsnapshotline',
+            name='operation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='payroll.operation', verbose_name='Операция'),
+        ),
+        migrations.AddField(
+            model_name='payrollsnapshotline',
+            name='snapshot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='payroll.payrollsnapshot', verbose_name='Итоги'),
+        ),
+        migrations.AddField(
+            model_name='payrollsnapshot',
+            name='period',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='payroll.payrollperiod', verbose_name='Период'),
+        ),
+        migrations.AddField(
+            model_name='payrollsnapshot',
+            name='worker',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='Работник'),
+        ),
+        migrations.AddField(
+            model_name='payrollperiod',
+            name='closed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_payroll_periods', to=settings.AUTH_USER_MODEL, verbose_name='Закрыл'),
+        ),
+        migrations.AddField(
+            model_name='payout',
+            name='period',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='payouts', to='payroll.payrollperiod', verbose_name='Расчетный период'),
+        ),
+        migrations.AddField(
+            model_name='penaltybonus',
+            name='period',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='penalty_bonuses', to='payroll.payrollperiod', verbose_name='Расчетный период'),
+        ),
+        migrations.AddField(
+            model_name='workentry',
+            name='period',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='work_entries', to='payroll.payrollperiod', verbose_name='Расчетный период'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='payrollsnapshotline',
+            unique_together={('snapshot', 'operation')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='payrollsnapshot',
+            unique_together={('period', 'worker')},
+        ),
+        migrations.AddIndex(
+            model_name='workentry',
+            index=models.Index(condition=models.Q(('period__isnull', True)), fields=['worker', 'date_performed'], name='payroll_work_open_idx'),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.2.26 on 2026-10-19 11:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+WORK_COUNTERS_TRIGGER_SQL = """
+-- Счетчики для проверки работ. Прибавка — UPSERT; убыль — только UPDATE:
+-- при удалении товара Django может убрать строку счетчика раньше, чем обнулит ссылки работ.
+CREATE OR REPLACE FUNCTION payroll_apply_produced_delta(p_product_id bigint, delta bigint) RETURNS void AS $$
+BEGIN
+    IF p_product_id IS NULL OR delta = 0 THEN
+        RETURN;
+    ELSIF delta > 0 THEN
+        INSERT INTO payroll_productproducedcounter (product_id, produced) VALUES (p_product_id, delta)
+        ON CONFLICT (product_id) DO UPDATE SET produced = payroll_productproducedcounter.produced + EXCLUDED.produced;
+    ELSE
+        UPDATE payroll_productproducedcounter SET produced = produced + delta WHERE product_id = p_product_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION payroll_apply_claim_delta(p_product_id bigint, p_operation_id bigint, delta bigint) RETURNS void AS $$
+BEGIN
+    IF p_product_id IS NULL OR delta = 0 THEN
+        RETURN;
+    ELSIF delta > 0 THEN
+        INSERT INTO payroll_workclaimcounter (product_id, operation_id, claimed) VALUES (p_product_id, p_operation_id, delta)
+        ON CONFLICT (product_id, operation_id) DO UPDATE SET claimed = payroll_workclaimcounter.claimed + EXCLUDED.claimed;
+    ELSE
+        UPDATE payroll_workclaimcounter SET claimed = claimed + delta
+        WHERE product_id = p_product_id AND operation_id = p_operation_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION payroll_productoperation_touch_produced() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.operation_type IN ('incoming', 'production') THEN
+        PERFORM payroll_apply_produced_delta(OLD.product_id, -OLD.quantity);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.operation_type IN ('incoming', 'production') THEN
+        PERFORM payroll_apply_produced_delta(NEW.product_id, NEW.quantity);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION payroll_workentry_touch_claims() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM payroll_apply_claim_delta(OLD.product_id, OLD.operation_id, -OLD.quantity);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM payroll_apply_claim_delta(NEW.product_id, NEW.operation_id, NEW.quantity);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER payroll_productoperation_produced
+AFTER INSERT OR DELETE OR UPDATE OF product_id, operation_type, quantity
+ON warehouse2_productoperation
+FOR EACH ROW EXECUTE FUNCTION payroll_productoperation_touch_produced();
+
+CREATE TRIGGER payroll_workentry_claims
+AFTER INSERT OR DELETE OR UPDATE OF product_id, operation_id, quantity
+ON payroll_workentry
+FOR EACH ROW EXECUTE FUNCTION payroll_workentry_touch_claims();
+
+-- Заполняем по существующей истории
+INSERT INTO payroll_productproducedcounter (product_id, produced)
+SELECT product_id, SUM(quantity)
+FROM warehouse2_productoperation
+WHERE operation_type IN ('incoming', 'production')
+GROUP BY product_id;
+
+INSERT INTO payroll_workclaimcounter (product_id, operation_id, claimed)
+SELECT product_id, operation_id, SUM(quantity)
+FROM payroll_workentry
+WHERE product_id IS NOT NULL
+GROUP BY product_id, operation_id;
+"""
+
+DROP_WORK_COUNTERS_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS payroll_workentry_claims ON payroll_workentry;
+DROP TRIGGER IF EXISTS payroll_productoperation_produced ON warehouse2_productoperation;
+DROP FUNCTION IF EXISTS payroll_workentry_touch_claims();
+DROP FUNCTION IF EXISTS payroll_productoperation_touch_produced();
+DROP FUNCTION IF EXISTS payroll_apply_claim_delta(bigint, bigint, bigint);
+DROP FUNCTION IF EXISTS payroll_apply_produced_delta(bigint, bigint);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse2', '0009_product_last_movement_at'),
+        ('payroll', '0005_payroll_periods'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductProducedCounter',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='produced_counter', serialize=False, to='warehouse2.product', verbose_name='Товар')),
+                ('produced', models.BigIntegerField(default=0, verbose_name='Поступило, шт.')),
+            ],
+            options={
+                'verbose_name': 'Счетчик поступлений товара',
+                'verbose_name_plural': 'Счетчики поступлений товаров',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkClaimCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('claimed', models.BigIntegerField(default=0, verbose_name='Заявлено')),
+                ('operation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_counters', to='payroll.operation', verbose_name='Операция')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_claim_counters', to='warehouse2.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Счетчик заявленных работ',
+                'verbose_name_plural': 'Счетчики заявленных работ',
+                'unique_together': {('product', 'operation')},
+            },
+        ),
+        migrations.RunSQL(WORK_COUNTERS_TRIGGER_SQL, DROP_WORK_COUNTERS_TRIGGER_SQL),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+# Счетчик поступлений теперь ведут сигналы payroll (payroll/signals.py), а не триггер
+# на таблице склада: warehouse2 не должен зависеть от объектов БД чужого приложения.
+# Заявки (триггер на payroll_workentry) остаются как были.
+DROP_PRODUCED_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS payroll_productoperation_produced ON warehouse2_productoperation;
+DROP FUNCTION IF EXISTS payroll_productoperation_touch_produced();
+DROP FUNCTION IF EXISTS payroll_apply_produced_delta(bigint, bigint);
+"""
+
+CREATE_PRODUCED_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION payroll_apply_produced_delta(p_product_id bigint, delta bigint) RETURNS void AS $$
+BEGIN
+    IF p_product_id IS NULL OR delta = 0 THEN
+        RETURN;
+    ELSIF delta > 0 THEN
+        INSERT INTO payroll_productproducedcounter (product_id, produced) VALUES (p_product_id, delta)
+        ON CONFLICT (product_id) DO UPDATE SET produced = payroll_productproducedcounter.produced + EXCLUDED.produced;
+    ELSE
+        UPDATE payroll_productproducedcounter SET produced = produced + delta WHERE product_id = p_product_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION payroll_productoperation_touch_produced() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.operation_type IN ('incoming', 'production') THEN
+        PERFORM payroll_apply_produced_delta(OLD.product_id, -OLD.quantity);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.operation_type IN ('incoming', 'production') THEN
+        PERFORM payroll_apply_produced_delta(NEW.product_id, NEW.quantity);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER payroll_productoperation_produced
+AFTER INSERT OR DELETE OR UPDATE OF product_id, operation_type, quantity
+ON warehouse2_productoperation
+FOR EACH ROW EXECUTE FUNCTION payroll_productoperation_touch_produced();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0006_work_claim_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_PRODUCED_TRIGGER_SQL, CREATE_PRODUCED_TRIGGER_SQL),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from warehouse2.models import Product  # Импорт твоей модели
 
@@ -44,7 +45,63 @@ class TechCardOperation(models.Model):
         unique_together = ('group', 'operation')
 
 
-class WorkEntry(models.Model):
+class PayrollPeriod(models.Model):
+    """
+    Закрытый расчетный период. Строка создается при закрытии (payroll/servises.py):
+    работы, премии/штрафы и выплаты по end_date включительно привязываются к периоду
+    и больше не меняются, а итоги по работникам фиксируются в PayrollSnapshot.
+    Открытый период — все, что еще не привязано ни к одному закрытому.
+    """
+    start_date = models.DateField(null=True, blank=True, verbose_name="Начало (пусто — с начала учета)")
+    end_date = models.DateField(unique=True, verbose_name="Конец периода")
+    closed_at = models.DateTimeField(auto_now_add=True, verbose_name="Закрыт")
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_payroll_periods', verbose_name="Закрыл")
+
+    def __str__(self):
+        start = self.start_date.strftime('%d.%m.%Y') if self.start_date else '...'
+        return f"{start} — {self.end_date.strftime('%d.%m.%Y')}"
+
+    class Meta:
+        verbose_name = "Расчетный период"
+        verbose_name_plural = "Расчетные периоды"
+        ordering = ['-end_date']
+
+
+PERIOD_LOCKED_MESSAGE = "Запись входит в закрытый расчетный период и не может быть изменена."
+
+
+class LockedByPeriodQuerySet(models.QuerySet):
+    """
+    Массовые update()/delete() (в т.ч. "удалить выбранные" в админке) идут мимо save()/delete()
+    модели — проверяем закрытый период и здесь. Каскадное удаление по FK сюда не попадает.
+    """
+
+    def _check_period_open(self):
+        if self.filter(period__isnull=False).exists():
+            raise ValidationError(PERIOD_LOCKED_MESSAGE)
+
+    def update(self, **kwargs):
+        self._check_period_open()
+        return super().update(**kwargs)
+
+    def delete(self):
+        self._check_period_open()
+        return super().delete()
+
+
+class LockedByPeriodMixin:
+    """Записи закрытого периода нельзя менять или удалять (менеджер — LockedByPeriodQuerySet)"""
+
+    def _check_period_open(self):
+        if self.period_id is not None:
+            raise ValidationError(PERIOD_LOCKED_MESSAGE)
+
+    def delete(self, *args, **kwargs):
+        self._check_period_open()
+        return super().delete(*args, **kwargs)
+
+
+class WorkEntry(LockedByPeriodMixin, models.Model):
     """Запись о выполненной работе на проверку менеджеру"""
     worker = models.ForeignKey(User, on_delete=models.PROTECT, related_name='work_entries', verbose_name="Работник")
     operation = models.ForeignKey(Operation, on_delete=models.PROTECT, verbose_name="Операция")
@@ -63,26 +120,28 @@ class WorkEntry(models.Model):
     # Фиксация цены на момент выполнения
     final_rate = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    period = models.ForeignKey(
+        PayrollPeriod, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        related_name='work_entries', verbose_name="Расчетный период"
+    )
+
+    objects = LockedByPeriodQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Живые страницы читают только открытый период
+            models.Index(fields=['worker', 'date_performed'], condition=models.Q(period__isnull=True), name='payroll_work_open_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # 1. Сначала определяем базовую ставку из справочника операций (на всякий случай)
-        rate = self.operation.default_rate or 0
-
-        # 2. Если это сделка и привязан продукт
-        if self.operation.payment_type == 'piece' and self.product:
-            # Ищем техкарту, привязанную к этому продукту
-            if self.product.tech_card:
-                from .models import TechCardOperation # Локальный импорт во избежание циклов
-                tc_op = TechCardOperation.objects.filter(
-                    group=self.product.tech_card, 
-                    operation=self.operation
-                ).first()
-                
-                if tc_op:
-                    rate = tc_op.price
-        
-        # 3. Фиксируем итоговую ставку
-        self.final_rate = rate
+        self._check_period_open()
+        # Ставка: цена операции в техкарте товара (для сделки), иначе ставка по умолчанию.
+        # Справочники берутся из кэша в памяти процесса (см. payroll/servises.py)
+        from .servises import resolve_rate # Локальный импорт во избежание циклов
+        rate = resolve_rate(self.operation_id, self.product_id)
+
+        # Фиксируем итоговую ставку
+        self.final_rate = rate if rate is not None else 0
         
         super().save(*args, **kwargs)
 
@@ -91,7 +150,7 @@ class WorkEntry(models.Model):
         return self.quantity * self.final_rate
 
 
-class PenaltyBonus(models.Model):
+class PenaltyBonus(LockedByPeriodMixin, models.Model):
     """Система премий и штрафов"""
     TYPES = [('bonus', 'Премия'), ('penalty', 'Штраф')]
     
@@ -100,18 +159,154 @@ class PenaltyBonus(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
     reason = models.TextField(verbose_name="Причина/Комментарий")
     date = models.DateField(auto_now_add=True)
+    period = models.ForeignKey(
+        PayrollPeriod, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        related_name='penalty_bonuses', verbose_name="Расчетный период"
+    )
+
+    objects = LockedByPeriodQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self._check_period_open()
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "Премия/Штраф"
         verbose_name_plural = "Премии и штрафы"
 
 
-class Payout(models.Model):
+class Payout(LockedByPeriodMixin, models.Model):
     """Модель выдачи денег работнику"""
     worker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts', verbose_name="Работник")
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Выплаченная сумма")
     date_paid = models.DateField(auto_now_add=True, verbose_name="Дата выплаты")
     comment = models.CharField(max_length=255, blank=True, verbose_name="Комментарий (напр. Аванс)")
+    period = models.ForeignKey(
+        PayrollPeriod, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        related_name='payouts', verbose_name="Расчетный период"
+    )
+
+    objects = LockedByPeriodQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self._check_period_open()
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.worker.username} - {self.amount} ({self.date_paid})"
\ No newline at end of file
+        return f"{self.worker.username} - {self.amount} ({self.date_paid})"
+
+class PayrollLedgerEntry(models.Model):
+    """
+    Журнал начислений и выплат (только добавление).
+    Подтверждение работы, премия/штраф и выплата — по строке; удаление
+    премии или выплаты — строка-сторно с обратным знаком.
+    """
+    class Kind(models.TextChoices):
+        EARNING = 'earning', 'Начисление за работу'
+        BONUS = 'bonus', 'Премия'
+        PENALTY = 'penalty', 'Штраф'
+        PAYOUT = 'payout', 'Выплата'
+
+    worker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payroll_ledger', verbose_name="Работник")
+    kind = models.CharField(max_length=10, choices=Kind.choices, verbose_name="Тип")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+    work_entry = models.ForeignKey(WorkEntry, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries', verbose_name="Работа")
+    penalty_bonus = models.ForeignKey(PenaltyBonus, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries', verbose_name="Премия/Штраф")
+    payout = models.ForeignKey(Payout, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries', verbose_name="Выплата")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Проведено")
+
+    def __str__(self):
+        return f"{self.worker.username}: {self.get_kind_display()} {self.amount}"
+
+    class Meta:
+        verbose_name = "Проводка по зарплате"
+        verbose_name_plural = "Журнал по зарплате"
+        indexes = [models.Index(fields=['worker', 'created_at'], name='payroll_ledger_worker_idx')]
+
+
+class WorkerBalance(models.Model):
+    """
+    Итоги журнала по работнику: одна строка на работника,
+    обновляется вместе с каждой проводкой (см. payroll/servises.py).
+    """
+    worker = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='payroll_balance', verbose_name="Работник")
+    earned = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Заработано")
+    bonuses = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Премии")
+    penalties = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Штрафы")
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Выплачено")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    @property
+    def balance(self):
+        return self.earned + self.bonuses - self.penalties - self.paid
+
+    def __str__(self):
+        return f"{self.worker.username}: {self.balance}"
+
+    class Meta:
+        verbose_name = "Баланс работника"
+        verbose_name_plural = "Балансы работников"
+
+
+class PayrollSnapshot(models.Model):
+    """
+    Итоги работника за закрытый период. closing_balance переносится
+    в opening_balance следующего периода, поэтому история не пересчитывается.
+    """
+    period = models.ForeignKey(PayrollPeriod, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Период")
+    worker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payroll_snapshots', verbose_name="Работник")
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Остаток на начало")
+    earned = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Заработано")
+    bonuses = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Премии")
+    penalties = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Штрафы")
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Выплачено")
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Остаток на конец")
+
+    def __str__(self):
+        return f"{self.worker.username} ({self.period}): {self.closing_balance}"
+
+    class Meta:
+        verbose_name = "Итоги работника за период"
+        verbose_name_plural = "Итоги работников за периоды"
+        unique_together = ('period', 'worker')
+
+
+class PayrollSnapshotLine(models.Model):
+    """Заработок работника за закрытый период в разрезе операций"""
+    snapshot = models.ForeignKey(PayrollSnapshot, on_delete=models.CASCADE, related_name='lines', verbose_name="Итоги")
+    operation = models.ForeignKey(Operation, on_delete=models.PROTECT, verbose_name="Операция")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Кол-во (шт/час)")
+    earned = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Заработано")
+
+    class Meta:
+        verbose_name = "Заработок по операции"
+        verbose_name_plural = "Заработок по операциям"
+        unique_together = ('snapshot', 'operation')
+
+
+class ProductProducedCounter(models.Model):
+    """
+    Сколько товара поступило на склад (поступление + производство) за всю историю.
+    Ведется сигналами payroll на журнале операций склада (payroll/signals.py), читается проверкой работ.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='produced_counter', verbose_name="Товар")
+    produced = models.BigIntegerField(default=0, verbose_name="Поступило, шт.")
+
+    class Meta:
+        verbose_name = "Счетчик поступлений товара"
+        verbose_name_plural = "Счетчики поступлений товаров"
+
+
+class WorkClaimCounter(models.Model):
+    """
+    Сколько заявлено работы по операции над товаром (все заявки, включая неподтвержденные).
+    Ведется триггером на WorkEntry (миграция 0006).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='work_claim_counters', verbose_name="Товар")
+    operation = models.ForeignKey(Operation, on_delete=models.CASCADE, related_name='claim_counters', verbose_name="Операция")
+    claimed = models.BigIntegerField(default=0, verbose_name="Заявлено")
+
+    class Meta:
+        verbose_name = "Счетчик заявленных работ"
+        verbose_name_plural = "Счетчики заявленных работ"
+        unique_together = ('product', 'operation')
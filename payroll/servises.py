@@ -0,0 +1,556 @@
+"""
+Ставки сдельной оплаты и массовый ввод выполненных работ.
+
+Ставка зависит от операции и техкарты товара. Чтобы ввод работ бригадой
+в конце смены не делал по несколько запросов на каждую запись, справочные
+данные кэшируются в памяти процесса:
+    товар -> техкарта, операция -> (тип оплаты, ставка по умолчанию),
+    (техкарта, операция) -> цена в техкарте.
+Кэш сбрасывается сигналами (см. payroll/signals.py) и, на случай изменений,
+сделанных другим процессом, живет не дольше PAYROLL_RATE_CACHE_SECONDS.
+"""
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Sum, Q, F
+from django.utils import timezone
+from warehouse2.models import Product, ProductOperation
+from .models import (
+    Operation, TechCardOperation, WorkEntry, PenaltyBonus, Payout, PayrollLedgerEntry, WorkerBalance,
+    PayrollPeriod, PayrollSnapshot, PayrollSnapshotLine, ProductProducedCounter, WorkClaimCounter,
+)
+
+_MISSING = object()
+
+# Кэш общий для потоков процесса (waitress): любые чтения и правки — под _cache_lock.
+# generation растет при каждом сбросе: то, что догружено запросом, начатым до сброса,
+# в кэш уже не кладется (иначе старая цена вернулась бы в кэш до конца TTL).
+_cache_lock = threading.Lock()
+_cache = {
+    'created_at': 0.0,
+    'generation': 0,
+    'products': {},    # product_id -> tech_card_id
+    'operations': {},  # operation_id -> (payment_type, default_rate)
+    'prices': {},      # (tech_card_id, operation_id) -> price | None
+}
+
+
+def _empty_rate_data():
+    return {'products': {}, 'operations': {}, 'prices': {}}
+
+
+def _reset_cache():
+    _cache.update(_empty_rate_data())
+    _cache['generation'] += 1
+    _cache['created_at'] = time.monotonic()
+
+
+def _fresh_cache():
+    """Кэш с проверкой TTL; вызывать под _cache_lock."""
+    ttl = getattr(settings, 'PAYROLL_RATE_CACHE_SECONDS', 60)
+    if time.monotonic() - _cache['created_at'] > ttl:
+        _reset_cache()
+    return _cache
+
+
+def clear_rate_cache():
+    with _cache_lock:
+        _reset_cache()
+
+
+def invalidate_operation(operation_id):
+    with _cache_lock:
+        _cache['generation'] += 1
+        _cache['operations'].pop(operation_id, None)
+        _cache['prices'] = {key: price for key, price in _cache['prices'].items() if key[1] != operation_id}
+
+
+def invalidate_tech_card_prices():
+    with _cache_lock:
+        _cache['generation'] += 1
+        _cache['prices'] = {}
+
+
+def invalidate_products(product_ids=None):
+    """Сброс привязки товар -> техкарта (None — для всех товаров)."""
+    with _cache_lock:
+        _cache['generation'] += 1
+        if product_ids is None:
+            _cache['products'] = {}
+            return
+        for product_id in product_ids:
+            _cache['products'].pop(int(product_id), None)
+
+
+def _cached_rate(cache, operation_id, product_id):
+    """Ставка из кэша или _MISSING, если каких-то данных в кэше нет."""
+    operation = cache['operations'].get(operation_id)
+    if operation is None:
+        return _MISSING
+    payment_type, default_rate = operation
+    rate = default_rate or Decimal('0')
+    if product_id is None:
+        return rate
+    # Товар проверяем и для почасовых операций: заодно это проверка, что он существует
+    tech_card_id = cache['products'].get(product_id, _MISSING)
+    if tech_card_id is _MISSING:
+        return _MISSING
+    if payment_type != 'piece' or tech_card_id is None:
+        return rate
+    price = cache['prices'].get((tech_card_id, operation_id), _MISSING)
+    if price is _MISSING:
+        return _MISSING
+    return rate if price is None else price
+
+
+def _load(pairs):
+    """Все данные для пар (операция, товар) одним запросом — в виде отдельного кусочка кэша."""
+    data = _empty_rate_data()
+    operation_ids = [operation_id for operation_id, _ in pairs]
+    product_ids = [product_id for _, product_id in pairs]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT o.id, o.payment_type, o.default_rate, p.id, p.tech_card_id, tco.price
+            FROM unnest(%s::bigint[], %s::bigint[]) AS v(operation_id, product_id)
+            JOIN {Operation._meta.db_table} o ON o.id = v.operation_id
+            LEFT JOIN {Product._meta.db_table} p ON p.id = v.product_id
+            LEFT JOIN {TechCardOperation._meta.db_table} tco
+                ON tco.group_id = p.tech_card_id AND tco.operation_id = o.id
+            """,
+            [operation_ids, product_ids],
+        )
+        for operation_id, payment_type, default_rate, product_id, tech_card_id, price in cursor.fetchall():
+            data['operations'][operation_id] = (payment_type, default_rate)
+            if product_id is not None:
+                data['products'][product_id] = tech_card_id
+                if tech_card_id is not None:
+                    data['prices'][(tech_card_id, operation_id)] = price
+    return data
+
+
+def resolve_rates(pairs):
+    """
+    Ставки для набора пар (operation_id, product_id): {пара: ставка}.
+    Всё, чего нет в кэше, догружается одним запросом на весь набор.
+    Пары с несуществующей операцией или товаром в результат не попадают.
+    """
+    rates = {}
+    missing = []
+    with _cache_lock:
+        cache = _fresh_cache()
+        generation = cache['generation']
+        for pair in set(pairs):
+            rate = _cached_rate(cache, *pair)
+            if rate is _MISSING:
+                missing.append(pair)
+            else:
+                rates[pair] = rate
+    if missing:
+        # Запрос — без блокировки; в загруженном есть все нужное для недостающих пар
+        loaded = _load(missing)
+        for pair in missing:
+            rate = _cached_rate(loaded, *pair)
+            if rate is not _MISSING:
+                rates[pair] = rate
+        with _cache_lock:
+            if _cache['generation'] == generation:
+                for key in ('products', 'operations', 'prices'):
+                    _cache[key].update(loaded[key])
+    return rates
+
+
+def resolve_rate(operation_id, product_id=None):
+    """Ставка для одной записи (та же логика, что и в resolve_rates)."""
+    return resolve_rates([(operation_id, product_id)]).get((operation_id, product_id))
+
+
+class WorkEntryBatchError(ValueError):
+    """Ошибки в пакете записей: {индекс записи: текст ошибки}."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"#{index}: {text}" for index, text in errors.items()))
+
+
+def _parse_entry(raw, default_worker_id):
+    worker_id = int(raw.get('worker_id') or default_worker_id)
+    operation_id = int(raw['operation_id'])
+    product_id = int(raw['product_id']) if raw.get('product_id') not in (None, '') else None
+    quantity = int(raw['quantity'])
+    date_performed = date.fromisoformat(raw['date_performed']) if raw.get('date_performed') else timezone.localdate()
+    return worker_id, operation_id, product_id, quantity, date_performed
+
+
+def bulk_create_work_entries(entries, user):
+    """
+    Массовый ввод выполненных работ (бригада в конце смены).
+
+    entries — список {'worker_id', 'operation_id', 'product_id', 'quantity', 'date_performed'}.
+    Работник без прав персонала может подавать записи только за себя.
+    Ставки — через resolve_rates (один запрос на пакет), вставка — одним bulk_create.
+    Если хоть одна запись некорректна, не создается ничего (WorkEntryBatchError).
+    """
+    errors = {}
+    parsed = []
+    for index, raw in enumerate(entries):
+        try:
+            parsed.append((index, *_parse_entry(raw, user.pk)))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            errors[index] = "Некорректная запись"
+
+    worker_ids = {row[1] for row in parsed}
+    known_workers = set(User.objects.filter(pk__in=worker_ids).values_list('pk', flat=True))
+    rates = resolve_rates([(row[2], row[3]) for row in parsed])
+
+    # Для текста ошибки: какие из операций без ставки вообще существуют
+    unresolved = {row[2] for row in parsed if (row[2], row[3]) not in rates}
+    known_operations = set(Operation.objects.filter(pk__in=unresolved).values_list('pk', flat=True)) if unresolved else set()
+
+    work_entries = []
+    for index, worker_id, operation_id, product_id, quantity, date_performed in parsed:
+        if worker_id != user.pk and not user.is_staff:
+            errors[index] = "Можно подавать записи только за себя"
+        elif worker_id not in known_workers:
+            errors[index] = "Работник не найден"
+        elif (operation_id, product_id) not in rates:
+            errors[index] = "Товар не найден" if operation_id in known_operations else "Операция не найдена"
+        elif quantity <= 0:
+            errors[index] = "Количество должно быть > 0"
+        else:
+            work_entries.append(WorkEntry(
+                worker_id=worker_id,
+                operation_id=operation_id,
+                product_id=product_id,
+                quantity=quantity,
+                date_performed=date_performed,
+                final_rate=rates[(operation_id, product_id)],
+            ))
+
+    if errors:
+        raise WorkEntryBatchError(dict(sorted(errors.items())))
+
+    with transaction.atomic():
+        return WorkEntry.objects.bulk_create(work_entries)
+
+
+
+# ==============================================================================
+# Журнал по зарплате и балансы работников
+# ==============================================================================
+
+# Какую колонку WorkerBalance меняет проводка каждого типа
+BALANCE_FIELDS = {
+    PayrollLedgerEntry.Kind.EARNING: 'earned',
+    PayrollLedgerEntry.Kind.BONUS: 'bonuses',
+    PayrollLedgerEntry.Kind.PENALTY: 'penalties',
+    PayrollLedgerEntry.Kind.PAYOUT: 'paid',
+}
+
+_BALANCE_COLUMNS = ('earned', 'bonuses', 'penalties', 'paid')
+
+
+def post_ledger_entries(entries):
+    """
+    Проводит строки журнала и одним UPSERT сдвигает балансы затронутых работников.
+    Вызывать внутри транзакции вместе с изменением источника (работы, выплаты...).
+    """
+    entries = [entry for entry in entries if entry.amount]
+    if not entries:
+        return []
+
+    deltas = {}
+    for entry in entries:
+        row = deltas.setdefault(entry.worker_id, dict.fromkeys(_BALANCE_COLUMNS, Decimal('0')))
+        row[BALANCE_FIELDS[entry.kind]] += entry.amount
+
+    worker_ids = sorted(deltas)
+    with transaction.atomic():
+        PayrollLedgerEntry.objects.bulk_create(entries)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {WorkerBalance._meta.db_table} (worker_id, earned, bonuses, penalties, paid, updated_at)
+                SELECT v.*, now()
+                FROM unnest(%s::integer[], %s::numeric[], %s::numeric[], %s::numeric[], %s::numeric[])
+                    AS v(worker_id, earned, bonuses, penalties, paid)
+                ON CONFLICT (worker_id) DO UPDATE SET
+                    earned = {WorkerBalance._meta.db_table}.earned + EXCLUDED.earned,
+                    bonuses = {WorkerBalance._meta.db_table}.bonuses + EXCLUDED.bonuses,
+                    penalties = {WorkerBalance._meta.db_table}.penalties + EXCLUDED.penalties,
+                    paid = {WorkerBalance._meta.db_table}.paid + EXCLUDED.paid,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                [worker_ids] + [[deltas[pk][column] for pk in worker_ids] for column in _BALANCE_COLUMNS],
+            )
+    return entries
+
+
+def repost_source(source_field, instance, target):
+    """
+    Приводит проводки по источнику (work_entry / penalty_bonus / payout) к нужному итогу.
+    target — (worker_id, kind, amount) или None (источник удален / не должен учитываться).
+    Журнал не правится: разница проводится новыми строками (сторно + новая сумма).
+    """
+    posted = {
+        (row['worker_id'], row['kind']): row['total']
+        for row in PayrollLedgerEntry.objects.filter(**{source_field: instance})
+        .values('worker_id', 'kind').annotate(total=Sum('amount')).filter(~Q(total=0))
+    }
+    wanted = {} if target is None else {(target[0], target[1]): target[2]}
+
+    entries = []
+    for worker_id, kind in set(posted) | set(wanted):
+        delta = wanted.get((worker_id, kind), 0) - posted.get((worker_id, kind), 0)
+        if delta:
+            entries.append(PayrollLedgerEntry(
+                worker_id=worker_id, kind=kind, amount=delta,
+                **{source_field: instance if target is not None else None},
+            ))
+    return post_ledger_entries(entries)
+
+
+def verify_work_entries(entry_ids, verified_by):
+    """Подтверждает работы и проводит начисления по ним. Возвращает число подтвержденных."""
+    with transaction.atomic():
+        entries = list(
+            WorkEntry.objects.select_for_update()
+            .filter(pk__in=entry_ids, is_verified=False)
+            .only('id', 'worker_id', 'quantity', 'final_rate')
+        )
+        if not entries:
+            return 0
+        WorkEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            is_verified=True, verified_by=verified_by
+        )
+        post_ledger_entries([
+            PayrollLedgerEntry(
+                worker_id=entry.worker_id, kind=PayrollLedgerEntry.Kind.EARNING,
+                amount=entry.quantity * entry.final_rate, work_entry=entry,
+            )
+            for entry in entries
+        ])
+    return len(entries)
+
+
+_LEDGER = PayrollLedgerEntry._meta.db_table
+_BALANCE = WorkerBalance._meta.db_table
+
+# Сверка журнала с источниками. Журнал только дополняется: по каждой паре
+# (источник, работник, тип) проводим разницу между тем, что должно быть, и тем,
+# что уже проведено (для удаленных источников должно быть 0). Балансы — производные
+# от журнала итоги, их просто пересчитываем.
+LEDGER_CORRECTIONS_SQL = [
+    # Пока идет сверка, новые проводки ждут (иначе их разница посчиталась бы дважды)
+    f"LOCK TABLE {_LEDGER}, {_BALANCE} IN EXCLUSIVE MODE",
+    f"""
+    INSERT INTO {_LEDGER} (worker_id, kind, amount, work_entry_id, penalty_bonus_id, payout_id, created_at)
+    SELECT worker_id, kind, SUM(amount), work_entry_id, penalty_bonus_id, payout_id, now()
+    FROM (
+        SELECT worker_id, 'earning' AS kind, quantity * final_rate AS amount,
+               id AS work_entry_id, NULL::bigint AS penalty_bonus_id, NULL::bigint AS payout_id
+        FROM {WorkEntry._meta.db_table} WHERE is_verified
+        UNION ALL
+        SELECT worker_id, type, amount, NULL, id, NULL FROM {PenaltyBonus._meta.db_table}
+        UNION ALL
+        SELECT worker_id, 'payout', amount, NULL, NULL, id FROM {Payout._meta.db_table}
+        UNION ALL
+        SELECT worker_id, kind, -amount, work_entry_id, penalty_bonus_id, payout_id FROM {_LEDGER}
+    ) AS diff
+    GROUP BY worker_id, kind, work_entry_id, penalty_bonus_id, payout_id
+    HAVING SUM(amount) <> 0
+    """,
+]
+
+REBUILD_BALANCES_SQL = [
+    f"""
+    UPDATE {_BALANCE} SET earned = 0, bonuses = 0, penalties = 0, paid = 0, updated_at = now()
+    WHERE worker_id NOT IN (SELECT worker_id FROM {_LEDGER})
+    """,
+    f"""
+    INSERT INTO {_BALANCE} (worker_id, earned, bonuses, penalties, paid, updated_at)
+    SELECT worker_id,
+           COALESCE(SUM(amount) FILTER (WHERE kind = 'earning'), 0),
+           COALESCE(SUM(amount) FILTER (WHERE kind = 'bonus'), 0),
+           COALESCE(SUM(amount) FILTER (WHERE kind = 'penalty'), 0),
+           COALESCE(SUM(amount) FILTER (WHERE kind = 'payout'), 0),
+           now()
+    FROM {_LEDGER}
+    GROUP BY worker_id
+    ON CONFLICT (worker_id) DO UPDATE SET
+        earned = EXCLUDED.earned, bonuses = EXCLUDED.bonuses, penalties = EXCLUDED.penalties,
+        paid = EXCLUDED.paid, updated_at = EXCLUDED.updated_at
+    """,
+]
+
+
+# Операции склада, которые считаются поступлением товара для проверки работ
+PRODUCED_OPERATION_TYPES = (ProductOperation.OperationType.INCOMING, ProductOperation.OperationType.PRODUCTION)
+
+
+def produced_contribution(product_id, operation_type, quantity):
+    """Вклад операции склада в счетчик поступлений: (product_id, количество) или None."""
+    if product_id is None or operation_type not in PRODUCED_OPERATION_TYPES:
+        return None
+    return product_id, quantity
+
+
+def apply_produced_delta(product_id, delta):
+    """
+    Сдвигает счетчик поступлений товара (вызывается сигналами payroll/signals.py
+    в транзакции записи операции). Прибавка — UPSERT, убыль — только UPDATE.
+    """
+    if not delta:
+        return
+    if delta < 0:
+        ProductProducedCounter.objects.filter(product_id=product_id).update(produced=F('produced') + delta)
+        return
+    table = ProductProducedCounter._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (product_id, produced) VALUES (%s, %s) "
+            f"ON CONFLICT (product_id) DO UPDATE SET produced = {table}.produced + EXCLUDED.produced",
+            [product_id, delta],
+        )
+
+
+RECOUNT_WORK_COUNTERS_SQL = [
+    # Счетчики для проверки работ: поступления ведутся сигналами на ProductOperation,
+    # заявки — триггером на WorkEntry (миграция payroll/0006). Массовые правки журнала склада
+    # через QuerySet.update()/delete() сигналов не шлют — после них нужен этот пересчет.
+    f"LOCK TABLE {ProductProducedCounter._meta.db_table}, {WorkClaimCounter._meta.db_table} IN EXCLUSIVE MODE",
+    f"DELETE FROM {ProductProducedCounter._meta.db_table}",
+    f"DELETE FROM {WorkClaimCounter._meta.db_table}",
+    f"""
+    INSERT INTO {ProductProducedCounter._meta.db_table} (product_id, produced)
+    SELECT product_id, SUM(quantity) FROM {ProductOperation._meta.db_table}
+    WHERE operation_type IN ('incoming', 'production')
+    GROUP BY product_id
+    """,
+    f"""
+    INSERT INTO {WorkClaimCounter._meta.db_table} (product_id, operation_id, claimed)
+    SELECT product_id, operation_id, SUM(quantity) FROM {WorkEntry._meta.db_table}
+    WHERE product_id IS NOT NULL
+    GROUP BY product_id, operation_id
+    """,
+]
+
+
+def recount_work_counters():
+    """Пересчет счетчиков поступлений и заявленных работ с нуля. Возвращает число пар товар-операция."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in RECOUNT_WORK_COUNTERS_SQL:
+            cursor.execute(sql)
+        return cursor.rowcount
+
+
+def rebuild_payroll_ledger():
+    """
+    Сверяет журнал с работами, премиями/штрафами и выплатами: расхождения проводятся
+    исправляющими строками (старые строки не удаляются), балансы пересчитываются из журнала.
+    Возвращает число исправляющих проводок.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in LEDGER_CORRECTIONS_SQL:
+            cursor.execute(sql)
+        corrections = cursor.rowcount
+        for sql in REBUILD_BALANCES_SQL:
+            cursor.execute(sql)
+        return corrections
+
+
+# ==============================================================================
+# Закрытие расчетных периодов
+# ==============================================================================
+
+class PayrollPeriodError(ValueError):
+    """Период нельзя закрыть (пересечение с закрытым, неподтвержденные работы...)"""
+
+
+_WORK = WorkEntry._meta.db_table
+_PENALTY_BONUS = PenaltyBonus._meta.db_table
+_PAYOUT = Payout._meta.db_table
+_SNAPSHOT = PayrollSnapshot._meta.db_table
+_SNAPSHOT_LINE = PayrollSnapshotLine._meta.db_table
+
+CLOSE_PERIOD_SQL = [
+    # Привязываем к периоду все, что еще не закрыто и не позже его конца
+    # (в т.ч. работы прошлых дат, подтвержденные уже после закрытия прошлого периода)
+    f"""
+    UPDATE {_WORK} SET period_id = %(period)s
+    WHERE period_id IS NULL AND is_verified AND date_performed <= %(end_date)s
+    """,
+    f"UPDATE {_PENALTY_BONUS} SET period_id = %(period)s WHERE period_id IS NULL AND date <= %(end_date)s",
+    f"UPDATE {_PAYOUT} SET period_id = %(period)s WHERE period_id IS NULL AND date_paid <= %(end_date)s",
+    # Итоги по работникам; остаток прошлого периода переносится, даже если движений не было
+    f"""
+    INSERT INTO {_SNAPSHOT} (period_id, worker_id, opening_balance, earned, bonuses, penalties, paid, closing_balance)
+    SELECT %(period)s, worker_id, opening, earned, bonuses, penalties, paid,
+           opening + earned + bonuses - penalties - paid
+    FROM (
+        SELECT worker_id, SUM(opening) AS opening, SUM(earned) AS earned, SUM(bonuses) AS bonuses,
+               SUM(penalties) AS penalties, SUM(paid) AS paid
+        FROM (
+            SELECT worker_id, 0 AS opening, quantity * final_rate AS earned, 0 AS bonuses, 0 AS penalties, 0 AS paid
+            FROM {_WORK} WHERE period_id = %(period)s
+            UNION ALL
+            SELECT worker_id, 0, 0,
+                   CASE WHEN type = 'bonus' THEN amount ELSE 0 END,
+                   CASE WHEN type = 'penalty' THEN amount ELSE 0 END, 0
+            FROM {_PENALTY_BONUS} WHERE period_id = %(period)s
+            UNION ALL
+            SELECT worker_id, 0, 0, 0, 0, amount FROM {_PAYOUT} WHERE period_id = %(period)s
+            UNION ALL
+            SELECT worker_id, closing_balance, 0, 0, 0, 0 FROM {_SNAPSHOT} WHERE period_id = %(previous)s
+        ) AS movements
+        GROUP BY worker_id
+    ) AS totals
+    """,
+    # Заработок в разрезе операций
+    f"""
+    INSERT INTO {_SNAPSHOT_LINE} (snapshot_id, operation_id, quantity, earned)
+    SELECT s.id, w.operation_id, SUM(w.quantity), SUM(w.quantity * w.final_rate)
+    FROM {_WORK} w
+    JOIN {_SNAPSHOT} s ON s.period_id = w.period_id AND s.worker_id = w.worker_id
+    WHERE w.period_id = %(period)s
+    GROUP BY s.id, w.operation_id
+    """,
+]
+
+
+def close_payroll_period(end_date, user):
+    """
+    Закрывает расчетный период по end_date включительно: привязывает к нему
+    подтвержденные работы, премии/штрафы и выплаты (после этого они не меняются)
+    и записывает итоги по работникам в PayrollSnapshot / PayrollSnapshotLine.
+    """
+    if end_date > timezone.localdate():
+        raise PayrollPeriodError("Нельзя закрыть период, который еще не закончился")
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Два закрытия одновременно не должны поделить записи между собой
+            cursor.execute(f"LOCK TABLE {PayrollPeriod._meta.db_table} IN EXCLUSIVE MODE")
+
+        previous = PayrollPeriod.objects.order_by('-end_date').first()
+        if previous and end_date <= previous.end_date:
+            raise PayrollPeriodError(f"Период по {previous.end_date:%d.%m.%Y} уже закрыт")
+
+        pending = WorkEntry.objects.filter(is_verified=False, date_performed__lte=end_date).count()
+        if pending:
+            raise PayrollPeriodError(f"Есть неподтвержденные работы за период: {pending}")
+
+        period = PayrollPeriod.objects.create(
+            start_date=previous.end_date + timedelta(days=1) if previous else None,
+            end_date=end_date,
+            closed_by=user,
+        )
+        params = {'period': period.pk, 'previous': previous.pk if previous else None, 'end_date': end_date}
+        with connection.cursor() as cursor:
+            for sql in CLOSE_PERIOD_SQL:
+                cursor.execute(sql, params)
+    return period
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from warehouse2.models import Product, ProductOperation
+from .models import (
+    Operation, TechCardGroup, TechCardOperation, WorkEntry, PenaltyBonus, Payout, PayrollLedgerEntry,
+)
+from . import servises
+
+
+# Сброс кэша ставок (payroll/servises.py) при изменении справочников.
+# Сбрасываем сразу (наша транзакция видит новые данные) и еще раз после коммита:
+# другие потоки до коммита читают старые строки и могли успеть вернуть их в кэш.
+
+def _invalidate(func, *args):
+    func(*args)
+    transaction.on_commit(lambda: func(*args))
+
+
+@receiver([post_save, post_delete], sender=Operation)
+def invalidate_operation_rate(sender, instance, **kwargs):
+    _invalidate(servises.invalidate_operation, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=TechCardOperation)
+def invalidate_tech_card_prices(sender, instance, **kwargs):
+    # Строку техкарты могли перевесить на другую операцию — сбрасываем все цены
+    _invalidate(servises.invalidate_tech_card_prices)
+
+
+@receiver(post_delete, sender=TechCardGroup)
+def invalidate_deleted_tech_card(sender, instance, **kwargs):
+    # Товары отвязываются от удаленной техкарты через SET NULL без сигналов
+    _invalidate(servises.invalidate_products)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_tech_card(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or 'tech_card' in update_fields:
+        _invalidate(servises.invalidate_products, [instance.pk])
+
+
+# Счетчик поступлений товара для проверки работ (ProductProducedCounter).
+# Ведем из своего приложения, а не триггером на таблице склада. При правке операции
+# старый вклад читаем в pre_save (один запрос, только для уже существующей строки).
+
+@receiver(pre_save, sender=ProductOperation)
+def remember_produced_contribution(sender, instance, **kwargs):
+    instance._produced_before = None
+    if instance.pk is not None:
+        old = ProductOperation.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'operation_type', 'quantity'
+        ).first()
+        if old:
+            instance._produced_before = servises.produced_contribution(*old)
+
+
+@receiver(post_save, sender=ProductOperation)
+def count_produced(sender, instance, **kwargs):
+    before = getattr(instance, '_produced_before', None)
+    if before:
+        servises.apply_produced_delta(before[0], -before[1])
+    after = servises.produced_contribution(instance.product_id, instance.operation_type, instance.quantity)
+    if after:
+        servises.apply_produced_delta(*after)
+
+
+@receiver(post_delete, sender=ProductOperation)
+def uncount_produced(sender, instance, **kwargs):
+    contribution = servises.produced_contribution(instance.product_id, instance.operation_type, instance.quantity)
+    if contribution:
+        servises.apply_produced_delta(contribution[0], -contribution[1])
+
+
+# Журнал по зарплате: выплаты, премии/штрафы и правки уже подтвержденных работ.
+# Подтверждение работ идет через servises.verify_work_entries (массовый update без сигналов).
+# Удаление ловим в pre_delete: после него ссылки журнала на источник уже обнулены.
+
+@receiver(post_save, sender=Payout)
+def post_payout(sender, instance, **kwargs):
+    servises.repost_source('payout', instance, (instance.worker_id, PayrollLedgerEntry.Kind.PAYOUT, instance.amount))
+
+
+@receiver(pre_delete, sender=Payout)
+def reverse_payout(sender, instance, **kwargs):
+    servises.repost_source('payout', instance, None)
+
+
+@receiver(post_save, sender=PenaltyBonus)
+def post_penalty_bonus(sender, instance, **kwargs):
+    servises.repost_source('penalty_bonus', instance, (instance.worker_id, instance.type, instance.amount))
+
+
+@receiver(pre_delete, sender=PenaltyBonus)
+def reverse_penalty_bonus(sender, instance, **kwargs):
+    servises.repost_source('penalty_bonus', instance, None)
+
+
+@receiver(post_save, sender=WorkEntry)
+def repost_work_entry(sender, instance, created, **kwargs):
+    if created and not instance.is_verified:
+        return  # новая заявка попадет в журнал при подтверждении
+    target = None
+    if instance.is_verified:
+        target = (instance.worker_id, PayrollLedgerEntry.Kind.EARNING, instance.total_sum)
+    servises.repost_source('work_entry', instance, target)
+
+
+@receiver(pre_delete, sender=WorkEntry)
+def reverse_work_entry(sender, instance, **kwargs):
+    if instance.is_verified:
+        servises.repost_source('work_entry', instance, None)
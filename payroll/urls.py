@@ -18,6 +18,7 @@ urlpatterns = [
     path('my-work-enteries/', views.MyWorkEntriesListView.as_view(), name='my_work_entries'),
     # API для JS
     path('api/get-operations/', views.get_operations_for_product, name='api_get_operations'),
+    path('api/work-entries/bulk/', views.bulk_work_entries_api, name='api_bulk_work_entries'),
     # Кабинет менеджера
     path('verify/', views.WorkVerificationListView.as_view(), name='verify_work_list'),
     path('verify/reject/<int:pk>/', views.reject_work_entry, name='reject_work_entry'),
@@ -25,4 +26,6 @@ urlpatterns = [
     # бухгалтерия
     path('accounting/', views.AccountantDashboardView.as_view(), name='accountant_dashboard'),
     path('accounting/worker/<int:worker_id>/', views.WorkerPayrollDetailView.as_view(), name='worker_payroll_detail'),
+    path('accounting/periods/', views.PayrollPeriodListView.as_view(), name='payroll_period_list'),
+    path('accounting/periods/<int:pk>/', views.PayrollPeriodDetailView.as_view(), name='payroll_period_detail'),
 ]
\ No newline at end of file
@@ -1,17 +1,28 @@
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
-from .models import Operation, TechCardGroup, TechCardOperation, WorkEntry, Payout, PenaltyBonus, User
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, DetailView
+from .models import (
+    Operation, TechCardGroup, TechCardOperation, WorkEntry, Payout, PenaltyBonus, User, WorkerBalance, PayrollPeriod, PayrollSnapshot,
+    ProductProducedCounter, WorkClaimCounter,
+)
 from .forms import OperationForm, TechCardGroupForm, HourlyWorkForm, PieceWorkForm, TechCardOperationFormSet
 from django.db import transaction
 from django.contrib import messages
-from warehouse2.models import Product, ProductCategory, ProductOperation
+from warehouse2.models import Product, ProductCategory
 from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect, get_object_or_404
-from django.db.models import Sum, F, Q, DecimalField
+from django.db.models import F, Q, DecimalField, Value, OuterRef, Subquery, Case, When, BooleanField
 from django.contrib.auth.models import User
 from django.db.models.functions import Coalesce
 from django.contrib.auth.decorators import login_required
+from warehouse.db_router import ReplicaReadMixin
+from django.views.decorators.http import require_POST
+from .servises import (
+    invalidate_products, bulk_create_work_entries, WorkEntryBatchError, verify_work_entries,
+    close_payroll_period, PayrollPeriodError,
+)
+from datetime import date
+import json
 
 #===============================================
 # Операции CRUD для Operation
@@ -146,6 +157,8 @@ class BulkAssignTechCardView(ListView):
 
         # Массовое обновление
         count = Product.objects.filter(id__in=product_ids).update(tech_card_id=tech_card_id)
+        # update() не шлет сигналов — сбрасываем кэш ставок для этих товаров сами
+        invalidate_products(product_ids)
         messages.success(request, f"Техкарта назначена для {count} товаров.")
         
         # Возвращаемся на ту же страницу с теми же фильтрами
@@ -190,6 +203,34 @@ def get_operations_for_product(request):
     return JsonResponse(data, safe=False)
 
 
+@login_required
+@require_POST
+def bulk_work_entries_api(request):
+    """
+    Массовая подача выполненных работ (бригада в конце смены).
+    Принимает JSON: {'entries': [{'worker_id': 1, 'operation_id': 2, 'product_id': 3,
+                                  'quantity': 10, 'date_performed': '2025-01-31'}, ...]}
+    worker_id можно не указывать — запись будет за текущего пользователя.
+    """
+    try:
+        entries = json.loads(request.body).get('entries')
+    except (ValueError, AttributeError):
+        entries = None
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({'success': False, 'message': 'Ожидается непустой список entries'}, status=400)
+
+    try:
+        created = bulk_create_work_entries(entries, request.user)
+    except WorkEntryBatchError as e:
+        return JsonResponse({'success': False, 'message': 'Записи не сохранены', 'errors': e.errors}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Подано записей: {len(created)}',
+        'entries': [{'id': entry.pk, 'final_rate': str(entry.final_rate)} for entry in created],
+    })
+
+
 class MyWorkEntriesListView(LoginRequiredMixin, ListView):
     model = WorkEntry
     template_name = 'payroll/my_work_entries.html'
@@ -220,67 +261,42 @@ class WorkVerificationListView(LoginRequiredMixin, ListView):
     context_object_name = 'entries'
 
     def get_queryset(self):
-        # Исправлено: order_by вместо order_name
-        return WorkEntry.objects.filter(is_verified=False).select_related(
+        # Сколько поступило товара и сколько по нему заявлено работы — из счетчиков
+        # (ведутся триггерами, миграция payroll/0006): два поиска по ключу на строку
+        produced = ProductProducedCounter.objects.filter(product_id=OuterRef('product_id')).values('produced')
+        claimed = WorkClaimCounter.objects.filter(
+            product_id=OuterRef('product_id'), operation_id=OuterRef('operation_id')
+        ).values('claimed')
+        queryset = WorkEntry.objects.filter(is_verified=False).select_related(
             'worker', 'operation', 'product'
-        ).order_by('-created_at')
+        ).annotate(
+            warehouse_limit=Coalesce(Subquery(produced), 0),
+            # Все заявки по этой операции над этим товаром (и подтвержденные, и в очереди)
+            total_submitted=Coalesce(Subquery(claimed), 0),
+        ).annotate(
+            # ОПАСНО: если общая сумма всех заявок (даже не подтвержденных) > склада
+            is_suspicious=Case(
+                When(product__isnull=False, total_submitted__gt=F('warehouse_limit'), then=Value(True)),
+                default=Value(False), output_field=BooleanField(),
+            ),
+        )
+        if self.request.GET.get('suspicious'):
+            queryset = queryset.filter(is_suspicious=True)
+        return queryset.order_by('-created_at')
     
     def post(self, request, *args, **kwargs):
         # Получаем список ID из чекбоксов
         entry_ids = request.POST.getlist('selected_entries')
         if entry_ids:
-            WorkEntry.objects.filter(id__in=entry_ids).update(
-                is_verified=True, 
-                verified_by=request.user
-            )
-            # Добавляем уведомление (не забудьте import messages в начале файла)
-            from django.contrib import messages
-            messages.success(request, f"Успешно подтверждено записей: {len(entry_ids)}")
+            # Подтверждение + начисление в журнал по зарплате (одна транзакция)
+            verified = verify_work_entries(entry_ids, request.user)
+            messages.success(request, f"Успешно подтверждено записей: {verified}")
         
         return redirect('verify_work_list')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        entries = context['entries']
-        if not entries: return context
-
-        product_ids = list(entries.values_list('product_id', flat=True).distinct())
-        product_ids = [p for p in product_ids if p is not None]
-        
-        # 1. Склад (как было)
-        warehouse_stock = ProductOperation.objects.filter(
-            product_id__in=product_ids,
-            operation_type__in=['incoming', 'production']
-        ).values('product_id').annotate(total=Coalesce(Sum('quantity'), 0))
-        warehouse_map = {item['product_id']: item['total'] for item in warehouse_stock}
-
-        # 2. Считаем ВООБЩЕ ВСЕ записи (и подтвержденные, и те, что в очереди)
-        all_work_sums = WorkEntry.objects.filter(
-            product_id__in=product_ids
-        ).values('product_id', 'operation_id').annotate(
-            total_sum=Coalesce(Sum('quantity'), 0)
-        )
-        
-        # Карта всех существующих заявок в БД
-        total_existing_map = {f"{item['product_id']}-{item['operation_id']}": item['total_sum'] for item in all_work_sums}
-
-        # 3. Пришиваем данные
-        for entry in entries:
-            if entry.product_id:
-                limit = warehouse_map.get(entry.product_id, 0)
-                key = f"{entry.product_id}-{entry.operation_id}"
-                
-                # Общая сумма этой операции по этому товару в базе
-                total_in_db = total_existing_map.get(key, 0)
-                
-                entry.warehouse_limit = limit
-                # Для наглядности менеджеру:
-                entry.total_submitted = total_in_db 
-                
-                # ОПАСНО: если общая сумма всех заявок (даже не подтвержденных) > склада
-                entry.is_suspicious = total_in_db > limit
-            else:
-                entry.is_suspicious = False
+        context['only_suspicious'] = bool(self.request.GET.get('suspicious'))
         return context
     
 
@@ -314,32 +330,22 @@ class PenaltyBonusCreateView(CreateView):
 #===============================================
 
 
-class AccountantDashboardView(ListView):
+class AccountantDashboardView(ReplicaReadMixin, ListView):
     model = User
     template_name = 'payroll/accountant_dashboard.html'
     context_object_name = 'workers'
 
     def get_queryset(self):
-        # Используем Coalesce, чтобы вместо None (если записей нет) был 0
+        # Итоги берем из баланса работника (одна строка на работника, см. WorkerBalance):
+        # один LEFT JOIN вместо сумм по трем связям, которые размножали строки
+        zero = Value(0, output_field=DecimalField())
         return User.objects.annotate(
-            earned=Coalesce(
-                Sum('work_entries__final_rate', 
-                    filter=Q(work_entries__is_verified=True)), 
-                0, output_field=DecimalField()
-            ),
-            paid=Coalesce(
-                Sum('payouts__amount'), 
-                0, output_field=DecimalField()
-            ),
-            # Добавляем премии и штрафы (если они есть)
-            bonuses=Coalesce(
-                Sum('penaltybonus__amount', filter=Q(penaltybonus__type='bonus')), 
-                0, output_field=DecimalField()
-            ),
-            penalties=Coalesce(
-                Sum('penaltybonus__amount', filter=Q(penaltybonus__type='penalty')), 
-                0, output_field=DecimalField()
-            )
+            earned=Coalesce(F('payroll_balance__earned'), zero),
+            paid=Coalesce(F('payroll_balance__paid'), zero),
+            bonuses=Coalesce(F('payroll_balance__bonuses'), zero),
+            penalties=Coalesce(F('payroll_balance__penalties'), zero),
+        ).annotate(
+            balance=F('earned') + F('bonuses') - F('penalties') - F('paid'),
         ).order_by('username')
 
 class WorkerPayrollDetailView(CreateView):
@@ -352,20 +358,23 @@ class WorkerPayrollDetailView(CreateView):
         context = super().get_context_data(**kwargs)
         worker = get_object_or_404(User, id=self.kwargs['worker_id'])
         
-        # Считаем заработок (кол-во * ставку) для подтвержденных записей
-        entries = WorkEntry.objects.filter(worker=worker, is_verified=True)
-        total_earned = sum(e.quantity * e.final_rate for e in entries)
-        
-        # Считаем выплаты
-        payouts = Payout.objects.filter(worker=worker)
-        total_paid = payouts.aggregate(Sum('amount'))['amount__sum'] or 0
+        # Итоги — из баланса работника (ведется журналом), без пересчета всех записей
+        balance = WorkerBalance.objects.filter(worker=worker).first() or WorkerBalance(worker=worker)
+        # Списки — только открытый период: закрытые свернуты в итоги PayrollSnapshot
+        last_snapshot = PayrollSnapshot.objects.filter(worker=worker).select_related('period').order_by('-period__end_date').first()
+        entries = WorkEntry.objects.filter(worker=worker, is_verified=True, period__isnull=True).select_related('operation')
+        payouts = Payout.objects.filter(worker=worker, period__isnull=True)
 
         context['worker'] = worker
         context['entries'] = entries.order_by('-date_performed')
         context['payouts'] = payouts.order_by('-date_paid')
-        context['total_earned'] = total_earned
-        context['total_paid'] = total_paid
-        context['balance'] = total_earned - total_paid
+        context['last_snapshot'] = last_snapshot
+        context['opening_balance'] = last_snapshot.closing_balance if last_snapshot else 0
+        context['total_earned'] = balance.earned
+        context['total_bonuses'] = balance.bonuses
+        context['total_penalties'] = balance.penalties
+        context['total_paid'] = balance.paid
+        context['balance'] = balance.balance
         return context
 
     def form_valid(self, form):
@@ -373,4 +382,46 @@ class WorkerPayrollDetailView(CreateView):
         return super().form_valid(form)
 
     def get_success_url(self):
-        return reverse_lazy('worker_payroll_detail', kwargs={'worker_id': self.kwargs['worker_id']})
\ No newline at end of file
+        return reverse_lazy('worker_payroll_detail', kwargs={'worker_id': self.kwargs['worker_id']})
+
+
+class PayrollPeriodListView(LoginRequiredMixin, ListView):
+    """Закрытые расчетные периоды + закрытие следующего"""
+    model = PayrollPeriod
+    template_name = 'payroll/payroll_period_list.html'
+    context_object_name = 'periods'
+
+    def get_queryset(self):
+        return PayrollPeriod.objects.select_related('closed_by').order_by('-end_date')
+
+    def post(self, request, *args, **kwargs):
+        if not (request.user.is_staff or request.user.is_superuser):
+            messages.error(request, "У вас нет прав для этого действия")
+            return redirect('payroll_period_list')
+        try:
+            end_date = date.fromisoformat(request.POST.get('end_date', ''))
+        except ValueError:
+            messages.error(request, "Укажите дату окончания периода")
+            return redirect('payroll_period_list')
+
+        try:
+            period = close_payroll_period(end_date, request.user)
+        except PayrollPeriodError as e:
+            messages.error(request, str(e))
+            return redirect('payroll_period_list')
+        messages.success(request, f"Период {period} закрыт")
+        return redirect('payroll_period_detail', pk=period.pk)
+
+
+class PayrollPeriodDetailView(LoginRequiredMixin, DetailView):
+    """Зафиксированные итоги работников за закрытый период"""
+    model = PayrollPeriod
+    template_name = 'payroll/payroll_period_detail.html'
+    context_object_name = 'period'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['snapshots'] = self.object.snapshots.select_related('worker').prefetch_related(
+            'lines__operation'
+        ).order_by('worker__username')
+        return context
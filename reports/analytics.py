@@ -0,0 +1,288 @@
+"""
+Аналитика запасов, считаемая векторно в NumPy.
+
+ABC/XYZ-анализ ассортимента:
+ABC — доля товара в выручке за период (накопительным итогом от самых доходных).
+XYZ — стабильность спроса: коэффициент вариации недельных отгрузок.
+
+Прогноз исчерпания: средний дневной расход за скользящее окно
+и число дней, на которое хватит текущего остатка.
+
+Из БД забираются только агрегаты (товар × неделя / товар × день),
+вся арифметика — над матрицами сразу по всем позициям.
+"""
+from datetime import date, timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Case, When, F
+from django.db.models.functions import TruncWeek, TruncDate
+from django.utils import timezone
+from reports.models import DailySalesFact, StockProjection
+from warehouse1.models import Material, MaterialOperation
+from warehouse2.models import Product, ProductOperation
+
+
+# Пороги накопительной доли выручки: до 80% — A, до 95% — B, остальное — C
+ABC_THRESHOLDS = (0.80, 0.95)
+# Пороги коэффициента вариации недельного спроса: X — стабильный, Y — колеблющийся, Z — нерегулярный
+XYZ_THRESHOLDS = (0.25, 0.50)
+
+ABC_CLASSES = np.array(['A', 'B', 'C'])
+XYZ_CLASSES = np.array(['X', 'Y', 'Z'])
+
+
+def get_abc_xyz_period(start_date=None, end_date=None):
+    """Период по умолчанию — последние 26 недель (для XYZ нужен ряд, а не месяц)."""
+    end_date = end_date or date.today()
+    return (start_date or end_date - timedelta(weeks=26), end_date)
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def load_demand_matrix(start_date, end_date):
+    """
+    Матрица недельного спроса: (product_ids, matrix[товар, неделя]).
+    Спрос = отгрузки минус возвраты по журналу ProductOperation.
+    """
+    first_week = _week_start(start_date)
+    n_weeks = (_week_start(end_date) - first_week).days // 7 + 1
+
+    rows = ProductOperation.objects.filter(
+        operation_type__in=[ProductOperation.OperationType.SHIPMENT, ProductOperation.OperationType.RETURN],
+        timestamp__date__range=[start_date, end_date],
+    ).annotate(
+        week=TruncWeek('timestamp')
+    ).values('product_id', 'week').annotate(
+        demand=Sum(Case(
+            When(operation_type=ProductOperation.OperationType.RETURN, then=-F('quantity')),
+            default=F('quantity'),
+        ))
+    ).values_list('product_id', 'week', 'demand')
+
+    data = np.array(
+        [(product_id, (week.date() - first_week).days // 7, demand) for product_id, week, demand in rows],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+
+    product_ids, row_index = np.unique(data[:, 0], return_inverse=True)
+    matrix = np.zeros((len(product_ids), n_weeks), dtype=np.float64)
+    matrix[row_index, data[:, 1]] = data[:, 2]
+    return product_ids, matrix
+
+
+def load_revenue_vector(start_date, end_date):
+    """Выручка по товарам за период из витрины продаж: (product_ids, revenue)."""
+    rows = DailySalesFact.objects.filter(
+        day__range=[start_date, end_date]
+    ).values('product_id').annotate(
+        total_revenue=Sum('revenue')
+    ).values_list('product_id', 'total_revenue')
+
+    product_ids = np.fromiter((row[0] for row in rows), dtype=np.int64)
+    revenue = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(product_ids))
+    return product_ids, revenue
+
+
+def classify_abc(revenue, thresholds=ABC_THRESHOLDS):
+    """
+    Классы ABC по вектору выручки. Товар попадает в класс по доле,
+    накопленной ДО него, поэтому самый доходный товар всегда A.
+    """
+    revenue = np.clip(revenue, 0, None)
+    total = revenue.sum()
+    if total <= 0:
+        return np.full(len(revenue), 'C'), np.zeros(len(revenue))
+
+    order = np.argsort(-revenue, kind='stable')
+    share = revenue / total
+    cum_before = np.empty_like(share)
+    cum_before[order] = np.cumsum(share[order]) - share[order]
+    classes = ABC_CLASSES[np.searchsorted(thresholds, cum_before, side='right')]
+    # Без выручки — всегда C, даже если предыдущие не добрали до порога
+    classes[revenue <= 0] = 'C'
+    return classes, share
+
+
+def classify_xyz(matrix, thresholds=XYZ_THRESHOLDS):
+    """Классы XYZ по матрице спроса (товар × неделя): коэффициент вариации по строкам."""
+    mean = matrix.mean(axis=1)
+    std = matrix.std(axis=1)
+    cv = np.full(len(mean), np.inf)
+    np.divide(std, mean, out=cv, where=mean > 0)
+    return XYZ_CLASSES[np.searchsorted(thresholds, cv, side='left')], cv
+
+
+def build_abc_xyz(start_date, end_date):
+    """Полный расчет без кэша."""
+    demand_ids, matrix = load_demand_matrix(start_date, end_date)
+    revenue_ids, revenue = load_revenue_vector(start_date, end_date)
+
+    # Общая ось товаров: все, у кого была выручка или спрос
+    product_ids = np.union1d(demand_ids, revenue_ids)
+    full_revenue = np.zeros(len(product_ids))
+    full_revenue[np.searchsorted(product_ids, revenue_ids)] = revenue
+    full_matrix = np.zeros((len(product_ids), matrix.shape[1]))
+    full_matrix[np.searchsorted(product_ids, demand_ids)] = matrix
+
+    abc, share = classify_abc(full_revenue)
+    xyz, cv = classify_xyz(full_matrix)
+
+    products = dict(
+        (pk, (name, sku)) for pk, name, sku in
+        Product.objects.filter(pk__in=product_ids.tolist()).values_list('pk', 'name', 'sku')
+    )
+    order = np.argsort(-full_revenue, kind='stable')
+
+    summary = {str(a) + str(x): 0 for a in ABC_CLASSES for x in XYZ_CLASSES}
+    rows = []
+    for i in order.tolist():
+        name, sku = products.get(int(product_ids[i]), ('', ''))
+        group = str(abc[i]) + str(xyz[i])
+        summary[group] += 1
+        rows.append({
+            'product_id': int(product_ids[i]),
+            'name': name,
+            'sku': sku,
+            'revenue': round(float(full_revenue[i]), 2),
+            'share': round(float(share[i]) * 100, 2),
+            'demand': int(full_matrix[i].sum()),
+            'cv': None if np.isinf(cv[i]) else round(float(cv[i]), 3),
+            'abc': str(abc[i]),
+            'xyz': str(xyz[i]),
+            'group': group,
+        })
+
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'weeks': int(full_matrix.shape[1]),
+        'summary': summary,
+        'rows': rows,
+    }
+
+
+def get_abc_xyz_data(start_date=None, end_date=None):
+    """ABC/XYZ за период; результат кэшируется на каждый диапазон дат."""
+    start_date, end_date = get_abc_xyz_period(start_date, end_date)
+    key = f'reports:abc_xyz:{start_date.isoformat()}:{end_date.isoformat()}'
+    return cache.get_or_set(
+        key,
+        lambda: build_abc_xyz(start_date, end_date),
+        timeout=getattr(settings, 'REPORT_JOB_TTL', 900),
+    )
+
+
+# ==============================================================================
+# Прогноз исчерпания остатков
+# ==============================================================================
+
+def get_projection_window():
+    return getattr(settings, 'STOCK_PROJECTION_WINDOW_DAYS', 28)
+
+
+def load_daily_usage(operations, item_field, date_field, start_day, n_days):
+    """
+    Матрица дневного расхода: (item_ids, matrix[позиция, день]) за n_days начиная со start_day.
+    operations — уже отфильтрованный по типу расхода queryset журнала.
+    """
+    rows = operations.filter(
+        **{f'{date_field}__date__gte': start_day}
+    ).annotate(
+        day=TruncDate(date_field)
+    ).values(item_field, 'day').annotate(
+        used=Sum('quantity')
+    ).values_list(item_field, 'day', 'used')
+
+    data = np.array(
+        [(item_id, (day - start_day).days, used) for item_id, day, used in rows],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    # Операции "из будущего" (сегодня по другому часовому поясу) в окно не берем
+    data = data[data[:, 1] < n_days]
+
+    item_ids, row_index = np.unique(data[:, 0], return_inverse=True)
+    matrix = np.zeros((len(item_ids), n_days), dtype=np.float64)
+    matrix[row_index, data[:, 1]] = data[:, 2]
+    return item_ids, matrix
+
+
+def project_stockout(stock, usage_ids, usage_matrix, stock_ids):
+    """
+    Средний расход за окно и дни до исчерпания для всех позиций сразу.
+    Возвращает (daily_usage, days_left); days_left = NaN, если расхода не было.
+    """
+    daily_usage = np.zeros(len(stock_ids))
+    if len(usage_ids):
+        # Позиции с расходом, но уже удаленные из справочника, отбрасываем
+        known = np.isin(usage_ids, stock_ids)
+        daily_usage[np.searchsorted(stock_ids, usage_ids[known])] = usage_matrix[known].mean(axis=1)
+
+    days_left = np.full(len(stock_ids), np.nan)
+    np.divide(np.clip(stock, 0, None), daily_usage, out=days_left, where=daily_usage > 0)
+    return daily_usage, days_left
+
+
+def _build_projections(kind, stock_rows, usage_ids, usage_matrix, today, computed_at):
+    stock_rows = sorted(stock_rows)
+    stock_ids = np.array([row[0] for row in stock_rows], dtype=np.int64)
+    stock = np.array([row[1] for row in stock_rows], dtype=np.float64)
+    daily_usage, days_left = project_stockout(stock, usage_ids, usage_matrix, stock_ids)
+    # Огромный запас при крошечном расходе: дата вышла бы за date.max — ее просто не ставим
+    max_days = (date.max - today).days
+
+    # Храним только то, что есть на складе или расходуется
+    for i in np.flatnonzero((stock > 0) | (daily_usage > 0)).tolist():
+        left = None if np.isnan(days_left[i]) else round(float(days_left[i]), 1)
+        yield StockProjection(
+            kind=kind,
+            **{f'{kind}_id': int(stock_ids[i])},
+            quantity=int(stock[i]),
+            daily_usage=round(float(daily_usage[i]), 3),
+            days_left=left,
+            stockout_date=None if left is None or left > max_days else today + timedelta(days=int(left)),
+            computed_at=computed_at,
+        )
+
+
+def refresh_stock_projections(window=None):
+    """
+    Пересчитывает таблицу StockProjection целиком.
+    Расход товаров — отгрузки, материалов — выдача со склада.
+    """
+    window = window or get_projection_window()
+    computed_at = timezone.now()
+    today = timezone.localdate(computed_at)
+    start_day = today - timedelta(days=window - 1)
+
+    product_ids, product_usage = load_daily_usage(
+        ProductOperation.objects.filter(operation_type=ProductOperation.OperationType.SHIPMENT),
+        'product_id', 'timestamp', start_day, window,
+    )
+    material_ids, material_usage = load_daily_usage(
+        MaterialOperation.objects.filter(operation_type='outgoing'),
+        'material_id', 'date', start_day, window,
+    )
+
+    projections = [
+        *_build_projections('product', Product.objects.values_list('id', 'total_quantity'),
+                            product_ids, product_usage, today, computed_at),
+        *_build_projections('material', Material.objects.values_list('id', 'quantity'),
+                            material_ids, material_usage, today, computed_at),
+    ]
+    with transaction.atomic():
+        StockProjection.objects.all().delete()
+        StockProjection.objects.bulk_create(projections, batch_size=1000)
+    return len(projections)
+
+
+def get_stockout_risks(horizon_days=None):
+    """Позиции, которые закончатся в пределах горизонта (по последнему расчету)."""
+    if horizon_days is None:
+        horizon_days = getattr(settings, 'STOCK_PROJECTION_HORIZON_DAYS', 14)
+    return StockProjection.objects.filter(
+        days_left__isnull=False, days_left__lte=horizon_days
+    ).select_related('product', 'material__unit').order_by('days_left')
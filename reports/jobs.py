@@ -0,0 +1,255 @@
+"""
+Фоновые отчеты: реестр типов отчетов, постановка в очередь с дедупликацией
+по хэшу параметров и выполнение (вызывается из Celery-задачи run_report_job).
+"""
+import hashlib
+import json
+import tempfile
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .forms import MovementReportFilterForm, DateRangeFilterForm
+from .models import ReportJob
+from warehouse.db_router import use_replica, use_primary
+from .analytics import get_abc_xyz_data, get_abc_xyz_period
+from .servises import (get_sales_chart_data, get_sales_by_product_data, get_sales_by_category_data,
+    get_sales_period, write_movement_report_xlsx, iter_movement_report_csv, get_low_stock_data,
+    get_stock_ageing_data)
+
+
+def _clean_form(form_class, params):
+    form = form_class(params)
+    if not form.is_valid():
+        raise ValidationError(form.errors.as_text())
+    return form.cleaned_data
+
+
+def _dates_params(params):
+    """Даты по умолчанию подставляем при постановке, чтобы хэш не зависел от пустых полей."""
+    data = _clean_form(DateRangeFilterForm, params)
+    start_date, end_date = get_sales_period(data.get('start_date'), data.get('end_date'))
+    return {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+
+
+def _abc_xyz_params(params):
+    data = _clean_form(DateRangeFilterForm, params)
+    start_date, end_date = get_abc_xyz_period(data.get('start_date'), data.get('end_date'))
+    return {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+
+
+def _period_params(params):
+    period = params.get('period') or 'month'
+    if period not in ('week', 'month', 'year'):
+        raise ValidationError("Неизвестный период")
+    return {'period': period}
+
+
+def _ageing_params(params):
+    sort_order = 'desc' if params.get('sort') == 'desc' else 'asc'
+    try:
+        page = max(int(params.get('page') or 1), 1)
+    except (TypeError, ValueError):
+        raise ValidationError("Некорректный номер страницы")
+    return {'sort': sort_order, 'page': page}
+
+
+def _movement_params(params):
+    data = _clean_form(MovementReportFilterForm, params)
+    return {name: str(value) for name, value in data.items() if value}
+
+
+def _movement_filters(params):
+    return _clean_form(MovementReportFilterForm, params)
+
+
+def _write_movement_csv(params, fileobj):
+    for line in iter_movement_report_csv(_movement_filters(params)):
+        fileobj.write(line.encode('utf-8'))
+
+
+# Реестр отчетов:
+#   normalize — приводит сырые GET/POST-параметры к каноничному виду (от него считается хэш)
+#   build     — для 'json' возвращает результат, для 'file' пишет в переданный файл
+#   permission — право, нужное для запуска и скачивания (None — любой залогиненный)
+REPORT_TYPES = {
+    'sales_chart': {
+        'kind': 'json',
+        'normalize': _period_params,
+        'build': lambda params: get_sales_chart_data(params['period']),
+        'permission': None,
+    },
+    'sales_by_product': {
+        'kind': 'json',
+        'normalize': _dates_params,
+        'build': lambda params: get_sales_by_product_data(params['start_date'], params['end_date']),
+        'permission': None,
+    },
+    'sales_by_category': {
+        'kind': 'json',
+        'normalize': _dates_params,
+        'build': lambda params: get_sales_by_category_data(params['start_date'], params['end_date']),
+        'permission': None,
+    },
+    'abc_xyz': {
+        'kind': 'json',
+        'normalize': _abc_xyz_params,
+        'build': lambda params: get_abc_xyz_data(
+            date.fromisoformat(params['start_date']), date.fromisoformat(params['end_date'])
+        ),
+        'permission': None,
+    },
+    'low_stock': {
+        'kind': 'json',
+        'normalize': lambda params: {},
+        'build': lambda params: get_low_stock_data(),
+        'permission': None,
+    },
+    'stock_ageing': {
+        'kind': 'json',
+        'normalize': _ageing_params,
+        'build': lambda params: get_stock_ageing_data(params['sort'], params['page']),
+        'permission': None,
+    },
+    'movement_xlsx': {
+        'kind': 'file',
+        'extension': 'xlsx',
+        'normalize': _movement_params,
+        'build': lambda params, fileobj: write_movement_report_xlsx(_movement_filters(params), fileobj),
+        'permission': 'reports.view_purchases_report',
+    },
+    'movement_csv': {
+        'kind': 'file',
+        'extension': 'csv',
+        'normalize': _movement_params,
+        'build': _write_movement_csv,
+        'permission': 'reports.view_purchases_report',
+    },
+}
+
+
+def get_report_type(report_type):
+    try:
+        return REPORT_TYPES[report_type]
+    except KeyError:
+        raise ValidationError(f"Неизвестный тип отчета: {report_type}")
+
+
+def user_can_run(user, report_type):
+    permission = get_report_type(report_type)['permission']
+    return permission is None or user.has_perm(permission)
+
+
+def get_params_hash(report_type, params):
+    raw = json.dumps([report_type, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Сколько раз пробуем занять слот задачи при гонке с параллельными запросами
+SUBMIT_ATTEMPTS = 3
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_TTL', 900))
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_AFTER', 1800))
+
+
+def find_reusable_job(report_type, params_hash):
+    """Активная задача или свежий готовый результат с теми же параметрами."""
+    now = timezone.now()
+    jobs = ReportJob.objects.filter(report_type=report_type, params_hash=params_hash)
+    active = jobs.filter(status__in=[ReportJob.Status.PENDING, ReportJob.Status.RUNNING]).first()
+    if active:
+        return active
+    return jobs.filter(status=ReportJob.Status.DONE, expires_at__gt=now).order_by('-finished_at').first()
+
+
+def submit_report_job(report_type, raw_params, user=None):
+    """
+    Ставит отчет в очередь или возвращает уже существующий.
+    Возвращает (job, created). ValidationError — при неверных параметрах.
+    """
+    definition = get_report_type(report_type)
+    params = definition['normalize'](raw_params)
+    params_hash = get_params_hash(report_type, params)
+
+    # Пишем и сразу читаем свое: в представлении с репликой поиск задачи
+    # мог бы не увидеть только что созданную строку
+    with use_primary():
+        # Задачи, "зависшие" дольше порога (упал воркер), больше не блокируют новые
+        ReportJob.objects.filter(
+            status__in=[ReportJob.Status.PENDING, ReportJob.Status.RUNNING],
+            created_at__lt=timezone.now() - _stale_after(),
+        ).update(status=ReportJob.Status.FAILED, error="Превышено время ожидания", finished_at=timezone.now())
+
+        for _ in range(SUBMIT_ATTEMPTS):
+            job = find_reusable_job(report_type, params_hash)
+            if job:
+                return job, False
+
+            try:
+                with transaction.atomic():
+                    job = ReportJob.objects.create(
+                        report_type=report_type, params=params, params_hash=params_hash, created_by=user
+                    )
+            except IntegrityError:
+                # Параллельный запрос успел создать такую же задачу. Она могла уже упасть
+                # (или ее снял sweep зависших) — тогда поиск ее не вернет и пробуем создать снова
+                continue
+
+            from .tasks import run_report_job
+            transaction.on_commit(lambda: run_report_job.delay(job.id))
+            return job, True
+
+    raise ValidationError("Не удалось поставить отчет в очередь, повторите попытку")
+
+
+def run_report_job(job_id):
+    """Выполняет отчет и сохраняет результат в ReportJob."""
+    updated = ReportJob.objects.filter(pk=job_id, status=ReportJob.Status.PENDING).update(
+        status=ReportJob.Status.RUNNING
+    )
+    if not updated:
+        return None  # Задачу уже взял другой воркер или она завершена
+
+    job = ReportJob.objects.get(pk=job_id)
+    definition = get_report_type(job.report_type)
+    try:
+        if definition['kind'] == 'file':
+            with tempfile.TemporaryFile() as tmp:
+                # Сам отчет только читает — считаем его на реплике
+                with use_replica():
+                    definition['build'](job.params, tmp)
+                tmp.seek(0)
+                job.result_file.save(f"{job.report_type}_{job.pk}.{definition['extension']}", File(tmp), save=False)
+        else:
+            with use_replica():
+                job.result = definition['build'](job.params)
+        job.status = ReportJob.Status.DONE
+        job.expires_at = timezone.now() + _ttl()
+    except Exception as e:
+        job.status = ReportJob.Status.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save()
+    return job.status
+
+
+def purge_expired_jobs():
+    """Удаляет устаревшие результаты вместе с файлами."""
+    expired = ReportJob.objects.filter(
+        status__in=[ReportJob.Status.DONE, ReportJob.Status.FAILED],
+        finished_at__lt=timezone.now() - _ttl(),
+    )
+    count = 0
+    for job in expired.iterator():
+        if job.result_file:
+            job.result_file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
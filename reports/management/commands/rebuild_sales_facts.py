@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from reports.servises import rebuild_daily_sales_facts
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает витрину продаж по дням (DailySalesFact) из отгруженных накладных'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Пересборка витрины продаж...'))
+        count = rebuild_daily_sales_facts()
+        self.stdout.write(self.style.SUCCESS(f'Готово! Строк в витрине: {count}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from reports.analytics import refresh_stock_projections
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает прогноз исчерпания остатков (StockProjection) по журналам операций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=None, help='Окно среднего расхода, дней')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Пересчет прогноза исчерпания...'))
+        count = refresh_stock_projections(options['window'])
+        self.stdout.write(self.style.SUCCESS(f'Готово! Позиций в прогнозе: {count}.'))
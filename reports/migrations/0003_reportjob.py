@@ -0,0 +1,43 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reports', '0002_alter_shipmentauditlog_action'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(max_length=50, verbose_name='Тип отчета')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('params_hash', models.CharField(max_length=64, verbose_name='Хэш параметров')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Результат (JSON)')),
+                ('result_file', models.FileField(blank=True, null=True, upload_to='reports/jobs/', verbose_name='Результат (файл)')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Актуален до')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кто запросил')),
+            ],
+            options={
+                'verbose_name': 'Фоновый отчет',
+                'verbose_name_plural': 'Фоновые отчеты',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['report_type', 'params_hash', 'status'], name='reportjob_lookup_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('report_type', 'params_hash'), name='unique_active_report_job'),
+        ),
+    ]
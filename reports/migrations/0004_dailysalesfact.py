@@ -0,0 +1,37 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse2', '0008_sender_stamp'),
+        ('reports', '0003_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День отгрузки')),
+                ('is_package', models.BooleanField(default=False, verbose_name='Продано упаковками')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество (позиций)')),
+                ('units', models.IntegerField(default=0, verbose_name='Количество (штук)')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='warehouse2.productcategory', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='warehouse2.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesfact',
+            constraint=models.UniqueConstraint(models.F('day'), models.F('product'), django.db.models.functions.comparison.Coalesce('category', models.Value(0)), models.F('is_package'), name='unique_daily_sales_fact'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse1', '0004_material_last_movement_at'),
+        ('warehouse2', '0009_product_last_movement_at'),
+        ('reports', '0004_dailysalesfact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockProjection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Готовая продукция'), ('material', 'Сырье и материалы')], max_length=10, verbose_name='Склад')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Остаток на момент расчета')),
+                ('daily_usage', models.FloatField(default=0, verbose_name='Средний расход в день')),
+                ('days_left', models.FloatField(blank=True, null=True, verbose_name='Дней до исчерпания')),
+                ('stockout_date', models.DateField(blank=True, null=True, verbose_name='Ожидаемая дата исчерпания')),
+                ('computed_at', models.DateTimeField(verbose_name='Рассчитано')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_projections', to='warehouse1.material', verbose_name='Материал')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_projections', to='warehouse2.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Прогноз исчерпания',
+                'verbose_name_plural': 'Прогнозы исчерпания',
+                'indexes': [models.Index(fields=['days_left'], name='stockprojection_days_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockprojection',
+            constraint=models.UniqueConstraint(fields=('product',), name='unique_product_projection'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockprojection',
+            constraint=models.UniqueConstraint(fields=('material',), name='unique_material_projection'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_daily_sales_facts(apps, schema_editor):
+    """Заполняем витрину по уже отгруженным накладным — та же выборка, что в rebuild_daily_sales_facts."""
+    ShipmentItem = apps.get_model('warehouse2', 'ShipmentItem')
+    DailySalesFact = apps.get_model('reports', 'DailySalesFact')
+    db_alias = schema_editor.connection.alias
+
+    facts = ShipmentItem.objects.using(db_alias).filter(
+        shipment__status='shipped', shipment__shipped_at__isnull=False
+    ).annotate(
+        fact_day=TruncDate('shipment__shipped_at'),
+        fact_product=Coalesce('product_id', 'package__product_id'),
+        fact_category=Coalesce('product__category_id', 'package__product__category_id'),
+        fact_is_package=ExpressionWrapper(Q(package__isnull=False), output_field=models.BooleanField()),
+    ).values(
+        'fact_day', 'fact_product', 'fact_category', 'fact_is_package'
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        total_units=Sum(F('quantity') * Coalesce('package__quantity', 1)),
+        total_revenue=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())),
+    ).order_by()
+
+    DailySalesFact.objects.using(db_alias).all().delete()
+    DailySalesFact.objects.using(db_alias).bulk_create([
+        DailySalesFact(
+            day=row['fact_day'], product_id=row['fact_product'], category_id=row['fact_category'],
+            is_package=row['fact_is_package'], quantity=row['total_quantity'],
+            units=row['total_units'], revenue=row['total_revenue'],
+        )
+        for row in facts
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse2', '0009_product_last_movement_at'),
+        ('reports', '0005_stockprojection'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales_facts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+from decimal import Decimal
 from warehouse2.models import Shipment
 
 class ShipmentAuditLog(models.Model):
@@ -21,4 +25,157 @@ class ShipmentAuditLog(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"Инцидент по накладной №{self.shipment_id} - {self.get_action_display()}"
\ No newline at end of file
+        return f"Инцидент по накладной №{self.shipment_id} - {self.get_action_display()}"
+
+class ReportJob(models.Model):
+    """
+    Фоновое формирование отчета (Celery).
+    Одинаковые параметры (params_hash) не считаются повторно: пока задача
+    в работе или результат не устарел (expires_at), все получают одну и ту же запись.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Формируется'
+        DONE = 'done', 'Готов'
+        FAILED = 'failed', 'Ошибка'
+
+    report_type = models.CharField(max_length=50, verbose_name="Тип отчета")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    params_hash = models.CharField(max_length=64, verbose_name="Хэш параметров")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    result = models.JSONField(null=True, blank=True, verbose_name="Результат (JSON)")
+    result_file = models.FileField(upload_to='reports/jobs/', null=True, blank=True, verbose_name="Результат (файл)")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Кто запросил")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершен")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Актуален до")
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+    def __str__(self):
+        return f"Отчет {self.report_type} №{self.id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Фоновый отчет"
+        verbose_name_plural = "Фоновые отчеты"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['report_type', 'params_hash', 'status'], name='reportjob_lookup_idx'),
+        ]
+        constraints = [
+            # Только одна активная задача на один набор параметров
+            models.UniqueConstraint(
+                fields=['report_type', 'params_hash'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_report_job',
+            ),
+        ]
+
+
+class DailySalesFact(models.Model):
+    """
+    Витрина продаж по дням: одна строка на (день, товар, категория, упаковка/штука).
+    Пополняется при отгрузке (Shipment.ship), уменьшается при возврате.
+    Полный пересчет: manage.py rebuild_sales_facts.
+    """
+    day = models.DateField(verbose_name="День отгрузки")
+    product = models.ForeignKey('warehouse2.Product', on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Товар")
+    category = models.ForeignKey('warehouse2.ProductCategory', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Категория")
+    is_package = models.BooleanField(default=False, verbose_name="Продано упаковками")
+    quantity = models.IntegerField(default=0, verbose_name="Количество (позиций)")
+    units = models.IntegerField(default=0, verbose_name="Количество (штук)")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+
+    @classmethod
+    def record_shipment(cls, shipment, sign=1):
+        """
+        Добавляет (sign=1) или вычитает (sign=-1) позиции отгрузки в витрине.
+        Один INSERT ... ON CONFLICT DO UPDATE на всю накладную.
+        """
+        day = timezone.localdate(shipment.shipped_at)
+        totals = {}
+        for item in shipment.items.select_related('product', 'package__product'):
+            product = item.stock_product
+            key = (product.pk, product.category_id, item.package_id is not None)
+            quantity, units, revenue = totals.get(key, (0, 0, Decimal('0')))
+            totals[key] = (
+                quantity + item.quantity,
+                units + item.base_product_units,
+                revenue + item.price * item.quantity,
+            )
+        if not totals:
+            return
+
+        rows = [
+            (day, product_id, category_id, is_package, sign * quantity, sign * units, sign * revenue)
+            for (product_id, category_id, is_package), (quantity, units, revenue) in totals.items()
+        ]
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"""
+                INSERT INTO {table} (day, product_id, category_id, is_package, quantity, units, revenue)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (day, product_id, (COALESCE(category_id, 0)), is_package) DO UPDATE SET
+                    quantity = {table}.quantity + EXCLUDED.quantity,
+                    units = {table}.units + EXCLUDED.units,
+                    revenue = {table}.revenue + EXCLUDED.revenue
+                """,
+                rows,
+            )
+
+    def __str__(self):
+        return f"{self.day}: {self.product_id} — {self.revenue}"
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        constraints = [
+            # COALESCE: у товара может не быть категории, а NULL в уникальном индексе не сравниваются
+            models.UniqueConstraint(
+                F('day'), F('product'), Coalesce('category', Value(0)), F('is_package'),
+                name='unique_daily_sales_fact',
+            ),
+        ]
+
+
+class StockProjection(models.Model):
+    """
+    Прогноз исчерпания остатка: одна строка на товар или материал.
+    Пересчитывается периодической задачей (reports.tasks.refresh_stock_projections),
+    отчеты и главная страница только читают готовые значения.
+    """
+    KIND_CHOICES = [
+        ('product', 'Готовая продукция'),
+        ('material', 'Сырье и материалы'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Склад")
+    product = models.ForeignKey('warehouse2.Product', on_delete=models.CASCADE, null=True, blank=True, related_name='stock_projections', verbose_name="Товар")
+    material = models.ForeignKey('warehouse1.Material', on_delete=models.CASCADE, null=True, blank=True, related_name='stock_projections', verbose_name="Материал")
+    quantity = models.IntegerField(default=0, verbose_name="Остаток на момент расчета")
+    daily_usage = models.FloatField(default=0, verbose_name="Средний расход в день")
+    days_left = models.FloatField(null=True, blank=True, verbose_name="Дней до исчерпания")
+    stockout_date = models.DateField(null=True, blank=True, verbose_name="Ожидаемая дата исчерпания")
+    computed_at = models.DateTimeField(verbose_name="Рассчитано")
+
+    @property
+    def item(self):
+        return self.product if self.kind == 'product' else self.material
+
+    def __str__(self):
+        return f"{self.item}: {self.days_left} дн."
+
+    class Meta:
+        verbose_name = "Прогноз исчерпания"
+        verbose_name_plural = "Прогнозы исчерпания"
+        indexes = [
+            models.Index(fields=['days_left'], name='stockprojection_days_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product'], name='unique_product_projection'),
+            models.UniqueConstraint(fields=['material'], name='unique_material_projection'),
+        ]
@@ -1,26 +1,69 @@
-from warehouse1.models import MaterialOperation
-from warehouse2.models import ProductOperation
+from warehouse1.models import Material, MaterialOperation
+from warehouse2.models import Product, ProductOperation, ShipmentItem
+from reports.models import DailySalesFact
+from reports.analytics import get_stockout_risks
 import openpyxl
-from openpyxl.styles import Font, Alignment
-from django.http import HttpResponse
-import io
+from openpyxl.styles import Font, Alignment, NamedStyle
+from openpyxl.cell import WriteOnlyCell
+from django.http import FileResponse, StreamingHttpResponse
+from django.conf import settings
+import csv
+import tempfile
 from openpyxl.styles import PatternFill
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, F, Sum, Value, CharField, IntegerField
+from django.db.models.functions import TruncMonth, TruncDate, Coalesce, ExtractDay, Now
+from django.db import models
+from django.db.models import ExpressionWrapper, DecimalField, DurationField, Case, When
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import Paginator
+from datetime import datetime, date, timedelta, timezone as dt_timezone
 
 
-def get_unified_movement_data(filters):
+# Колонки единого журнала. Порядок важен: UNION сопоставляет колонки по позиции,
+# поэтому обе ветки аннотируются в одном и том же порядке.
+MOVEMENT_COLUMNS = [
+    'row_kind', 'row_id', 'moved_at', 'item_name', 'item_sku', 'op_type',
+    'op_quantity', 'username', 'source_ct', 'source_id', 'category_name',
+]
+
+# Дискриминатор ветки: участвует в ключе сортировки, т.к. id в двух таблицах пересекаются
+KIND_PRODUCT = 'p'
+KIND_MATERIAL = 'm'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _keyset_filter(kind, cursor, field):
     """
-    Собирает данные из обоих журналов операций,
-    стандартизирует и возвращает единый отсортированный список.
+    Условие "строго после курсора" для одной ветки UNION.
+    Порядок выдачи: (moved_at DESC, row_kind DESC, row_id DESC).
+    """
+    if not cursor:
+        return Q()
+    ts, cursor_kind, cursor_id = cursor
+    if kind < cursor_kind:
+        # Ветка идет после курсора при равном времени
+        return Q(**{f'{field}__lte': ts})
+    if kind > cursor_kind:
+        return Q(**{f'{field}__lt': ts})
+    return Q(**{f'{field}__lt': ts}) | Q(**{field: ts, 'id__lt': cursor_id})
+
+
+def get_unified_movement_queryset(filters, cursor=None):
+    """
+    Возвращает единый журнал движения (UNION ALL двух журналов),
+    отсортированный в БД от новых к старым.
+    Строки — словари с ключами из MOVEMENT_COLUMNS.
     """
     start_date = filters.get('start_date')
     end_date = filters.get('end_date')
     operation_type = filters.get('operation_type')
     item_search = filters.get('item_search')
 
-    # 1. Получаем операции с продукцией (Склад 2)
-    product_ops_qs = ProductOperation.objects.select_related('product', 'user').all()
+    # 1. Операции с продукцией (Склад 2)
+    product_ops_qs = ProductOperation.objects.all()
     if start_date:
         product_ops_qs = product_ops_qs.filter(timestamp__gte=start_date)
     if end_date:
@@ -31,9 +74,24 @@ def get_unified_movement_data(filters):
         product_ops_qs = product_ops_qs.filter(
             Q(product__name__icontains=item_search) | Q(product__sku__icontains=item_search)
         )
-    
-    # 2. Получаем операции с материалами (Склад 1)
-    material_ops_qs = MaterialOperation.objects.select_related('material', 'user', 'material__unit').all()
+    product_ops_qs = product_ops_qs.filter(
+        _keyset_filter(KIND_PRODUCT, cursor, 'timestamp')
+    ).order_by().annotate(
+        row_kind=Value(KIND_PRODUCT, output_field=CharField()),
+        row_id=F('id'),
+        moved_at=F('timestamp'),
+        item_name=F('product__name'),
+        item_sku=F('product__sku'),
+        op_type=F('operation_type'),
+        op_quantity=F('quantity'),
+        username=F('user__username'),
+        source_ct=F('content_type_id'),
+        source_id=F('object_id'),
+        category_name=Value(None, output_field=CharField()),
+    ).values(*MOVEMENT_COLUMNS)
+
+    # 2. Операции с материалами (Склад 1)
+    material_ops_qs = MaterialOperation.objects.all()
     if start_date:
         material_ops_qs = material_ops_qs.filter(date__gte=start_date)
     if end_date:
@@ -47,106 +105,534 @@ def get_unified_movement_data(filters):
         material_ops_qs = material_ops_qs.filter(
             Q(material__name__icontains=item_search) | Q(material__article__icontains=item_search)
         )
+    material_ops_qs = material_ops_qs.filter(
+        _keyset_filter(KIND_MATERIAL, cursor, 'date')
+    ).order_by().annotate(
+        row_kind=Value(KIND_MATERIAL, output_field=CharField()),
+        row_id=F('id'),
+        moved_at=F('date'),
+        item_name=F('material__name'),
+        item_sku=F('material__article'),
+        op_type=F('operation_type'),
+        op_quantity=F('quantity'),
+        username=F('user__username'),
+        source_ct=Value(None, output_field=IntegerField()),
+        source_id=Value(None, output_field=IntegerField()),
+        category_name=F('outgoing_category__name'),
+    ).values(*MOVEMENT_COLUMNS)
 
-    # 3. Стандартизируем и объединяем
-    unified_list = []
-    for op in product_ops_qs:
-        unified_list.append({
-            'timestamp': op.timestamp,
-            'item_name': op.product.name,
-            'item_sku': op.product.sku,
-            'warehouse': 'Готовая продукция',
-            'operation': op.get_operation_type_display(),
-            'quantity': op.quantity,
-            'user': op.user.username if op.user else 'N/A',
-            'source': str(op.source) if op.source else 'Ручная операция'
-        })
-    
-    for op in material_ops_qs:
-        unified_list.append({
-            'timestamp': op.date,
-            'item_name': op.material.name,
-            'item_sku': op.material.article,
-            'warehouse': 'Сырье и материалы',
-            'operation': op.get_operation_type_display(),
-            'quantity': op.quantity,
-            'user': op.user.username if op.user else 'N/A',
-            'source': op.outgoing_category.name if op.outgoing_category else 'Приемка'
+    # 3. Объединяем и сортируем на стороне БД
+    return product_ops_qs.union(material_ops_qs, all=True).order_by(
+        '-moved_at', '-row_kind', '-row_id'
+    )
+
+
+def encode_movement_cursor(row):
+    """Курсор (moved_at, row_kind, row_id) -> строка для GET-параметра."""
+    delta = row['moved_at'] - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+    return f"{micros}.{row['row_kind']}.{row['row_id']}"
+
+
+def decode_movement_cursor(value):
+    """Обратное преобразование. Битый курсор = первая страница."""
+    if not value:
+        return None
+    try:
+        micros, kind, row_id = value.split('.')
+        if kind not in (KIND_PRODUCT, KIND_MATERIAL):
+            return None
+        return EPOCH + timedelta(microseconds=int(micros)), kind, int(row_id)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _load_sources(rows):
+    """
+    Пакетно загружает документы-основания (GenericForeignKey):
+    один запрос на каждый ContentType вместо запроса на строку.
+    """
+    ids_by_ct = {}
+    for row in rows:
+        if row['source_ct'] is not None:
+            ids_by_ct.setdefault(row['source_ct'], set()).add(row['source_id'])
+
+    sources = {}
+    for ct_id, ids in ids_by_ct.items():
+        model_class = ContentType.objects.get_for_id(ct_id).model_class()
+        if model_class is None:
+            continue
+        qs = model_class._default_manager.filter(pk__in=ids)
+        # __str__ заданий на смену обращается к продукту
+        if any(f.name == 'product' and f.many_to_one for f in model_class._meta.get_fields()):
+            qs = qs.select_related('product')
+        for obj in qs:
+            sources[(ct_id, obj.pk)] = str(obj)
+    return sources
+
+
+def standardize_movement_rows(rows):
+    """
+    Приводит строки UNION-запроса к формату отчета
+    (тот же набор ключей, что и раньше отдавал get_unified_movement_data).
+    """
+    product_types = dict(ProductOperation.OperationType.choices)
+    material_types = dict(MaterialOperation.OPERATION_TYPES)
+    sources = _load_sources(rows)
+
+    result = []
+    for row in rows:
+        if row['row_kind'] == KIND_PRODUCT:
+            warehouse = 'Готовая продукция'
+            operation = product_types.get(row['op_type'], row['op_type'])
+            source = sources.get((row['source_ct'], row['source_id']), 'Ручная операция')
+        else:
+            warehouse = 'Сырье и материалы'
+            operation = material_types.get(row['op_type'], row['op_type'])
+            source = row['category_name'] or 'Приемка'
+        result.append({
+            'timestamp': row['moved_at'],
+            'item_name': row['item_name'],
+            'item_sku': row['item_sku'],
+            'warehouse': warehouse,
+            'operation': operation,
+            'quantity': row['op_quantity'],
+            'user': row['username'] or 'N/A',
+            'source': source,
         })
+    return result
 
-    # 4. Сортируем общий список по дате
-    unified_list.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    return unified_list
 
+class MovementPage:
+    """
+    Страница журнала движения с keyset-пагинацией.
+    Не считает общее количество строк и не использует OFFSET.
+    """
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
 
-def generate_movement_report_excel(operations):
+
+def get_movement_page(filters, per_page, cursor=None):
     """
-    Принимает список операций и генерирует HttpResponse с Excel-файлом.
+    Возвращает одну страницу журнала: берем per_page + 1 строк,
+    лишняя строка говорит о наличии следующей страницы.
     """
-    # Создаем книгу и лист в памяти
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = 'Движение товаров'
+    rows = list(get_unified_movement_queryset(filters, cursor)[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_movement_cursor(rows[-1])
+    return MovementPage(standardize_movement_rows(rows), next_cursor, is_first=cursor is None)
 
-    # 1. Заголовки с форматированием
-    headers = [
-        "Дата и время", "Склад", "Товар/Материал", "Артикул", 
-        "Операция", "Количество", "Пользователь", "Основание/Комментарий"
-    ]
-    
-    for col_num, header_title in enumerate(headers, 1):
-        cell = sheet.cell(row=1, column=col_num, value=header_title)
-        cell.font = Font(bold=True, size=12)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-    
-    # 2. Заполняем данными
-    # 2. Заполняем данными
-    for row_num, op in enumerate(operations, 2):
-        # <<< КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ ЗДЕСЬ >>>
-        # Получаем объект datetime из словаря
-        dt_object = op['timestamp']
-        
-        # Делаем его "наивным" (без часового пояса)
-        # timezone.localtime() сначала переводит в локальное время, 
-        # а .replace(tzinfo=None) затем убирает информацию о таймзоне.
-        naive_datetime = timezone.localtime(dt_object).replace(tzinfo=None)
-        
-        # Записываем уже "наивный" объект в ячейку
-        sheet.cell(row=row_num, column=1, value=naive_datetime)
-        
-        sheet.cell(row=row_num, column=2, value=op['warehouse'])
-        sheet.cell(row=row_num, column=3, value=op['item_name'])
-        sheet.cell(row=row_num, column=4, value=op['item_sku'])
-        sheet.cell(row=row_num, column=5, value=op['operation'])
-        sheet.cell(row=row_num, column=6, value=op['quantity'])
-        sheet.cell(row=row_num, column=7, value=op['user'])
-        sheet.cell(row=row_num, column=8, value=op['source'])
-
-    # 3. Настраиваем ширину колонок
-    column_widths = [20, 15, 30, 15, 15, 12, 15, 30]
-    for i, width in enumerate(column_widths, 1):
-        sheet.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
 
-    # 4. Форматируем даты
-    for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=1, max_col=1):
-        for cell in row:
-            cell.number_format = 'DD.MM.YYYY HH:MM'
+def get_unified_movement_data(filters):
+    """
+    Собирает данные из обоих журналов операций,
+    стандартизирует и возвращает единый отсортированный список.
+    """
+    return standardize_movement_rows(list(get_unified_movement_queryset(filters)))
+
+
+# ==============================================================================
+# Выгрузка журнала движения (потоковая, с постоянным потреблением памяти)
+# ==============================================================================
+
+MOVEMENT_EXPORT_HEADERS = [
+    "Дата и время", "Склад", "Товар/Материал", "Артикул",
+    "Операция", "Количество", "Пользователь", "Основание/Комментарий"
+]
+MOVEMENT_EXPORT_WIDTHS = [20, 15, 30, 15, 15, 12, 15, 30]
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Сколько строк тянуть из серверного курсора за раз
+EXPORT_CHUNK_SIZE = 2000
+
+
+def get_export_max_rows():
+    """Лимит строк выгрузки (settings.REPORT_EXPORT_MAX_ROWS)."""
+    return getattr(settings, 'REPORT_EXPORT_MAX_ROWS', 100000)
+
+
+def iter_movement_rows(filters, max_rows=None):
+    """
+    Генератор строк журнала для выгрузки.
+    Читает UNION-запрос серверным курсором пачками по EXPORT_CHUNK_SIZE,
+    источники подгружаются пакетно для каждой пачки.
+    Последним элементом отдает None, если выгрузка обрезана по лимиту.
+    """
+    max_rows = max_rows or get_export_max_rows()
+    queryset = get_unified_movement_queryset(filters)[:max_rows + 1]
+
+    sent = 0
+    chunk = []
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        if sent + len(chunk) >= max_rows:
+            # Лишняя строка сверх лимита — признак обрезки
+            yield from standardize_movement_rows(chunk)
+            yield None
+            return
+        chunk.append(row)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield from standardize_movement_rows(chunk)
+            sent += len(chunk)
+            chunk = []
+    yield from standardize_movement_rows(chunk)
+
+
+def _truncated_note(max_rows):
+    return f"Выгрузка ограничена {max_rows} строками. Сузьте фильтр."
+
+
+def write_movement_report_xlsx(filters, fileobj, max_rows=None):
+    """
+    Пишет XLSX в fileobj в режиме write_only: строки не держатся в памяти,
+    стили задаются именованными (один стиль на книгу, а не на ячейку).
+    """
+    max_rows = max_rows or get_export_max_rows()
+    workbook = openpyxl.Workbook(write_only=True)
+
+    header_style = NamedStyle(name='movement_header')
+    header_style.font = Font(bold=True, size=12)
+    header_style.alignment = Alignment(horizontal='center', vertical='center')
+    header_style.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+    date_style = NamedStyle(name='movement_date', number_format='DD.MM.YYYY HH:MM')
+    workbook.add_named_style(header_style)
+    workbook.add_named_style(date_style)
 
-    # 5. Замораживаем первую строку (заголовки)
+    sheet = workbook.create_sheet('Движение товаров')
+    # В write_only режиме ширина колонок и закрепление задаются до первой строки
+    for i, width in enumerate(MOVEMENT_EXPORT_WIDTHS, 1):
+        sheet.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
     sheet.freeze_panes = 'A2'
 
-    # 6. Сохраняем файл в буфер
-    buffer = io.BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
+    header_row = []
+    for title in MOVEMENT_EXPORT_HEADERS:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.style = 'movement_header'
+        header_row.append(cell)
+    sheet.append(header_row)
+
+    for op in iter_movement_rows(filters, max_rows):
+        if op is None:
+            sheet.append([_truncated_note(max_rows)])
+            break
+        # Excel не понимает таймзоны — пишем локальное "наивное" время
+        date_cell = WriteOnlyCell(sheet, value=timezone.localtime(op['timestamp']).replace(tzinfo=None))
+        date_cell.style = 'movement_date'
+        sheet.append([
+            date_cell, op['warehouse'], op['item_name'], op['item_sku'],
+            op['operation'], op['quantity'], op['user'], op['source'],
+        ])
+
+    workbook.save(fileobj)
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: write() просто возвращает строку."""
+    def write(self, value):
+        return value
+
+
+def iter_movement_report_csv(filters, max_rows=None):
+    """Генератор строк CSV (разделитель ';' и BOM — чтобы Excel понял кириллицу)."""
+    max_rows = max_rows or get_export_max_rows()
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow(MOVEMENT_EXPORT_HEADERS)
+    for op in iter_movement_rows(filters, max_rows):
+        if op is None:
+            yield writer.writerow([_truncated_note(max_rows)])
+            return
+        yield writer.writerow([
+            timezone.localtime(op['timestamp']).strftime('%d.%m.%Y %H:%M'),
+            op['warehouse'], op['item_name'], op['item_sku'],
+            op['operation'], op['quantity'], op['user'], op['source'],
+        ])
 
-    # 7. Создаем HttpResponse
-    response = HttpResponse(
-        buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def generate_movement_report_excel(filters):
+    """
+    Отдает XLSX потоково. Книга пишется во временный файл
+    (в памяти до 5 МБ, дальше — на диск), затем FileResponse читает его кусками.
+    """
+    tmp = tempfile.SpooledTemporaryFile(max_size=5 * 1024 * 1024)
+    write_movement_report_xlsx(filters, tmp)
+    tmp.seek(0)
+    return FileResponse(
+        tmp, as_attachment=True, filename='movement_report.xlsx', content_type=XLSX_CONTENT_TYPE
     )
-    response['Content-Disposition'] = 'attachment; filename="movement_report.xlsx"'
-    
-    return response
\ No newline at end of file
+
+
+def generate_movement_report_csv(filters):
+    """Отдает CSV через StreamingHttpResponse — строки уходят клиенту по мере чтения курсора."""
+    response = StreamingHttpResponse(
+        iter_movement_report_csv(filters), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = 'attachment; filename="movement_report.csv"'
+    return response
+
+
+# ==============================================================================
+# Неснижаемые остатки
+# ==============================================================================
+
+def get_low_stock_materials():
+    """Материалы с остатком не выше минимума (минимум задан) и сколько нужно докупить."""
+    return Material.objects.filter(
+        quantity__lte=F('min_quantity'), min_quantity__gt=0
+    ).annotate(
+        needed_quantity=F('min_quantity') - F('quantity')
+    ).select_related('unit').order_by('name')
+
+
+def get_low_stock_data():
+    """Отчет по неснижаемым остаткам и прогноз исчерпания в виде JSON (считается фоновым отчетом)."""
+    projections = list(get_stockout_risks())
+    return {
+        'materials': [
+            {
+                'name': material.name,
+                'article': material.article,
+                'quantity': material.quantity,
+                'min_quantity': material.min_quantity,
+                'needed_quantity': material.needed_quantity,
+                'unit': material.unit.short_name,
+            }
+            for material in get_low_stock_materials()
+        ],
+        'projections': [
+            {
+                'name': projection.item.name,
+                'warehouse': projection.get_kind_display(),
+                'quantity': projection.quantity,
+                'unit': projection.material.unit.short_name if projection.material else 'шт.',
+                'daily_usage': round(projection.daily_usage, 2),
+                'days_left': round(projection.days_left, 1),
+                'stockout_date': projection.stockout_date.strftime('%d.%m.%Y') if projection.stockout_date else '',
+            }
+            for projection in projections
+        ],
+        'computed_at': (
+            timezone.localtime(projections[0].computed_at).strftime('%d.%m.%Y %H:%M') if projections else None
+        ),
+    }
+
+
+# ==============================================================================
+# Возраст запасов
+# ==============================================================================
+
+# Колонки отчета о возрасте запасов (порядок важен для UNION).
+# Имена не должны совпадать с полями моделей, поэтому с префиксом.
+AGEING_COLUMNS = [
+    'ageing_name', 'ageing_sku', 'ageing_warehouse', 'ageing_quantity',
+    'ageing_unit', 'ageing_last', 'ageing_days', 'ageing_bucket',
+]
+
+# Корзины возраста: (порог в днях "больше чем", код, подпись)
+AGEING_BUCKETS = [
+    (90, 'stale', 'Более 90 дней'),
+    (30, 'slow', '31–90 дней'),
+]
+AGEING_BUCKET_FRESH = ('fresh', 'До 30 дней')
+AGEING_BUCKET_LABELS = dict([(code, label) for _, code, label in AGEING_BUCKETS] + [AGEING_BUCKET_FRESH])
+AGEING_PAGE_SIZE = 30
+
+
+def _ageing_annotations(name, sku, warehouse, quantity, unit):
+    """Общий набор аннотаций для обеих веток: возраст и корзина считаются в SQL."""
+    age_days = ExtractDay(ExpressionWrapper(Now() - F('last_movement_at'), output_field=DurationField()))
+    return {
+        'ageing_name': F(name),
+        'ageing_sku': F(sku),
+        'ageing_warehouse': Value(warehouse, output_field=CharField()),
+        'ageing_quantity': F(quantity),
+        'ageing_unit': unit,
+        'ageing_last': F('last_movement_at'),
+        'ageing_days': age_days,
+        'ageing_bucket': Case(
+            *[When(ageing_days__gt=days, then=Value(code)) for days, code, _ in AGEING_BUCKETS],
+            default=Value(AGEING_BUCKET_FRESH[0]),
+            output_field=CharField(),
+        ),
+    }
+
+
+def get_stock_ageing_queryset(sort_order='asc'):
+    """
+    Остатки товаров и материалов с датой последнего движения одним UNION-запросом.
+    Дата берется из денормализованного last_movement_at (ведется триггером),
+    сортировка и пагинация выполняются в БД.
+    """
+    products = Product.objects.filter(
+        total_quantity__gt=0, last_movement_at__isnull=False
+    ).annotate(
+        **_ageing_annotations('name', 'sku', 'Готовая продукция', 'total_quantity',
+                              Value('шт.', output_field=CharField()))
+    ).values(*AGEING_COLUMNS)
+
+    materials = Material.objects.filter(
+        quantity__gt=0, last_movement_at__isnull=False
+    ).annotate(
+        **_ageing_annotations('name', 'article', 'Сырье и материалы', 'quantity',
+                              F('unit__short_name'))
+    ).values(*AGEING_COLUMNS)
+
+    ordering = '-ageing_last' if sort_order == 'desc' else 'ageing_last'
+    return products.union(materials, all=True).order_by(ordering, 'ageing_sku')
+
+
+def standardize_ageing_rows(rows):
+    """Приводит строки UNION к виду, который ожидает шаблон отчета."""
+    return [
+        {
+            'name': row['ageing_name'],
+            'sku': row['ageing_sku'],
+            'warehouse': row['ageing_warehouse'],
+            'quantity': row['ageing_quantity'],
+            'unit': row['ageing_unit'],
+            'last_movement': row['ageing_last'],
+            'age_days': row['ageing_days'],
+            'age_bucket': row['ageing_bucket'],
+            'age_bucket_label': AGEING_BUCKET_LABELS[row['ageing_bucket']],
+        }
+        for row in rows
+    ]
+
+
+def get_stock_ageing_data(sort_order='asc', page=1):
+    """Страница отчета по возрасту запасов в виде JSON (считается фоновым отчетом)."""
+    paginator = Paginator(get_stock_ageing_queryset(sort_order), AGEING_PAGE_SIZE)
+    page_obj = paginator.get_page(page)
+    items = standardize_ageing_rows(page_obj.object_list)
+    for item in items:
+        item['last_movement'] = timezone.localtime(item['last_movement']).strftime('%d.%m.%Y %H:%M')
+    return {
+        'items': items,
+        'page': page_obj.number,
+        'num_pages': paginator.num_pages,
+        'count': paginator.count,
+    }
+
+
+# ==============================================================================
+# Продажи (данные для графиков)
+# ==============================================================================
+
+def get_sales_chart_data(period='month'):
+    """
+    Выручка по дням/месяцам за период ('week', 'month', 'year').
+    Читает витрину DailySalesFact. Возвращает {'labels': [...], 'data': [...]} для Chart.js.
+    """
+    today = timezone.localdate()
+
+    # Определяем дату начала и способ группировки
+    if period == 'year':
+        start_date = today - timedelta(days=365)
+        trunc_kind = TruncMonth('day')
+        label_format = '%B %Y' # Формат для метки (напр. "Сентябрь 2025")
+    elif period == 'week':
+        start_date = today - timedelta(days=7)
+        trunc_kind = F('day')
+        label_format = '%d.%m' # Формат для метки (напр. "14.09")
+    else: # По умолчанию 'month'
+        start_date = today - timedelta(days=30)
+        trunc_kind = F('day')
+        label_format = '%d.%m'
+
+    sales_data = DailySalesFact.objects.filter(
+        day__gte=start_date
+    ).annotate(
+        date=trunc_kind
+    ).values(
+        'date'
+    ).annotate(
+        total_revenue=Sum('revenue')
+    ).filter(total_revenue__gt=0).order_by('date')
+
+    return {
+        'labels': [d['date'].strftime(label_format) for d in sales_data],
+        'data': [float(d['total_revenue']) for d in sales_data],
+    }
+
+
+def get_sales_period(start_date=None, end_date=None):
+    """Период по умолчанию — последние 30 дней."""
+    return (start_date or date.today() - timedelta(days=30), end_date or date.today())
+
+
+def get_sales_by_product_data(start_date=None, end_date=None):
+    """Топ-10 товаров по выручке за период (упаковки учитываются по базовому товару)."""
+    start_date, end_date = get_sales_period(start_date, end_date)
+    sales_data = DailySalesFact.objects.filter(
+        day__range=[start_date, end_date]
+    ).values(
+        'product__name' # Группируем по имени продукта
+    ).annotate(
+        total_revenue=Sum('revenue')
+    ).filter(total_revenue__gt=0).order_by('-total_revenue')[:10] # Топ-10 по убыванию выручки
+
+    return {
+        'labels': [item['product__name'] for item in sales_data],
+        'data': [float(item['total_revenue']) for item in sales_data],
+    }
+
+
+def get_sales_by_category_data(start_date=None, end_date=None):
+    """Выручка по категориям за период."""
+    start_date, end_date = get_sales_period(start_date, end_date)
+    category_data = DailySalesFact.objects.filter(
+        day__range=[start_date, end_date]
+    ).values(
+        'category__name' # Группируем по имени категории
+    ).annotate(
+        total_revenue=Sum('revenue')
+    ).filter(total_revenue__gt=0).order_by('-total_revenue')
+
+    return {
+        'labels': [item['category__name'] for item in category_data],
+        'data': [float(item['total_revenue']) for item in category_data],
+    }
+
+
+def rebuild_daily_sales_facts():
+    """
+    Полностью пересобирает витрину DailySalesFact из отгруженных накладных.
+    Возвращает количество созданных строк.
+    """
+    facts = ShipmentItem.objects.filter(
+        shipment__status='shipped', shipment__shipped_at__isnull=False
+    ).annotate(
+        fact_day=TruncDate('shipment__shipped_at'),
+        fact_product=Coalesce('product_id', 'package__product_id'),
+        fact_category=Coalesce('product__category_id', 'package__product__category_id'),
+        fact_is_package=ExpressionWrapper(Q(package__isnull=False), output_field=models.BooleanField()),
+    ).values(
+        'fact_day', 'fact_product', 'fact_category', 'fact_is_package'
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        total_units=Sum(F('quantity') * Coalesce('package__quantity', 1)),
+        total_revenue=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())),
+    ).order_by()
+
+    with transaction.atomic():
+        DailySalesFact.objects.all().delete()
+        created = DailySalesFact.objects.bulk_create([
+            DailySalesFact(
+                day=row['fact_day'], product_id=row['fact_product'], category_id=row['fact_category'],
+                is_package=row['fact_is_package'], quantity=row['total_quantity'],
+                units=row['total_units'], revenue=row['total_revenue'],
+            )
+            for row in facts
+        ], batch_size=1000)
+    return len(created)
@@ -0,0 +1,20 @@
+from celery import shared_task
+from . import analytics, jobs
+
+
+@shared_task
+def run_report_job(job_id):
+    """Формирует фоновый отчет (см. reports.jobs)."""
+    return jobs.run_report_job(job_id)
+
+
+@shared_task
+def purge_expired_report_jobs():
+    """Периодическая очистка устаревших результатов."""
+    return jobs.purge_expired_jobs()
+
+
+@shared_task
+def refresh_stock_projections():
+    """Периодический пересчет прогноза исчерпания остатков."""
+    return analytics.refresh_stock_projections()
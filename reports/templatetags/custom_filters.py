@@ -12,6 +12,12 @@ def remove_param(url_string, param_to_remove):
     if not url_string:
         return ''
     
+    # Голая строка запроса (request.GET.urlencode) — без пути и '?'
+    if '?' not in url_string and '/' not in url_string:
+        query_dict = parse_qs(url_string, keep_blank_values=True)
+        query_dict.pop(param_to_remove, None)
+        return urlencode(query_dict, doseq=True)
+
     # Парсим URL
     parsed = urlparse(url_string)
     query_dict = parse_qs(parsed.query)
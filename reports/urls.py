@@ -9,9 +9,15 @@ urlpatterns = [
     path('sales-by-product/', views.SalesByProductReportView.as_view(), name='sales_by_product_report'),
     path('low-stock-report/', views.LowStockReportView.as_view(), name='low_stock_report'),
     path('stock-ageing/', views.StockAgeingReportView.as_view(), name='stock_ageing_report'),
+    path('abc-xyz/', views.AbcXyzReportView.as_view(), name='abc_xyz_report'),
     path('audit/', views.ShipmentAuditListView.as_view(), name='shipment_audit_list'),
     # URL для API, к которому будет обращаться JavaScript для получения данных
     path('api/sales-chart-data/', views.sales_chart_data_api, name='sales_chart_data_api'),
     path('api/sales-by-product-data/', views.sales_by_product_api, name='sales_by_product_api'),
     path('api/sales-by-category-data/', views.sales_by_category_api, name='sales_by_category_api'),
+    path('api/abc-xyz-data/', views.abc_xyz_api, name='abc_xyz_api'),
+    # Фоновые отчеты
+    path('jobs/submit/', views.report_job_submit, name='report_job_submit'),
+    path('jobs/<int:pk>/status/', views.report_job_status, name='report_job_status'),
+    path('jobs/<int:pk>/download/', views.report_job_download, name='report_job_download'),
 ]
\ No newline at end of file
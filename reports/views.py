@@ -1,18 +1,23 @@
 from django.views.generic import TemplateView, FormView
 from django.http import JsonResponse
-from django.db.models import Sum, F, Max
-from django.db.models.functions import TruncDay, TruncMonth
-from django.utils import timezone
-from datetime import timedelta, date
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.core.paginator import Paginator
-from reports.servises import get_unified_movement_data, generate_movement_report_excel
+from reports.servises import (generate_movement_report_excel, generate_movement_report_csv,
+    get_movement_page, decode_movement_cursor, MovementPage, get_sales_chart_data,
+    get_sales_by_product_data, get_sales_by_category_data)
+from reports.analytics import get_abc_xyz_data
+from reports.jobs import submit_report_job, user_can_run, get_report_type
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
-from warehouse1.models import Material
 from .forms import MovementReportFilterForm, DateRangeFilterForm
-from warehouse2.models import Shipment, ShipmentItem, Product
-from reports.models import ShipmentAuditLog
+from reports.models import ShipmentAuditLog, ReportJob
+from warehouse.db_router import ReplicaReadMixin, read_from_replica
 
 
 class ReportsHomeView(LoginRequiredMixin, TemplateView):
@@ -32,81 +37,72 @@ class SalesOverTimeView(LoginRequiredMixin, TemplateView):
     template_name = 'reports/sales_over_time.html'
 
 @login_required
+@read_from_replica
 def sales_chart_data_api(request):
     """
     API, которое возвращает данные для графика продаж.
     Принимает GET-параметр 'period' ('week', 'month', 'year').
     """
-    # 1. Получаем период из запроса, по умолчанию - 'month'
-    period = request.GET.get('period', 'month')
-    today = timezone.now()
-    
-    # 2. Определяем дату начала и способ группировки (trunc_kind)
-    if period == 'year':
-        start_date = today - timedelta(days=365)
-        trunc_kind = TruncMonth('shipped_at')
-        label_format = '%B %Y' # Формат для метки (напр. "Сентябрь 2025")
-    elif period == 'week':
-        start_date = today - timedelta(days=7)
-        trunc_kind = TruncDay('shipped_at')
-        label_format = '%d.%m' # Формат для метки (напр. "14.09")
-    else: # По умолчанию 'month'
-        start_date = today - timedelta(days=30)
-        trunc_kind = TruncDay('shipped_at')
-        label_format = '%d.%m'
-
-    # 3. Выполняем запрос к БД с учетом периода и группировки
-    sales_data = Shipment.objects.filter(
-        status='shipped',
-        shipped_at__gte=start_date
-    ).select_related(
-        # добавьте связанные модели если нужно
-    ).prefetch_related(
-        'items'  # предзагрузка связанных items
-    ).annotate(
-        date=trunc_kind
-    ).values(
-        'date'
-    ).annotate(
-        total_revenue=Sum(F('items__price') * F('items__quantity'))
-    ).order_by('date')
-
-    # 4. Форматируем данные для графика
-    labels = [d['date'].strftime(label_format) for d in sales_data]
-    data = [float(d['total_revenue']) for d in sales_data]
-
-    return JsonResponse({
-        'labels': labels,
-        'data': data,
-    })
-
-
-class MovementReportView(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
+    return JsonResponse(get_sales_chart_data(request.GET.get('period', 'month')))
+
+
+class AbcXyzReportView(LoginRequiredMixin, FormView):
+    """
+    Страница ABC/XYZ-анализа. Расчет запускается фоновым отчетом из JavaScript.
+    """
+    template_name = 'reports/abc_xyz_report.html'
+    form_class = DateRangeFilterForm
+
+
+@login_required
+@read_from_replica
+def abc_xyz_api(request):
+    """
+    API ABC/XYZ-анализа: классы товаров за период (по умолчанию — 26 недель).
+    """
+    form = DateRangeFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid date format'}, status=400)
+
+    return JsonResponse(get_abc_xyz_data(
+        form.cleaned_data.get('start_date'), form.cleaned_data.get('end_date')
+    ))
+
+
+class MovementReportView(LoginRequiredMixin, PermissionRequiredMixin, ReplicaReadMixin, TemplateView):
     template_name = 'reports/movement_report.html'
     permission_required = 'reports.view_purchases_report'
     raise_exception = True
 
     def get(self, request, *args, **kwargs):
         form = MovementReportFilterForm(request.GET or None)
-        operations = []
-        
-        if form.is_valid():
-            operations = get_unified_movement_data(form.cleaned_data)
-
-        # Проверяем, если запрос на выгрузку в Excel
-        if 'export_excel' in request.GET:
-            return generate_movement_report_excel(operations)
+        # Без фильтров — весь журнал; с ошибочными фильтрами — пустая страница с ошибками формы
+        invalid = form.is_bound and not form.is_valid()
+        filters = form.cleaned_data if form.is_bound and not invalid else {}
+
+        # Проверяем, если запрос на выгрузку (Excel или CSV)
+        export_format = 'csv' if 'export_csv' in request.GET else 'xlsx' if 'export_excel' in request.GET else None
+        if export_format and not invalid:
+            if 'export_background' in request.GET or getattr(settings, 'REPORT_EXPORT_IN_BACKGROUND', False):
+                return self.start_background_export(request, export_format)
+            if export_format == 'csv':
+                return generate_movement_report_csv(filters)
+            return generate_movement_report_excel(filters)
         
         # Если не экспорт, то продолжаем с пагинацией и рендерингом
         try:
             per_page = int(request.GET.get('per_page', 25))
             if per_page > 500: per_page = 500 # Ограничение
+            if per_page < 1: per_page = 25
         except (ValueError, TypeError):
             per_page = 25
-            
-        paginator = Paginator(operations, per_page)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+
+        # Keyset-пагинация: страница начинается сразу после курсора (?after=...)
+        if invalid:
+            page_obj = MovementPage([], None, is_first=True)
+        else:
+            cursor = decode_movement_cursor(request.GET.get('after'))
+            page_obj = get_movement_page(filters, per_page, cursor)
         
         context = {
             'filter_form': form,
@@ -115,6 +111,26 @@ class MovementReportView(LoginRequiredMixin, PermissionRequiredMixin, TemplateVi
             'per_page_options': [25, 50, 100, 200, 500]
         }
         return self.render_to_response(context)
+
+    def start_background_export(self, request, export_format):
+        """Ставит выгрузку в очередь фоновых отчетов и возвращает на страницу отчета."""
+        params = {name: request.GET.get(name, '') for name in MovementReportFilterForm.base_fields}
+        try:
+            job, created = submit_report_job(f'movement_{export_format}', params, request.user)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            job = created = None
+        if job:
+            download_url = reverse('report_job_download', kwargs={'pk': job.pk})
+            if created:
+                messages.info(request, f"Выгрузка формируется в фоне. Файл будет доступен по ссылке: {download_url}")
+            else:
+                messages.info(request, f"Такая выгрузка уже есть (статус: {job.get_status_display()}): {download_url}")
+        query = request.GET.copy()
+        for name in ('export_excel', 'export_csv', 'export_background'):
+            query.pop(name, None)
+        return redirect(f"{reverse('movement_report')}?{query.urlencode()}")
+
     
 class SalesByProductReportView(LoginRequiredMixin, FormView):
     """
@@ -125,6 +141,7 @@ class SalesByProductReportView(LoginRequiredMixin, FormView):
 
 
 @login_required
+@read_from_replica
 def sales_by_product_api(request):
     """
     API для отчета "Топ-10 товаров по выручке".
@@ -133,27 +150,13 @@ def sales_by_product_api(request):
     if not form.is_valid():
         return JsonResponse({'error': 'Invalid date format'}, status=400)
 
-    # Устанавливаем период по умолчанию (последние 30 дней), если даты не указаны
-    start_date = form.cleaned_data.get('start_date') or date.today() - timedelta(days=30)
-    end_date = form.cleaned_data.get('end_date') or date.today()
-
-    # Агрегируем данные: группируем по товару и считаем сумму продаж
-    sales_data = ShipmentItem.objects.filter(
-        shipment__status='shipped',
-        shipment__shipped_at__date__range=[start_date, end_date]
-    ).values(
-        'product__name' # Группируем по имени продукта
-    ).annotate(
-        total_revenue=Sum(F('price') * F('quantity'))
-    ).order_by('-total_revenue')[:10] # Сортируем по убыванию выручки и берем топ-10
-
-    labels = [item['product__name'] for item in sales_data]
-    data = [float(item['total_revenue']) for item in sales_data]
-    
-    return JsonResponse({'labels': labels, 'data': data})
+    return JsonResponse(get_sales_by_product_data(
+        form.cleaned_data.get('start_date'), form.cleaned_data.get('end_date')
+    ))
 
 
 @login_required
+@read_from_replica
 def sales_by_category_api(request):
     """
     API для отчета "Выручка по категориям".
@@ -162,117 +165,41 @@ def sales_by_category_api(request):
     if not form.is_valid():
         return JsonResponse({'error': 'Invalid date format'}, status=400)
 
-    start_date = form.cleaned_data.get('start_date') or date.today() - timedelta(days=30)
-    end_date = form.cleaned_data.get('end_date') or date.today()
-
-    # Агрегируем данные: группируем по категории и считаем сумму
-    category_data = ShipmentItem.objects.filter(
-        shipment__status='shipped',
-        shipment__shipped_at__date__range=[start_date, end_date]
-    ).values(
-        'product__category__name' # Группируем по имени категории
-    ).annotate(
-        total_revenue=Sum(F('price') * F('quantity'))
-    ).order_by('-total_revenue')
-
-    labels = [item['product__category__name'] for item in category_data]
-    data = [float(item['total_revenue']) for item in category_data]
-
-    return JsonResponse({'labels': labels, 'data': data})
+    return JsonResponse(get_sales_by_category_data(
+        form.cleaned_data.get('start_date'), form.cleaned_data.get('end_date')
+    ))
 
 
-class LowStockReportView(LoginRequiredMixin, ListView):
+class LowStockReportView(LoginRequiredMixin, TemplateView):
     """
-    Отображает список материалов, количество которых
-    ниже или равно минимально допустимому.
+    Материалы, количество которых ниже или равно минимально допустимому,
+    и прогноз исчерпания. Данные считает фоновый отчет, страница его опрашивает.
     """
-    model = Material
     template_name = 'reports/low_stock_report.html'
-    context_object_name = 'materials'
 
-    def get_queryset(self):
-        # Выбираем материалы, где текущее кол-во <= минимальному,
-        # и где минимальное кол-во вообще задано (больше 0)
-        queryset = Material.objects.filter(
-            quantity__lte=F('min_quantity'),
-            min_quantity__gt=0
-        ).annotate(
-            # "На лету" вычисляем, сколько нужно докупить
-            needed_quantity=F('min_quantity') - F('quantity')
-        ).order_by('name')
-        
-        return queryset
-    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['horizon_days'] = getattr(settings, 'STOCK_PROJECTION_HORIZON_DAYS', 14)
+        return context
 
-class StockAgeingReportView(LoginRequiredMixin, ListView):
+
+class StockAgeingReportView(LoginRequiredMixin, TemplateView):
     """
     Отчет по возрасту запасов.
     Показывает товары/материалы, сортируя их по дате последнего движения.
+    Страницу отчета считает фоновый отчет, страница его опрашивает.
     """
     template_name = 'reports/stock_ageing_report.html'
-    context_object_name = 'items'
-    paginate_by = 30 # Можно настроить
 
-    def get_queryset(self):
-        # 1. Получаем параметр сортировки из URL (по умолчанию 'asc' - старые вверху)
-        sort_order = self.request.GET.get('sort', 'asc')
-        today = timezone.now()
-
-        # 2. Эффективно находим дату последнего движения для всех Продуктов
-        # annotate() добавляет к каждому продукту новое "виртуальное" поле last_movement
-        products_with_age = Product.objects.filter(
-            total_quantity__gt=0
-        ).annotate(
-            last_movement=Max('operations__timestamp') # Ищем макс. дату среди связанных операций
-        ).exclude(last_movement=None) # Исключаем те, где движений не было вообще
-
-        # 3. То же самое для Материалов
-        materials_with_age = Material.objects.filter(
-            quantity__gt=0
-        ).annotate(
-            last_movement=Max('materialoperation__date') # Обратите внимание на 'materialoperation__date'
-        ).exclude(last_movement=None)
-
-        # 4. Стандартизируем и объединяем данные в единый список
-        combined_list = []
-        for p in products_with_age:
-            combined_list.append({
-                'name': p.name,
-                'sku': p.sku,
-                'warehouse': 'Готовая продукция',
-                'quantity': p.total_quantity,
-                'unit': 'шт.',
-                'last_movement': p.last_movement,
-                'age_days': (today - p.last_movement).days,
-            })
-        
-        for m in materials_with_age:
-            combined_list.append({
-                'name': m.name,
-                'sku': m.article,
-                'warehouse': 'Сырье и материалы',
-                'quantity': m.quantity,
-                'unit': m.unit.short_name,
-                'last_movement': m.last_movement,
-                'age_days': (today - m.last_movement).days,
-            })
-
-        # 5. Сортируем итоговый список в Python
-        # reverse=False (asc) -> старые даты вверху (залежавшиеся)
-        # reverse=True (desc) -> новые даты вверху (ходовые)
-        is_descending = sort_order == 'desc'
-        combined_list.sort(key=lambda item: item['last_movement'], reverse=is_descending)
-
-        return combined_list
-    
     def get_context_data(self, **kwargs):
-        # Передаем в шаблон текущий порядок сортировки для подсветки кнопок
+        # asc -> залежавшиеся вверху, desc -> ходовые вверху
         context = super().get_context_data(**kwargs)
-        context['current_sort'] = self.request.GET.get('sort', 'asc')
+        context['current_sort'] = 'desc' if self.request.GET.get('sort') == 'desc' else 'asc'
+        context['current_page'] = self.request.GET.get('page', '1')
         return context
-    
 
-class ShipmentAuditListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+
+class ShipmentAuditListView(LoginRequiredMixin, PermissionRequiredMixin, ReplicaReadMixin, ListView):
     model = ShipmentAuditLog
     template_name = 'reports/audit_list.html'
     context_object_name = 'logs'
@@ -297,4 +224,65 @@ class ShipmentAuditListView(LoginRequiredMixin, PermissionRequiredMixin, ListVie
         """Добавляем дополнительные данные в шаблон (например, для заголовков)"""
         context = super().get_context_data(**kwargs)
         context['shipment_id'] = self.request.GET.get('shipment_id')
-        return context
\ No newline at end of file
+        return context
+
+
+# ==============================================================================
+# Фоновые отчеты (ReportJob): постановка, статус, скачивание
+# ==============================================================================
+
+def _report_job_payload(job):
+    """Ответ для опроса со страницы отчета."""
+    payload = {'id': job.pk, 'report_type': job.report_type, 'status': job.status}
+    if job.status == ReportJob.Status.DONE:
+        if job.result_file:
+            payload['download_url'] = reverse('report_job_download', kwargs={'pk': job.pk})
+        else:
+            payload['result'] = job.result
+    elif job.status == ReportJob.Status.FAILED:
+        payload['error'] = job.error
+    return payload
+
+
+@login_required
+@require_POST
+def report_job_submit(request):
+    """
+    Ставит отчет в очередь. POST: report_type + параметры отчета.
+    Если такой же отчет уже считается или есть свежий результат — отдаем его.
+    """
+    report_type = request.POST.get('report_type', '')
+    try:
+        get_report_type(report_type)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    if not user_can_run(request.user, report_type):
+        return JsonResponse({'error': 'Недостаточно прав'}, status=403)
+
+    params = {key: value for key, value in request.POST.items() if key not in ('report_type', 'csrfmiddlewaretoken')}
+    try:
+        job, created = submit_report_job(report_type, params, request.user)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    return JsonResponse(_report_job_payload(job), status=202 if created else 200)
+
+
+@login_required
+def report_job_status(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk)
+    if not user_can_run(request.user, job.report_type):
+        return JsonResponse({'error': 'Недостаточно прав'}, status=403)
+    return JsonResponse(_report_job_payload(job))
+
+
+@login_required
+def report_job_download(request, pk):
+    """Скачивание файла готового отчета."""
+    job = get_object_or_404(ReportJob, pk=pk)
+    if not user_can_run(request.user, job.report_type):
+        raise Http404
+    if job.status != ReportJob.Status.DONE or not job.result_file:
+        messages.warning(request, f"Отчет еще не готов (статус: {job.get_status_display()}). Обновите страницу позже.")
+        return redirect('reports_home')
+    extension = get_report_type(job.report_type).get('extension', 'dat')
+    return FileResponse(job.result_file.open('rb'), as_attachment=True, filename=f"{job.report_type}.{extension}")
@@ -0,0 +1,91 @@
+// Живая доска производства: опрос счетчиков с If-None-Match и точечное обновление карточек.
+// Подключение: <script src=".../production_board.js" data-state-url="{% url 'production_board_state' %}" data-poll-seconds="5"></script>
+(function () {
+    const script = document.currentScript;
+    const url = script && script.dataset.stateUrl;
+    if (!url || !window.fetch) {
+        return;
+    }
+    const interval = (parseInt(script.dataset.pollSeconds, 10) || 5) * 1000;
+
+    function setText(id, text) {
+        const el = document.getElementById(id);
+        if (el) el.innerText = text;
+    }
+
+    function setWidth(id, done, total) {
+        const el = document.getElementById(id);
+        if (el && total) el.style.width = Math.min(100, (done / total) * 100) + '%';
+    }
+
+    // Карточка задания (страница заказа)
+    function patchWorkOrder(data) {
+        const id = data.work_order_id;
+        if (!document.getElementById(`row-${id}`)) return;
+
+        setText(`produced-${id}`, data.new_produced);
+        setText(`remaining-text-${id}`, `${data.remaining} шт`);
+        setWidth(`progress-${id}`, data.new_produced, data.total_qty);
+
+        const badge = document.getElementById(`badge-${id}`);
+        if (badge) {
+            badge.className = `table__status table__status--${data.status_class}`;
+            badge.innerText = data.status_label;
+        }
+        if (data.is_completed) {
+            const actions = document.getElementById(`action-area-${id}`);
+            if (actions) actions.innerHTML = '';
+            const icon = document.getElementById(`done-icon-${id}`);
+            if (icon) icon.style.display = 'flex';
+        }
+    }
+
+    // Карточка заказа (доска заданий)
+    function patchOrder(data) {
+        const id = data.order_id;
+        if (!id || !document.getElementById(`order-card-${id}`)) return;
+
+        setText(`order-produced-${id}`, `${data.order_produced} шт`);
+        setText(`order-status-${id}`, data.order_status_label);
+        setWidth(`order-progress-${id}`, data.order_produced, data.order_requested);
+    }
+
+    // id карточек, которые есть на странице: order-card-12 -> 12
+    function idsOf(prefix) {
+        return Array.from(document.querySelectorAll(`[id^="${prefix}"]`))
+            .map(el => el.id.slice(prefix.length))
+            .filter(id => /^\d+$/.test(id))
+            .join(',');
+    }
+
+    const params = new URLSearchParams({orders: idsOf('order-card-'), work_orders: idsOf('row-')});
+    if (!params.get('orders') && !params.get('work_orders')) {
+        return;
+    }
+    const stateUrl = `${url}?${params}`;
+    let etag = null;
+
+    function poll() {
+        // Вкладка в фоне — не опрашиваем, обновимся при возврате
+        if (document.hidden) {
+            setTimeout(poll, interval);
+            return;
+        }
+        const headers = etag ? {'If-None-Match': etag} : {};
+        fetch(stateUrl, {headers: headers, credentials: 'same-origin'})
+            .then(response => {
+                if (response.status === 304 || !response.ok) return null;
+                etag = response.headers.get('ETag');
+                return response.json();
+            })
+            .then(state => {
+                if (!state) return;
+                state.work_orders.forEach(patchWorkOrder);
+                state.orders.forEach(patchOrder);
+            })
+            .catch(error => console.error('Ошибка обновления доски производства:', error))
+            .finally(() => setTimeout(poll, interval));
+    }
+
+    setTimeout(poll, interval);
+})();
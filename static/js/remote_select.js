@@ -0,0 +1,89 @@
+// Выбор объекта поиском на сервере (см. main/widgets.py: RemoteSelect).
+// <select data-remote-url="..."> содержит только выбранный вариант; рядом появляется строка поиска,
+// найденное подставляется в select (событие change). Страницы со своим интерфейсом
+// (data-remote-manual) используют RemoteSelect.search / RemoteSelect.setValue.
+(function () {
+    // Ответ запоминается ненадолго: повторный набор того же запроса не идет на сервер,
+    // но данные (в т.ч. остаток) не живут все время жизни страницы
+    const CACHE_MS = 30000;
+    const cache = new Map();
+
+    function search(select, query) {
+        const base = select.dataset.remoteUrl;
+        const url = `${base}${base.includes('?') ? '&' : '?'}q=${encodeURIComponent(query)}`;
+        const cached = cache.get(url);
+        if (cached && Date.now() - cached.at < CACHE_MS) {
+            return cached.results;
+        }
+        const results = fetch(url)
+            .then(r => r.json())
+            .then(data => data.results || [])
+            .catch(() => {
+                cache.delete(url);
+                return [];
+            });
+        cache.set(url, {results: results, at: Date.now()});
+        return results;
+    }
+
+    function setValue(select, id, label) {
+        let option = Array.from(select.options).find(o => o.value === String(id));
+        if (!option) {
+            option = new Option(label, id);
+            select.add(option);
+        }
+        select.value = String(id);
+        select.dispatchEvent(new Event('change', { bubbles: true }));
+    }
+
+    function attach(select) {
+        const minLength = parseInt(select.dataset.minLength || '2', 10);
+        const wrapper = document.createElement('div');
+        wrapper.className = 'position-relative mb-1';
+        const input = document.createElement('input');
+        input.type = 'text';
+        input.className = 'form-control';
+        input.placeholder = 'Поиск...';
+        const results = document.createElement('div');
+        results.className = 'list-group position-absolute w-100';
+        results.style.zIndex = 1000;
+        results.style.display = 'none';
+        wrapper.append(input, results);
+        select.parentNode.insertBefore(wrapper, select);
+
+        let timer = null;
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (query.length < minLength) {
+                results.style.display = 'none';
+                return;
+            }
+            timer = setTimeout(() => search(select, query).then(items => {
+                results.innerHTML = '';
+                items.forEach(item => {
+                    const btn = document.createElement('button');
+                    btn.type = 'button';
+                    btn.className = 'list-group-item list-group-item-action';
+                    btn.textContent = item.name;
+                    btn.onclick = () => {
+                        setValue(select, item.id, item.name);
+                        input.value = '';
+                        results.style.display = 'none';
+                    };
+                    results.appendChild(btn);
+                });
+                if (!items.length) {
+                    results.innerHTML = '<div class="list-group-item text-muted">Не найдено</div>';
+                }
+                results.style.display = 'block';
+            }), 250);
+        });
+    }
+
+    window.RemoteSelect = { search, setValue, attach };
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('select[data-remote-url]:not([data-remote-manual])').forEach(attach);
+    });
+})();
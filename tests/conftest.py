@@ -26,6 +26,14 @@ def disable_signals():
     post_save.connect(receiver=trigger_product_sync, sender=Product)
     post_save.connect(receiver=trigger_stock_update_on_operation, sender=ProductOperation)
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кэш Django (LocMem) живет весь прогон — ответы поиска и отчеты не должны перетекать между тестами."""
+    from django.core.cache import cache
+    cache.clear()
+    yield
+
+
 @pytest.fixture(autouse=True)
 def mock_external_requests(mocker):
     """
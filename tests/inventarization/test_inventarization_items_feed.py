@@ -0,0 +1,85 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from inventarization.models import InventoryCount, InventoryCountItem
+from warehouse1.models import Material
+from warehouse2.models import Product
+
+
+def _fill(count, n, start=0, unit=None, category=None):
+    """n товаров и n материалов в переучете; у четных позиций есть расхождение"""
+    ct_product = ContentType.objects.get_for_model(Product)
+    ct_material = ContentType.objects.get_for_model(Material)
+    items = []
+    for i in range(start, start + n):
+        product = Product.objects.create(name=f"Товар {i}", sku=f"FEED-{i}", total_quantity=10)
+        material = Material.objects.create(name=f"Материал {i}", article=f"FEED-M-{i}", category=category, unit=unit, quantity=5)
+        items += [
+            InventoryCountItem(inventory_count=count, content_type=ct_product, object_id=product.pk,
+                               system_quantity=10, actual_quantity=10 + (i % 2 == 0)),
+            InventoryCountItem(inventory_count=count, content_type=ct_material, object_id=material.pk,
+                               system_quantity=5, actual_quantity=5),
+        ]
+    InventoryCountItem.objects.bulk_create(items)
+
+
+@pytest.mark.django_db
+class TestWorkScreen:
+    def test_query_count_does_not_grow_with_items(self, client, user, unit_of_measure, material_category):
+        count = InventoryCount.objects.create(user=user, status='in_progress')
+        client.force_login(user)
+        url = reverse('count_work', kwargs={'pk': count.pk})
+        _fill(count, 2, unit=unit_of_measure, category=material_category)
+        with CaptureQueriesContext(connection) as few:
+            client.get(url)
+        _fill(count, 20, start=2, unit=unit_of_measure, category=material_category)
+        with CaptureQueriesContext(connection) as many:
+            response = client.get(url)
+        assert len(many) == len(few)
+        assert response.context['items_total'] == 44
+        assert not any(hasattr(item, 'update_form') for item in response.context['items'])
+
+    def test_paginated_with_feed(self, client, user, settings, unit_of_measure, material_category):
+        settings.INVENTORY_ITEMS_PAGE_SIZE = 3
+        count = InventoryCount.objects.create(user=user, status='in_progress')
+        _fill(count, 3, unit=unit_of_measure, category=material_category)
+        client.force_login(user)
+
+        response = client.get(reverse('count_work', kwargs={'pk': count.pk}))
+        assert len(response.context['items']) == 3
+        assert 'load-more-items' in response.content.decode()
+
+        feed = reverse('inventory_count_items', kwargs={'pk': count.pk})
+        data = client.get(feed, {'page': 2, 'partial': 1}).json()
+        assert data['total'] == 6 and data['next_page'] is None
+        assert len(data['items']) == len(data['html']) == 3
+        shown = {item.pk for item in response.context['items']} | {item['id'] for item in data['items']}
+        assert shown == set(count.items.values_list('pk', flat=True))
+        assert f'data-item-id="{data["items"][0]["id"]}"' in data['html'][0]
+
+
+@pytest.mark.django_db
+class TestReconcileScreen:
+    def test_query_count_and_discrepancy(self, client, staff_user, unit_of_measure, material_category):
+        count = InventoryCount.objects.create(user=staff_user, status='completed')
+        client.force_login(staff_user)
+        url = reverse('count_reconcile', kwargs={'pk': count.pk})
+        _fill(count, 2, unit=unit_of_measure, category=material_category)
+        with CaptureQueriesContext(connection) as few:
+            client.get(url)
+        _fill(count, 20, start=2, unit=unit_of_measure, category=material_category)
+        with CaptureQueriesContext(connection) as many:
+            response = client.get(url)
+        assert len(many) == len(few)
+        assert response.context['total_items'] == 44
+        assert response.context['discrepancy_count'] == 11
+
+    def test_feed_requires_permission(self, client, user, staff_user):
+        count = InventoryCount.objects.create(user=user, status='completed')
+        feed = reverse('inventory_count_items', kwargs={'pk': count.pk})
+        client.force_login(user)
+        assert client.get(feed, {'screen': 'reconcile'}).status_code == 403
+        client.force_login(staff_user)
+        assert client.get(feed, {'screen': 'reconcile', 'partial': 1}).json()['success']
@@ -0,0 +1,109 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from inventarization.models import InventoryCount, InventoryCountItem
+from warehouse1.models import Material, MaterialOperation
+from warehouse2.models import Product, ProductOperation
+
+
+def _make_count(user, products, materials, status='completed'):
+    """Переучет: у каждого товара/материала факт = система + 1"""
+    count = InventoryCount.objects.create(user=user, status=status)
+    ct_product = ContentType.objects.get_for_model(Product)
+    ct_material = ContentType.objects.get_for_model(Material)
+    InventoryCountItem.objects.bulk_create(
+        [
+            InventoryCountItem(inventory_count=count, content_type=ct_product, object_id=p.pk,
+                               system_quantity=p.total_quantity, actual_quantity=p.total_quantity + 1)
+            for p in products
+        ] + [
+            InventoryCountItem(inventory_count=count, content_type=ct_material, object_id=m.pk,
+                               system_quantity=m.quantity, actual_quantity=m.quantity + 1)
+            for m in materials
+        ]
+    )
+    return count
+
+
+def _products(n, start=0):
+    return [
+        Product.objects.create(name=f"Товар {i}", sku=f"BULK-{i}", total_quantity=10) for i in range(start, start + n)
+    ]
+
+
+def _apply_all(client, count):
+    return client.post(reverse('inventory_ajax', kwargs={'pk': count.pk}), {'action': 'apply_all_variances'})
+
+
+@pytest.mark.django_db
+class TestApplyAllVariances:
+    def test_applies_every_pending_variance(self, client, staff_user, material):
+        products = _products(3)
+        count = _make_count(staff_user, products, [material])
+        # Уже сверенная позиция и позиция без расхождения не трогаются
+        done = count.items.get(object_id=products[0].pk, content_type__model='product')
+        done.reconciliation_status = InventoryCountItem.ReconciliationStatus.RECONCILED
+        done.save()
+        zero = count.items.get(object_id=products[1].pk, content_type__model='product')
+        zero.actual_quantity = zero.system_quantity
+        zero.save()
+        client.force_login(staff_user)
+
+        response = _apply_all(client, count)
+
+        assert response.json() == {'status': 'success', 'applied': 2}
+        assert list(Product.objects.order_by('pk').values_list('total_quantity', flat=True)) == [10, 10, 11]
+        material.refresh_from_db()
+        assert material.quantity == 101
+        assert ProductOperation.objects.get(operation_type='adjustment').quantity == 1
+        assert MaterialOperation.objects.get(operation_type='adjustment').comment.endswith("Корректировка: 1")
+        assert not count.items.filter(
+            reconciliation_status=InventoryCountItem.ReconciliationStatus.PENDING
+        ).exclude(pk=zero.pk).exists()
+
+        # Повтор ничего не задваивает
+        assert _apply_all(client, count).json()['applied'] == 0
+        assert ProductOperation.objects.filter(operation_type='adjustment').count() == 1
+
+    def test_journal_follows_stock_moved_during_count(self, client, staff_user):
+        """Снимок 100, за время пересчета отгрузили 5, насчитали 90: в журнал -5, а не -10"""
+        product = Product.objects.create(name="Ходовой", sku="MOVED-1", total_quantity=100)
+        count = InventoryCount.objects.create(user=staff_user, status='completed')
+        InventoryCountItem.objects.create(
+            inventory_count=count, content_type=ContentType.objects.get_for_model(Product), object_id=product.pk,
+            system_quantity=100, actual_quantity=90,
+        )
+        Product.objects.filter(pk=product.pk).update(total_quantity=95)
+        client.force_login(staff_user)
+
+        assert _apply_all(client, count).json()['applied'] == 1
+
+        product.refresh_from_db()
+        assert product.total_quantity == 90
+        assert ProductOperation.objects.get(operation_type='adjustment').quantity == -5
+
+    def test_query_count_does_not_grow_with_items(self, client, staff_user):
+        client.force_login(staff_user)
+        small = _make_count(staff_user, _products(2), [])
+        with CaptureQueriesContext(connection) as few:
+            _apply_all(client, small)
+        large = _make_count(staff_user, _products(20, start=2), [])
+        with CaptureQueriesContext(connection) as many:
+            _apply_all(client, large)
+        assert len(many) == len(few)
+
+    def test_rejected_unless_completed(self, client, staff_user):
+        count = _make_count(staff_user, _products(1), [], status='in_progress')
+        client.force_login(staff_user)
+        assert _apply_all(client, count).status_code == 400
+        assert not ProductOperation.objects.exists()
+
+    def test_finalize_after_apply_all(self, client, staff_user, material):
+        count = _make_count(staff_user, _products(2), [material])
+        client.force_login(staff_user)
+        _apply_all(client, count)
+        client.post(reverse('count_finalize', kwargs={'pk': count.pk}))
+        count.refresh_from_db()
+        assert count.status == InventoryCount.Status.RECONCILED
@@ -0,0 +1,83 @@
+import json
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from inventarization.models import InventoryCount, InventoryCountItem
+from warehouse2.models import Product
+
+
+@pytest.fixture
+def inventory_count(user):
+    return InventoryCount.objects.create(user=user, status='in_progress')
+
+
+def _post(client, inventory_count, scans, partial=False):
+    url = reverse('inventory_scan_batch', kwargs={'pk': inventory_count.pk})
+    if partial:
+        url += '?partial=1'
+    return client.post(url, data=json.dumps({'scans': scans}), content_type='application/json')
+
+
+def _counted(inventory_count):
+    return {item.content_object.pk: item.actual_quantity for item in inventory_count.items.all()}
+
+
+@pytest.mark.django_db
+class TestInventoryScanBatch:
+    def test_add_set_package_and_barcode(self, client, user, inventory_count, product, package, material):
+        client.force_login(user)
+        response = _post(client, inventory_count, [
+            {'code': product.barcode},                                   # +1 по штрихкоду
+            {'code': f'package-{package.pk}', 'quantity': 2},             # упаковка -> товар
+            {'code': f'material-{material.pk}', 'quantity': 7, 'mode': 'set'},
+        ])
+        assert response.json()['success']
+        assert InventoryCountItem.objects.get(object_id=product.pk).system_quantity == product.available_quantity
+
+        _post(client, inventory_count, [
+            {'code': f'product-{product.pk}', 'quantity': 4},
+            {'code': material.barcode, 'quantity': 5, 'mode': 'set'},
+            {'code': material.barcode, 'quantity': 1},
+        ])
+        items = {item.content_type.model: item.actual_quantity for item in inventory_count.items.all()}
+        assert items == {'product': 7, 'material': 6}
+
+    def test_unknown_codes_reported_rest_applied(self, client, user, inventory_count, product):
+        client.force_login(user)
+        data = _post(client, inventory_count, [
+            {'code': 'nope'}, {'code': product.barcode, 'quantity': 3}, {'quantity': 1},
+        ]).json()
+        assert not data['success']
+        assert set(data['errors']) == {'0', '2'}
+        assert _counted(inventory_count) == {product.pk: 3}
+
+    def test_rejected_for_closed_count(self, client, user, inventory_count, product):
+        inventory_count.status = InventoryCount.Status.COMPLETED
+        inventory_count.save()
+        client.force_login(user)
+        assert _post(client, inventory_count, [{'code': product.barcode}]).status_code == 400
+        assert not inventory_count.items.exists()
+
+    def test_recount_resets_status_and_returns_rows(self, client, user, inventory_count, product):
+        item = InventoryCountItem.objects.create(
+            inventory_count=inventory_count, content_object=product, system_quantity=80, actual_quantity=1,
+            reconciliation_status=InventoryCountItem.ReconciliationStatus.RECOUNT,
+        )
+        client.force_login(user)
+        data = _post(client, inventory_count, [{'code': product.barcode, 'quantity': 9, 'mode': 'set'}], partial=True).json()
+
+        item.refresh_from_db()
+        assert (item.actual_quantity, item.reconciliation_status) == (9, 'pending')
+        assert data['items'][0]['id'] == item.pk and not data['items'][0]['created']
+        assert f'data-item-id="{item.pk}"' in data['html'][str(item.pk)]
+
+    def test_query_count_does_not_grow_with_batch(self, client, user, inventory_count, product, product_category):
+        extra = [Product.objects.create(name=f"Скан {i}", sku=f"SCAN-{i}", category=product_category) for i in range(10)]
+        client.force_login(user)
+        with CaptureQueriesContext(connection) as one:
+            _post(client, inventory_count, [{'code': product.barcode}])
+        with CaptureQueriesContext(connection) as many:
+            _post(client, inventory_count, [{'code': p.barcode} for p in extra])
+        assert len(many) == len(one)
+        assert inventory_count.items.count() == 11
@@ -0,0 +1,91 @@
+import json
+import pytest
+from django.urls import reverse
+from inventarization.models import InventoryCount, InventoryCountItem
+from inventarization.servises import take_stock_snapshot, InventoryScopeError
+from warehouse2.models import Product, ProductCategory
+
+
+@pytest.fixture
+def inventory_count(user):
+    return InventoryCount.objects.create(user=user, status='in_progress')
+
+
+def _scan(client, inventory_count, scans):
+    return client.post(
+        reverse('inventory_scan_batch', kwargs={'pk': inventory_count.pk}),
+        data=json.dumps({'scans': scans}),
+        content_type='application/json',
+    )
+
+
+@pytest.mark.django_db
+class TestStockSnapshot:
+    def test_scope_filters_rows(self, inventory_count, product, material):
+        other_category = ProductCategory.objects.create(name="Другая категория")
+        Product.objects.create(name="Чужой", sku="OTHER-1", category=other_category, total_quantity=5)
+        Product.objects.create(name="Архив", sku="ARCH-1", category=product.category, is_archived=True)
+
+        taken = take_stock_snapshot(inventory_count, f'product_category:{product.category_id}')
+
+        assert taken == 1
+        snapshot = list(inventory_count.snapshot_items.values_list('object_id', 'system_quantity'))
+        assert snapshot == [(product.pk, 80)]
+        inventory_count.refresh_from_db()
+        assert inventory_count.snapshot_scope == f'product_category:{product.category_id}'
+        assert inventory_count.snapshot_taken_at is not None
+
+    def test_all_scope_and_invalid_scope(self, inventory_count, product, material):
+        assert take_stock_snapshot(inventory_count, 'all') == 2
+        with pytest.raises(InventoryScopeError):
+            take_stock_snapshot(inventory_count, 'shelf:3')
+
+    def test_scans_keep_baseline_after_stock_moves(self, client, user, inventory_count, product, material):
+        take_stock_snapshot(inventory_count, 'all')
+        # Отгрузка во время пересчета не должна сдвигать базу сверки
+        Product.objects.filter(pk=product.pk).update(total_quantity=50)
+        client.force_login(user)
+
+        _scan(client, inventory_count, [{'code': product.barcode, 'quantity': 3}])
+        Product.objects.filter(pk=product.pk).update(total_quantity=10)
+        _scan(client, inventory_count, [{'code': product.barcode, 'quantity': 2}])
+
+        item = InventoryCountItem.objects.get(inventory_count=inventory_count, object_id=product.pk)
+        assert (item.system_quantity, item.actual_quantity) == (80, 5)
+
+    def test_item_outside_scope_uses_live_quantity(self, client, user, inventory_count, product, material):
+        take_stock_snapshot(inventory_count, 'materials')
+        client.force_login(user)
+        _scan(client, inventory_count, [{'code': product.barcode, 'quantity': 1}])
+        item = InventoryCountItem.objects.get(inventory_count=inventory_count, object_id=product.pk)
+        assert item.system_quantity == product.available_quantity
+
+
+@pytest.mark.django_db
+class TestStartWithSnapshot:
+    def test_start_with_scope(self, client, user, product, material):
+        client.force_login(user)
+        response = client.post(reverse('count_start'), {'snapshot_scope': 'products'})
+        new_count = InventoryCount.objects.get(user=user)
+        assert response.status_code == 302
+        assert new_count.snapshot_scope == 'products'
+        assert list(new_count.snapshot_items.values_list('object_id', flat=True)) == [product.pk]
+
+    def test_start_without_scope(self, client, user, product):
+        client.force_login(user)
+        client.post(reverse('count_start'))
+        new_count = InventoryCount.objects.get(user=user)
+        assert new_count.snapshot_taken_at is None
+        assert not new_count.snapshot_items.exists()
+
+    def test_invalid_scope_creates_nothing(self, client, user):
+        client.force_login(user)
+        response = client.post(reverse('count_start'), {'snapshot_scope': 'bogus'})
+        assert response.url == reverse('count_list')
+        assert not InventoryCount.objects.exists()
+
+    def test_list_offers_scopes(self, client, user, product_category, material_category):
+        client.force_login(user)
+        response = client.get(reverse('count_list'))
+        assert f'product_category:{product_category.pk}' in response.content.decode()
+        assert f'material_category:{material_category.pk}' in response.content.decode()
@@ -0,0 +1,56 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from inventarization.models import InventoryCount, InventoryCountItem
+from warehouse1.models import Material
+from warehouse2.models import Product
+
+
+def _search(client, query, count):
+    return client.get(reverse('inventory_stock_search'), {'q': query, 'inventory_count_id': count.pk})
+
+
+def _count_other_products(count, n, start=0):
+    ct = ContentType.objects.get_for_model(Product)
+    products = [Product.objects.create(name=f"Другой {i}", sku=f"OTHER-{i}") for i in range(start, start + n)]
+    InventoryCountItem.objects.bulk_create([
+        InventoryCountItem(inventory_count=count, content_type=ct, object_id=p.pk, system_quantity=0, actual_quantity=1)
+        for p in products
+    ])
+
+
+@pytest.mark.django_db
+class TestInventoryStockSearch:
+    def test_short_query_touches_no_items(self, client, user):
+        count = InventoryCount.objects.create(user=user)
+        _count_other_products(count, 3)
+        client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = _search(client, 'Д', count)
+        assert response.json() == {'results': []}
+        assert not any('inventarization_inventorycountitem' in q['sql'] for q in queries.captured_queries)
+
+    def test_counted_for_products_and_materials(self, client, user, product, material):
+        count = InventoryCount.objects.create(user=user)
+        InventoryCountItem.objects.create(
+            inventory_count=count, content_type=ContentType.objects.get_for_model(Material),
+            object_id=material.pk, system_quantity=100, actual_quantity=7,
+        )
+        client.force_login(user)
+        results = {r['id']: r for r in _search(client, 'Тест', count).json()['results']}
+        assert results[f'product-{product.pk}']['counted_quantity'] == 0
+        assert results[f'material-{material.pk}']['counted_quantity'] == 7
+        assert material.unit.short_name in results[f'material-{material.pk}']['info']
+
+    def test_query_count_does_not_grow_with_count_progress(self, client, user, product, material):
+        count = InventoryCount.objects.create(user=user)
+        client.force_login(user)
+        _count_other_products(count, 2)
+        with CaptureQueriesContext(connection) as few:
+            _search(client, 'Тест', count)
+        _count_other_products(count, 30, start=2)
+        with CaptureQueriesContext(connection) as many:
+            _search(client, 'Тест', count)
+        assert len(many) == len(few)
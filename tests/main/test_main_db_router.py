@@ -0,0 +1,77 @@
+import pytest
+from django.db import connections, transaction
+from django.db.utils import OperationalError
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from warehouse2.models import Product
+from warehouse.db_router import ReplicaRouter, use_replica, reset_replica_state
+
+
+@pytest.fixture(autouse=True)
+def fresh_replica_state():
+    reset_replica_state()
+    yield
+    reset_replica_state()
+
+
+# Реплика в тестах — зеркало тестовой базы (TEST MIRROR), поэтому нужны реальные
+# коммиты: внутри транзакции теста роутер намеренно читает с основной базы
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+class TestReplicaRouter:
+    def test_reads_go_to_replica_only_when_marked(self):
+        router = ReplicaRouter()
+        assert router.db_for_read(Product) is None
+        with use_replica():
+            assert router.db_for_read(Product) == 'replica'
+            assert router.db_for_write(Product) == 'default'
+        assert router.db_for_read(Product) is None
+
+    def test_atomic_block_stays_on_primary(self):
+        with use_replica(), transaction.atomic():
+            assert ReplicaRouter().db_for_read(Product) is None
+
+    def test_fallback_when_lagging(self, settings):
+        settings.REPLICA_MAX_LAG_SECONDS = -1
+        with use_replica():
+            assert ReplicaRouter().db_for_read(Product) is None
+
+    def test_fallback_when_replica_is_down(self, mocker):
+        mocker.patch.object(connections['replica'], 'cursor', side_effect=OperationalError('down'))
+        with use_replica():
+            assert ReplicaRouter().db_for_read(Product) is None
+
+    def test_health_check_is_cached(self, settings):
+        settings.REPLICA_CHECK_INTERVAL = 60
+        with use_replica(), CaptureQueriesContext(connections['replica']) as queries:
+            ReplicaRouter().db_for_read(Product)
+            ReplicaRouter().db_for_read(Product)
+        assert len(queries) == 1
+
+    def test_read_only_view_uses_replica(self, client, admin_user):
+        client.force_login(admin_user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = client.get(reverse('shipment_audit_list'))
+        assert response.status_code == 200
+        assert any('reports_shipmentauditlog' in q['sql'] for q in queries)
+
+    def test_report_job_builds_on_replica(self, client, admin_user):
+        client.force_login(admin_user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = client.post(reverse('report_job_submit'), {'report_type': 'stock_ageing'})
+        assert response.status_code == 202
+        assert any('ageing_last' in q['sql'] for q in queries)
+
+    def test_streaming_export_reads_replica(self, client, admin_user):
+        client.force_login(admin_user)
+        response = client.get(reverse('movement_report'), {'export_csv': '1'})
+        with CaptureQueriesContext(connections['replica']) as queries:
+            b''.join(response.streaming_content)
+        assert queries
+
+    def test_job_submission_reads_primary_inside_replica_view(self, client, admin_user):
+        """Постановка выгрузки из GET-отчета не ищет задачи на реплике"""
+        client.force_login(admin_user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = client.get(reverse('movement_report'), {'export_csv': '1', 'export_background': '1'})
+        assert response.status_code == 302
+        assert not any('reports_reportjob' in q['sql'] for q in queries)
@@ -0,0 +1,65 @@
+import pytest
+from django import forms
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from main.widgets import RemoteModelChoiceField
+from payroll.forms import PieceWorkForm
+from payroll.models import TechCardGroup
+from warehouse2.models import Product
+
+
+class ProductPickForm(forms.Form):
+    product = RemoteModelChoiceField(queryset=Product.objects.all(), search_url_name='product_search_json')
+
+
+@pytest.mark.django_db
+class TestRemoteSelect:
+    def test_renders_only_selected_option(self, product, product_category):
+        for i in range(5):
+            Product.objects.create(name=f"Лишний {i}", sku=f"EXTRA-{i}", category=product_category)
+
+        with CaptureQueriesContext(connection) as empty:
+            html = str(ProductPickForm()['product'])
+        assert len(empty) == 0
+        assert html.count('<option') == 1
+        assert f'data-remote-url="{reverse("product_search_json")}"' in html
+
+        html = str(ProductPickForm(initial={'product': product.pk})['product'])
+        assert html.count('<option') == 2
+        assert f'value="{product.pk}" selected' in html
+        assert 'Лишний' not in html
+
+    def test_validates_with_single_lookup(self, product):
+        form = ProductPickForm(data={'product': product.pk})
+        with CaptureQueriesContext(connection) as queries:
+            assert form.is_valid()
+        assert len(queries) == 1
+        assert form.cleaned_data['product'] == product
+        assert not ProductPickForm(data={'product': 'abc'}).is_valid()
+
+    def test_piece_work_form_limits_to_tech_cards(self, product):
+        form = PieceWorkForm(data={'product': product.pk, 'quantity': 1, 'date_performed': '2025-02-01'})
+        assert not form.is_valid()
+        assert 'product' in form.errors
+        assert 'tech_card=1' in str(form['product'])
+        assert 'data-remote-manual' in str(form['product'])
+
+    def test_search_filters_and_caches(self, client, user, product):
+        client.force_login(user)
+        url = reverse('product_search_json')
+        assert client.get(url, {'q': product.sku, 'tech_card': '1'}).json()['results'] == []
+
+        product.tech_card = TechCardGroup.objects.create(name="Подушки")
+        product.save()
+        response = client.get(url, {'q': product.sku})
+        assert [r['id'] for r in response.json()['results']] == [product.pk]
+        assert 'max-age' not in response.get('Cache-Control', '')
+
+        # Кэшируется только поиск; остаток читается заново по pk
+        Product.objects.filter(pk=product.pk).update(total_quantity=product.total_quantity + 5)
+        with CaptureQueriesContext(connection) as queries:
+            results = client.get(url, {'q': product.sku}).json()['results']
+        assert results[0]['available_quantity'] == product.available_quantity + 5
+        product_queries = [q['sql'] for q in queries if 'warehouse2_product' in q['sql']]
+        assert len(product_queries) == 1 and 'LIKE' not in product_queries[0]
@@ -0,0 +1,112 @@
+from decimal import Decimal
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from payroll import servises
+from payroll.models import Operation, WorkEntry, ProductProducedCounter, WorkClaimCounter
+from warehouse2.models import ProductOperation
+
+
+@pytest.fixture(autouse=True)
+def clean_rate_cache():
+    servises.clear_rate_cache()
+
+
+@pytest.fixture
+def operation():
+    return Operation.objects.create(name="Сборка", payment_type='piece', default_rate=Decimal('10.00'))
+
+
+def _stock(product, operation_type, quantity):
+    return ProductOperation.objects.create(
+        product=product, operation_type=operation_type, quantity=quantity,
+        content_type=ContentType.objects.get_for_model(product), object_id=product.pk,
+    )
+
+
+def _claim(worker, operation, product, quantity):
+    return WorkEntry.objects.create(worker=worker, operation=operation, product=product,
+                                    quantity=quantity, date_performed='2025-02-01')
+
+
+@pytest.mark.django_db
+class TestWorkClaimCounters:
+    def test_counters_follow_writes(self, user, operation, product):
+        _stock(product, 'production', 7)
+        incoming = _stock(product, 'incoming', 3)
+        _stock(product, 'shipment', 5)  # отгрузка не считается
+        first = _claim(user, operation, product, 4)
+        WorkEntry.objects.bulk_create([
+            WorkEntry(worker=user, operation=operation, product=product, quantity=2,
+                      date_performed='2025-02-01', final_rate=0),
+        ])
+
+        incoming.delete()
+        first.quantity = 6
+        first.save()
+
+        assert ProductProducedCounter.objects.get(product=product).produced == 7
+        assert WorkClaimCounter.objects.get(product=product, operation=operation).claimed == 8
+
+        first.delete()
+        assert WorkClaimCounter.objects.get(product=product, operation=operation).claimed == 2
+
+    def test_produced_follows_operation_edits(self, user, operation, product):
+        from warehouse2.models import Product
+        other = Product.objects.create(name="Другой", sku="CLAIM-OTHER")
+        op = _stock(product, 'production', 5)
+
+        op.quantity = 8
+        op.save()
+        assert ProductProducedCounter.objects.get(product=product).produced == 8
+
+        op.operation_type = 'shipment'
+        op.save()
+        assert ProductProducedCounter.objects.get(product=product).produced == 0
+
+        op.operation_type = 'incoming'
+        op.product = other
+        op.save()
+        assert ProductProducedCounter.objects.get(product=product).produced == 0
+        assert ProductProducedCounter.objects.get(product=other).produced == 8
+
+    def test_recount_matches_history(self, user, operation, product):
+        _stock(product, 'production', 5)
+        _claim(user, operation, product, 3)
+        ProductProducedCounter.objects.all().delete()
+        WorkClaimCounter.objects.update(claimed=0)
+
+        servises.recount_work_counters()
+
+        assert ProductProducedCounter.objects.get(product=product).produced == 5
+        assert WorkClaimCounter.objects.get(product=product, operation=operation).claimed == 3
+
+    def test_queue_flags_and_filters_suspicious(self, client, admin_user, user, another_user, operation, product):
+        _stock(product, 'production', 5)
+        ok = _claim(user, operation, product, 2)
+        verified = _claim(another_user, operation, product, 2)
+        servises.verify_work_entries([verified.pk], admin_user)
+        client.force_login(admin_user)
+
+        entries = client.get(reverse('verify_work_list')).context['entries']
+        assert [e.is_suspicious for e in entries] == [False]
+        assert (entries[0].warehouse_limit, entries[0].total_submitted) == (5, 4)
+
+        extra = _claim(user, operation, product, 2)  # всего 6 > 5 на складе
+        response = client.get(reverse('verify_work_list'), {'suspicious': '1'})
+        assert {e.pk for e in response.context['entries']} == {ok.pk, extra.pk}
+
+    def test_queue_cost_does_not_grow_with_history(self, client, admin_user, user, operation, product):
+        client.force_login(admin_user)
+        _claim(user, operation, product, 1)
+        with CaptureQueriesContext(connection) as small:
+            client.get(reverse('verify_work_list'))
+
+        for _ in range(5):
+            _stock(product, 'production', 1)
+            _claim(user, operation, product, 1)
+        with CaptureQueriesContext(connection) as large:
+            client.get(reverse('verify_work_list'))
+        assert len(large) == len(small)
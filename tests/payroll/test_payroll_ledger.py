@@ -0,0 +1,108 @@
+from decimal import Decimal
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from payroll import servises
+from payroll.models import Operation, WorkEntry, Payout, PenaltyBonus, PayrollLedgerEntry, WorkerBalance
+
+
+@pytest.fixture(autouse=True)
+def clean_rate_cache():
+    servises.clear_rate_cache()
+
+
+@pytest.fixture
+def operation():
+    return Operation.objects.create(name="Упаковка", payment_type='hourly', default_rate=Decimal('50.00'))
+
+
+def _entry(worker, operation, quantity):
+    return WorkEntry.objects.create(worker=worker, operation=operation, quantity=quantity, date_performed='2025-02-01')
+
+
+def _balance(worker):
+    return WorkerBalance.objects.get(worker=worker)
+
+
+@pytest.mark.django_db
+class TestPayrollLedger:
+    def test_verification_posts_quantity_times_rate(self, client, admin_user, user, operation):
+        first, second = _entry(user, operation, 3), _entry(user, operation, 2)
+        assert not WorkerBalance.objects.exists()  # неподтвержденные не начисляются
+
+        client.force_login(admin_user)
+        client.post(reverse('verify_work_list'), {'selected_entries': [first.pk, second.pk]})
+        client.post(reverse('verify_work_list'), {'selected_entries': [first.pk]})  # повтор не задваивает
+
+        assert _balance(user).earned == Decimal('250.00')
+        assert PayrollLedgerEntry.objects.filter(worker=user).count() == 2
+
+    def test_payouts_bonuses_and_reversals(self, user, operation):
+        bonus = PenaltyBonus.objects.create(worker=user, type='bonus', amount=Decimal('30'), reason="Качество")
+        PenaltyBonus.objects.create(worker=user, type='penalty', amount=Decimal('10'), reason="Опоздание")
+        payout = Payout.objects.create(worker=user, amount=Decimal('100'))
+        assert _balance(user).balance == Decimal('-80')
+
+        payout.amount = Decimal('60')
+        payout.save()
+        bonus.delete()
+
+        balance = _balance(user)
+        assert (balance.bonuses, balance.penalties, balance.paid) == (0, Decimal('10'), Decimal('60'))
+        # Журнал только дополняется: исходная выплата + корректировка, премия + сторно
+        assert PayrollLedgerEntry.objects.filter(kind='payout').count() == 2
+        assert PayrollLedgerEntry.objects.filter(kind='bonus').count() == 2
+
+    def test_dashboard_reads_balances(self, client, admin_user, user, another_user, operation):
+        servises.verify_work_entries([_entry(user, operation, 4).pk], admin_user)
+        Payout.objects.create(worker=user, amount=Decimal('50'))
+        PenaltyBonus.objects.create(worker=user, type='bonus', amount=Decimal('5'), reason="")
+        for _ in range(3):  # размножение строк по связям раньше завышало суммы
+            Payout.objects.create(worker=another_user, amount=Decimal('1'))
+
+        client.force_login(admin_user)
+        response = client.get(reverse('accountant_dashboard'))
+        workers = {w.pk: w for w in response.context['workers']}
+
+        assert workers[user.pk].earned == Decimal('200.00')
+        assert workers[user.pk].balance == Decimal('155.00')
+        assert workers[another_user.pk].paid == Decimal('3')
+        assert workers[admin_user.pk].balance == 0
+
+    def test_detail_page_uses_balance(self, client, admin_user, user, operation):
+        servises.verify_work_entries([_entry(user, operation, 2).pk], admin_user)
+        Payout.objects.create(worker=user, amount=Decimal('30'))
+        client.force_login(admin_user)
+        response = client.get(reverse('worker_payroll_detail', kwargs={'worker_id': user.pk}))
+        assert response.context['total_earned'] == Decimal('100.00')
+        assert response.context['balance'] == Decimal('70.00')
+
+    def test_rebuild_command(self, admin_user, user, operation):
+        entry = _entry(user, operation, 1)
+        servises.verify_work_entries([entry.pk], admin_user)
+        Payout.objects.create(worker=user, amount=Decimal('20'))
+        WorkerBalance.objects.filter(worker=user).update(earned=999, paid=0)
+
+        call_command('rebuild_payroll_ledger')
+
+        balance = _balance(user)
+        assert (balance.earned, balance.paid) == (Decimal('50.00'), Decimal('20.00'))
+        assert PayrollLedgerEntry.objects.count() == 2
+
+    def test_rebuild_appends_corrections(self, admin_user, user, operation):
+        entry = _entry(user, operation, 1)
+        servises.verify_work_entries([entry.pk], admin_user)
+        payout = Payout.objects.create(worker=user, amount=Decimal('20'))
+        posted = PayrollLedgerEntry.objects.get(work_entry=entry)
+        PayrollLedgerEntry.objects.filter(pk=posted.pk).update(amount=Decimal('80'))
+        PayrollLedgerEntry.objects.filter(payout=payout).delete()
+
+        assert servises.rebuild_payroll_ledger() == 2
+
+        # Старые строки не тронуты, разница проведена отдельными строками
+        assert PayrollLedgerEntry.objects.get(pk=posted.pk).amount == Decimal('80')
+        amounts = set(PayrollLedgerEntry.objects.exclude(pk=posted.pk).values_list('kind', 'amount'))
+        assert amounts == {('earning', Decimal('-30.00')), ('payout', Decimal('20.00'))}
+        balance = _balance(user)
+        assert (balance.earned, balance.paid) == (Decimal('50.00'), Decimal('20.00'))
+        assert servises.rebuild_payroll_ledger() == 0
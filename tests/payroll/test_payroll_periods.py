@@ -0,0 +1,126 @@
+from datetime import timedelta
+from decimal import Decimal
+import pytest
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils import timezone
+from payroll import servises
+from payroll.models import Operation, WorkEntry, Payout, PenaltyBonus, PayrollPeriod, PayrollSnapshot
+
+
+@pytest.fixture(autouse=True)
+def clean_rate_cache():
+    servises.clear_rate_cache()
+
+
+@pytest.fixture
+def operation():
+    return Operation.objects.create(name="Упаковка", payment_type='hourly', default_rate=Decimal('50.00'))
+
+
+def _verified(worker, operation, quantity, day, verified_by):
+    entry = WorkEntry.objects.create(worker=worker, operation=operation, quantity=quantity, date_performed=day)
+    servises.verify_work_entries([entry.pk], verified_by)
+    return entry
+
+
+@pytest.mark.django_db
+class TestPayrollPeriods:
+    def test_close_writes_snapshot_and_locks_entries(self, admin_user, user, operation):
+        today = timezone.localdate()
+        entry = _verified(user, operation, 3, today - timedelta(days=5), admin_user)
+        _verified(user, operation, 1, today - timedelta(days=4), admin_user)
+        PenaltyBonus.objects.create(worker=user, type='bonus', amount=Decimal('20'), reason="")
+        PenaltyBonus.objects.create(worker=user, type='penalty', amount=Decimal('5'), reason="")
+        payout = Payout.objects.create(worker=user, amount=Decimal('100'))
+
+        period = servises.close_payroll_period(today, admin_user)
+
+        snapshot = PayrollSnapshot.objects.get(period=period, worker=user)
+        assert (snapshot.earned, snapshot.bonuses, snapshot.penalties, snapshot.paid) == (
+            Decimal('200.00'), Decimal('20.00'), Decimal('5.00'), Decimal('100.00'))
+        assert snapshot.closing_balance == Decimal('115.00')
+        line = snapshot.lines.get()
+        assert (line.operation_id, line.quantity, line.earned) == (operation.pk, 4, Decimal('200.00'))
+
+        entry.refresh_from_db()
+        payout.refresh_from_db()
+        with pytest.raises(ValidationError):
+            entry.save()
+        with pytest.raises(ValidationError):
+            payout.delete()
+
+    def test_bulk_changes_blocked_for_closed_period(self, admin_user, user, operation):
+        today = timezone.localdate()
+        _verified(user, operation, 3, today - timedelta(days=5), admin_user)
+        Payout.objects.create(worker=user, amount=Decimal('100'))
+        servises.close_payroll_period(today, admin_user)
+        open_bonus = PenaltyBonus.objects.create(worker=user, type='bonus', amount=Decimal('20'), reason="")
+
+        with pytest.raises(ValidationError):
+            WorkEntry.objects.filter(worker=user).update(quantity=10)
+        with pytest.raises(ValidationError):
+            Payout.objects.all().delete()
+        assert WorkEntry.objects.get().quantity == 3
+        assert Payout.objects.exists()
+
+        # Открытый период по-прежнему правится массово
+        PenaltyBonus.objects.filter(pk=open_bonus.pk).update(amount=Decimal('30'))
+        PenaltyBonus.objects.filter(period__isnull=True).delete()
+        assert not PenaltyBonus.objects.exists()
+
+    def test_balance_carries_over_to_next_period(self, admin_user, user, another_user, operation):
+        today = timezone.localdate()
+        _verified(user, operation, 2, today - timedelta(days=10), admin_user)
+        first = servises.close_payroll_period(today - timedelta(days=7), admin_user)
+
+        _verified(another_user, operation, 1, today - timedelta(days=3), admin_user)
+        second = servises.close_payroll_period(today, admin_user)
+
+        assert second.start_date == first.end_date + timedelta(days=1)
+        carried = PayrollSnapshot.objects.get(period=second, worker=user)
+        assert (carried.opening_balance, carried.earned, carried.closing_balance) == (
+            Decimal('100.00'), 0, Decimal('100.00'))
+        assert PayrollSnapshot.objects.get(period=second, worker=another_user).closing_balance == Decimal('50.00')
+
+    def test_close_is_rejected(self, admin_user, user, operation):
+        today = timezone.localdate()
+        with pytest.raises(servises.PayrollPeriodError):
+            servises.close_payroll_period(today + timedelta(days=1), admin_user)
+
+        pending = WorkEntry.objects.create(worker=user, operation=operation, quantity=1, date_performed=today)
+        with pytest.raises(servises.PayrollPeriodError):
+            servises.close_payroll_period(today, admin_user)
+
+        pending.delete()
+        servises.close_payroll_period(today, admin_user)
+        with pytest.raises(servises.PayrollPeriodError):
+            servises.close_payroll_period(today, admin_user)
+        assert PayrollPeriod.objects.count() == 1
+
+    def test_detail_page_lists_only_open_period(self, client, admin_user, user, operation):
+        today = timezone.localdate()
+        _verified(user, operation, 2, today - timedelta(days=3), admin_user)
+        Payout.objects.create(worker=user, amount=Decimal('30'))
+        servises.close_payroll_period(today - timedelta(days=1), admin_user)
+        fresh = _verified(user, operation, 1, today, admin_user)
+
+        client.force_login(admin_user)
+        response = client.get(reverse('worker_payroll_detail', kwargs={'worker_id': user.pk}))
+
+        assert [e.pk for e in response.context['entries']] == [fresh.pk]
+        assert len(response.context['payouts']) == 1  # выплата сегодня — период закрыт по вчера, она в открытом
+        assert response.context['opening_balance'] == Decimal('100.00')
+        assert response.context['balance'] == Decimal('120.00')
+
+    def test_close_view(self, client, admin_user, user):
+        client.force_login(user)
+        client.post(reverse('payroll_period_list'), {'end_date': timezone.localdate().isoformat()})
+        assert not PayrollPeriod.objects.exists()
+
+        client.force_login(admin_user)
+        response = client.post(reverse('payroll_period_list'), {'end_date': timezone.localdate().isoformat()})
+        period = PayrollPeriod.objects.get()
+        assert response.url == reverse('payroll_period_detail', kwargs={'pk': period.pk})
+        assert client.get(response.url).status_code == 200
+        assert client.get(reverse('payroll_period_list')).status_code == 200
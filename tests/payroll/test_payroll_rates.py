@@ -0,0 +1,157 @@
+import json
+from decimal import Decimal
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from payroll import servises
+from payroll.models import Operation, TechCardGroup, TechCardOperation, WorkEntry
+from warehouse2.models import Product
+
+
+@pytest.fixture(autouse=True)
+def clean_rate_cache():
+    servises.clear_rate_cache()
+    yield
+    servises.clear_rate_cache()
+
+
+@pytest.fixture
+def sewing():
+    return Operation.objects.create(name="Пошив", payment_type='piece', default_rate=Decimal('5.00'))
+
+
+@pytest.fixture
+def cleaning():
+    return Operation.objects.create(name="Уборка", payment_type='hourly', default_rate=Decimal('100.00'))
+
+
+@pytest.fixture
+def tech_card(sewing):
+    card = TechCardGroup.objects.create(name="Подушки")
+    TechCardOperation.objects.create(group=card, operation=sewing, price=Decimal('12.50'))
+    return card
+
+
+@pytest.fixture
+def carded_product(product, tech_card):
+    product.tech_card = tech_card
+    product.save(update_fields=['tech_card'])
+    return product
+
+
+@pytest.mark.django_db
+class TestRateResolver:
+    def test_rates(self, sewing, cleaning, carded_product):
+        no_card = Product.objects.create(name="Без техкарты", sku="NO-TC-001")
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('12.50')
+        assert servises.resolve_rate(sewing.pk, no_card.pk) == Decimal('5.00')
+        assert servises.resolve_rate(sewing.pk) == Decimal('5.00')
+        assert servises.resolve_rate(cleaning.pk, carded_product.pk) == Decimal('100.00')
+
+    def test_work_entry_save_uses_cache(self, sewing, carded_product, user, django_assert_num_queries):
+        WorkEntry.objects.create(worker=user, operation=sewing, product=carded_product, quantity=1, date_performed='2025-01-10')
+        with django_assert_num_queries(1):  # только INSERT
+            entry = WorkEntry.objects.create(worker=user, operation=sewing, product=carded_product,
+                                             quantity=2, date_performed='2025-01-10')
+        assert entry.final_rate == Decimal('12.50')
+
+    def test_invalidation(self, sewing, carded_product, tech_card):
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('12.50')
+
+        tco = TechCardOperation.objects.get(group=tech_card, operation=sewing)
+        tco.price = Decimal('20.00')
+        tco.save()
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('20.00')
+
+        carded_product.tech_card = None
+        carded_product.save(update_fields=['tech_card'])
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('5.00')
+
+        sewing.default_rate = Decimal('7.00')
+        sewing.save()
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('7.00')
+
+    def test_load_started_before_invalidation_is_not_cached(self, sewing, carded_product, tech_card, monkeypatch):
+        load = servises._load
+
+        def load_then_change_price(pairs):
+            data = load(pairs)  # прочитали старую цену, а пока шел запрос — цену поменяли
+            TechCardOperation.objects.filter(group=tech_card, operation=sewing).update(price=Decimal('20.00'))
+            servises.invalidate_tech_card_prices()
+            return data
+
+        monkeypatch.setattr(servises, '_load', load_then_change_price)
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('12.50')
+        monkeypatch.setattr(servises, '_load', load)
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('20.00')
+
+    def test_invalidated_again_on_commit(self, sewing, carded_product, tech_card, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks() as callbacks:
+            TechCardOperation.objects.filter(group=tech_card, operation=sewing).update(price=Decimal('20.00'))
+            TechCardOperation.objects.get(group=tech_card, operation=sewing).save()
+        # Другой поток успел закэшировать цену до коммита
+        servises._cache['prices'][(tech_card.pk, sewing.pk)] = Decimal('12.50')
+        for callback in callbacks:
+            callback()
+        assert servises.resolve_rate(sewing.pk, carded_product.pk) == Decimal('20.00')
+
+    def test_bulk_assign_invalidates(self, client, admin_user, sewing, product, tech_card):
+        assert servises.resolve_rate(sewing.pk, product.pk) == Decimal('5.00')
+        client.force_login(admin_user)
+        client.post(reverse('bulk_assign_tech_card'), {'selected_products': [product.pk], 'tech_card': tech_card.pk})
+        assert servises.resolve_rate(sewing.pk, product.pk) == Decimal('12.50')
+
+
+@pytest.mark.django_db
+class TestBulkWorkEntriesApi:
+    def _post(self, client, entries):
+        return client.post(reverse('api_bulk_work_entries'), data=json.dumps({'entries': entries}),
+                           content_type='application/json')
+
+    def test_brigade_entry(self, client, staff_user, another_user, sewing, cleaning, carded_product):
+        client.force_login(staff_user)
+        entries = [
+            {'worker_id': another_user.pk, 'operation_id': sewing.pk, 'product_id': carded_product.pk,
+             'quantity': 10, 'date_performed': '2025-01-31'},
+            {'operation_id': cleaning.pk, 'quantity': 2},
+        ] * 10
+        response = self._post(client, entries)
+
+        assert response.status_code == 200
+        assert WorkEntry.objects.count() == 20
+        assert set(WorkEntry.objects.filter(worker=another_user).values_list('final_rate', flat=True)) == {Decimal('12.50')}
+        assert set(WorkEntry.objects.filter(worker=staff_user).values_list('final_rate', flat=True)) == {Decimal('100.00')}
+        # Без даты — сегодняшний день по часовому поясу проекта, а не сервера
+        assert set(WorkEntry.objects.filter(worker=staff_user).values_list('date_performed', flat=True)) == {timezone.localdate()}
+
+    def test_query_count_does_not_grow(self, client, user, sewing, carded_product):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        client.force_login(user)
+
+        def measure(count):
+            servises.clear_rate_cache()
+            entry = {'operation_id': sewing.pk, 'product_id': carded_product.pk, 'quantity': 1}
+            with CaptureQueriesContext(connection) as queries:
+                assert self._post(client, [entry] * count).status_code == 200
+            return len(queries)
+
+        assert measure(1) == measure(25)
+
+    def test_errors_reject_whole_batch(self, client, user, another_user, sewing):
+        client.force_login(user)
+        response = self._post(client, [
+            {'operation_id': sewing.pk, 'quantity': 1},
+            {'worker_id': another_user.pk, 'operation_id': sewing.pk, 'quantity': 1},
+            {'operation_id': 999999, 'quantity': 1},
+            {'operation_id': sewing.pk, 'product_id': 999999, 'quantity': 1},
+            {'operation_id': sewing.pk, 'quantity': 'много'},
+        ])
+        assert response.status_code == 400
+        assert response.json()['errors'] == {
+            '1': "Можно подавать записи только за себя",
+            '2': "Операция не найдена",
+            '3': "Товар не найден",
+            '4': "Некорректная запись",
+        }
+        assert not WorkEntry.objects.exists()
@@ -0,0 +1,187 @@
+import pytest
+import json
+import numpy as np
+from django.core.cache import cache
+from django.urls import reverse
+from warehouse2.models import Shipment, ShipmentItem
+from reports.analytics import classify_abc, classify_xyz, build_abc_xyz, get_abc_xyz_data, get_abc_xyz_period
+from reports.jobs import submit_report_job, run_report_job
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestAbcXyzClassification:
+    def test_abc_by_cumulative_share(self):
+        """Самый доходный — всегда A, хвост — C, товары без выручки — C"""
+        revenue = np.array([5.0, 700.0, 200.0, 60.0, 35.0, 0.0])
+        classes, share = classify_abc(revenue)
+
+        assert list(classes) == ['C', 'A', 'A', 'B', 'C', 'C']
+        assert share.sum() == pytest.approx(1.0)
+
+    def test_abc_without_revenue(self):
+        classes, share = classify_abc(np.zeros(3))
+        assert list(classes) == ['C', 'C', 'C']
+        assert not share.any()
+
+    def test_xyz_by_coefficient_of_variation(self):
+        matrix = np.array([
+            [10, 10, 10, 10],   # стабильный спрос
+            [10, 5, 15, 10],    # умеренные колебания (CV ~0.35)
+            [0, 0, 40, 0],      # разовые отгрузки
+            [0, 0, 0, 0],       # спроса не было
+        ], dtype=float)
+        classes, cv = classify_xyz(matrix)
+
+        assert list(classes) == ['X', 'Y', 'Z', 'Z']
+        assert cv[0] == 0
+        assert np.isinf(cv[3])
+
+    def test_vectorized_on_large_matrix(self):
+        """10 тыс. товаров × 2 года недель считаются без циклов по товарам"""
+        rng = np.random.default_rng(0)
+        matrix = rng.poisson(5, size=(10_000, 104)).astype(float)
+        abc, _ = classify_abc(rng.gamma(1.0, 100.0, size=10_000))
+        xyz, _ = classify_xyz(matrix)
+
+        assert abc.shape == xyz.shape == (10_000,)
+        assert set(abc) == {'A', 'B', 'C'}
+
+
+@pytest.mark.django_db
+class TestAbcXyzReport:
+    def _ship(self, user, sender, product, quantity, price):
+        shipment = Shipment.objects.create(created_by=user, sender=sender)
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=quantity, price=price)
+        shipment.ship(user)
+        return shipment
+
+    def test_build_from_shipments(self, user, sender, product):
+        self._ship(user, sender, product, 2, 100)
+        start_date, end_date = get_abc_xyz_period()
+
+        data = build_abc_xyz(start_date, end_date)
+
+        assert data['weeks'] >= 26
+        assert data['summary']['AZ'] == 1
+        row = data['rows'][0]
+        assert row['product_id'] == product.id
+        assert row['sku'] == product.sku
+        assert row['revenue'] == 200
+        assert row['demand'] == 2
+        assert row['group'] == 'AZ'  # одна отгрузка за полгода — нерегулярный спрос
+
+    def test_result_is_cached_per_date_range(self, user, sender, product, django_assert_num_queries):
+        self._ship(user, sender, product, 1, 50)
+        get_abc_xyz_data()
+
+        with django_assert_num_queries(0):
+            get_abc_xyz_data()
+
+    def test_api_and_background_job(self, client, user, sender, product, mocker):
+        mocker.patch('reports.tasks.run_report_job.delay')
+        self._ship(user, sender, product, 1, 50)
+        client.force_login(user)
+
+        response = client.get(reverse('abc_xyz_api'))
+        assert response.status_code == 200
+        assert json.loads(response.content)['rows'][0]['product_id'] == product.id
+
+        assert client.get(reverse('abc_xyz_api'), {'start_date': 'bad'}).status_code == 400
+        assert client.get(reverse('abc_xyz_report')).status_code == 200
+
+        job, _ = submit_report_job('abc_xyz', {}, user)
+        run_report_job(job.pk)
+        job.refresh_from_db()
+        assert job.result['summary']['AZ'] == 1
+
+
+class TestStockoutProjectionMath:
+    def test_days_left_for_all_items_at_once(self):
+        from reports.analytics import project_stockout
+        stock_ids = np.array([1, 2, 3, 4])
+        stock = np.array([100.0, 10.0, 50.0, -5.0])
+        usage_ids = np.array([1, 2, 4, 99])  # 99 — удаленная позиция
+        usage = np.array([
+            [10, 10, 10, 10],
+            [0, 0, 0, 20],
+            [1, 1, 1, 1],
+            [5, 5, 5, 5],
+        ], dtype=float)
+
+        daily_usage, days_left = project_stockout(stock, usage_ids, usage, stock_ids)
+
+        assert list(daily_usage) == [10, 5, 0, 1]
+        assert days_left[0] == 10 and days_left[1] == 2
+        assert np.isnan(days_left[2])  # расхода не было — прогноза нет
+        assert days_left[3] == 0
+
+
+@pytest.mark.django_db
+class TestStockProjections:
+    def test_refresh_and_low_stock_report(self, client, user, product, material, settings):
+        from datetime import timedelta
+        from django.contrib.contenttypes.models import ContentType
+        from django.utils import timezone
+        from warehouse1.models import MaterialOperation
+        from warehouse2.models import ProductOperation
+        from reports.analytics import refresh_stock_projections
+        from reports.models import StockProjection
+        settings.STOCK_PROJECTION_WINDOW_DAYS = 10
+        ProductOperation.objects.all().delete()
+        MaterialOperation.objects.all().delete()
+
+        product.total_quantity = 20
+        product.save()
+        material.quantity = 1000
+        material.save()
+        ct = ContentType.objects.get_for_model(product)
+        ProductOperation.objects.create(
+            product=product, operation_type='shipment', quantity=50,
+            content_type=ct, object_id=product.id, user=user
+        )
+        # Отгрузка за пределами окна не учитывается
+        old = ProductOperation.objects.create(
+            product=product, operation_type='shipment', quantity=500,
+            content_type=ct, object_id=product.id, user=user
+        )
+        ProductOperation.objects.filter(id=old.id).update(timestamp=timezone.now() - timedelta(days=30))
+        MaterialOperation.objects.create(material=material, operation_type='outgoing', quantity=10, user=user)
+
+        assert refresh_stock_projections() == 2
+
+        p = StockProjection.objects.get(product=product)
+        assert p.daily_usage == 5  # 50 шт. за окно в 10 дней
+        assert p.days_left == 4
+        assert p.stockout_date == timezone.localdate() + timedelta(days=4)
+        m = StockProjection.objects.get(material=material)
+        assert m.days_left == 1000
+
+        # Повторный пересчет заменяет таблицу, а не дописывает
+        refresh_stock_projections()
+        assert StockProjection.objects.count() == 2
+
+        from reports.servises import get_low_stock_data
+        assert [x['name'] for x in get_low_stock_data()['projections']] == [product.name]
+        client.force_login(user)
+        assert client.get(reverse('start-page')).context['stockout_risk_count'] == 1
+
+    def test_huge_stock_with_tiny_usage(self, user, material):
+        from warehouse1.models import MaterialOperation
+        from reports.analytics import refresh_stock_projections
+        from reports.models import StockProjection
+        MaterialOperation.objects.all().delete()
+        MaterialOperation.objects.create(material=material, operation_type='outgoing', quantity=1, user=user)
+        material.quantity = 110000
+        material.save()
+
+        refresh_stock_projections(window=28)
+
+        projection = StockProjection.objects.get(material=material)
+        assert projection.days_left == 110000 * 28
+        assert projection.stockout_date is None
@@ -0,0 +1,176 @@
+import pytest
+import json
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from django.core.files.base import ContentFile
+from warehouse2.models import ShipmentItem
+from reports.models import ReportJob
+from reports.jobs import submit_report_job, run_report_job, purge_expired_jobs
+
+
+@pytest.fixture
+def no_celery(mocker):
+    """Задачи не уходят в Celery — запускаем run_report_job вручную"""
+    return mocker.patch('reports.tasks.run_report_job.delay')
+
+
+@pytest.mark.django_db
+class TestReportJobSubmit:
+    def test_same_params_are_deduplicated(self, user, admin_user, no_celery):
+        """Два менеджера с одинаковыми параметрами получают одну задачу"""
+        job1, created1 = submit_report_job('sales_chart', {'period': 'week'}, user)
+        job2, created2 = submit_report_job('sales_chart', {'period': 'week'}, admin_user)
+
+        assert created1 and not created2
+        assert job1.pk == job2.pk
+        assert ReportJob.objects.count() == 1
+
+    def test_different_params_create_new_job(self, user, no_celery):
+        job1, _ = submit_report_job('sales_chart', {'period': 'week'}, user)
+        job2, _ = submit_report_job('sales_chart', {'period': 'year'}, user)
+        assert job1.pk != job2.pk
+
+    def test_fresh_result_is_reused_expired_is_not(self, user, no_celery):
+        job, _ = submit_report_job('sales_chart', {'period': 'month'}, user)
+        run_report_job(job.pk)
+
+        reused, created = submit_report_job('sales_chart', {'period': 'month'}, user)
+        assert not created and reused.pk == job.pk
+
+        ReportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        fresh, created = submit_report_job('sales_chart', {'period': 'month'}, user)
+        assert created and fresh.pk != job.pk
+
+    def test_stale_running_job_does_not_block(self, user, no_celery):
+        job, _ = submit_report_job('sales_chart', {'period': 'month'}, user)
+        ReportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(hours=2))
+
+        new_job, created = submit_report_job('sales_chart', {'period': 'month'}, user)
+        assert created
+        job.refresh_from_db()
+        assert job.status == ReportJob.Status.FAILED
+
+    def test_race_with_failed_competitor_creates_new_job(self, user, no_celery, mocker):
+        """Параллельная задача заняла слот и упала до повторного поиска — создаем свою"""
+        from reports import jobs
+        real_lookup = jobs.find_reusable_job
+        competitor = {}
+
+        def lookup(report_type, params_hash):
+            if not competitor:
+                # Конкурент создает задачу сразу после нашего поиска
+                competitor['job'] = ReportJob.objects.create(
+                    report_type=report_type, params={'period': 'month'}, params_hash=params_hash
+                )
+                return None
+            ReportJob.objects.filter(pk=competitor['job'].pk).update(status=ReportJob.Status.FAILED)
+            return real_lookup(report_type, params_hash)
+
+        mocker.patch('reports.jobs.find_reusable_job', side_effect=lookup)
+        job, created = submit_report_job('sales_chart', {'period': 'month'}, user)
+
+        assert created and job.pk != competitor['job'].pk
+        assert job.status == ReportJob.Status.PENDING
+
+    def test_task_enqueued_on_commit(self, user, no_celery, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            job, _ = submit_report_job('sales_chart', {'period': 'month'}, user)
+        no_celery.assert_called_once_with(job.pk)
+
+
+@pytest.mark.django_db
+class TestReportJobRun:
+    def test_json_result_stored(self, user, shipment, product, no_celery):
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=2, price=100)
+        shipment.ship(user)
+
+        job, _ = submit_report_job('sales_by_product', {}, user)
+        assert run_report_job(job.pk) == ReportJob.Status.DONE
+        job.refresh_from_db()
+        assert job.result['data'] == [200.0]
+        assert job.expires_at > timezone.now()
+
+    def test_file_result_stored(self, admin_user, product_operation_incoming, no_celery, mocker):
+        save = mocker.patch('django.db.models.fields.files.FieldFile.save')
+        job, _ = submit_report_job('movement_csv', {}, admin_user)
+        run_report_job(job.pk)
+        job.refresh_from_db()
+
+        assert job.status == ReportJob.Status.DONE
+        name, content = save.call_args.args[:2]
+        assert name.endswith('.csv')
+
+    def test_failure_is_recorded(self, user, no_celery, mocker):
+        mocker.patch.dict('reports.jobs.REPORT_TYPES', {'sales_chart': {
+            'kind': 'json', 'normalize': lambda p: {}, 'permission': None,
+            'build': mocker.Mock(side_effect=RuntimeError('boom')),
+        }})
+        job, _ = submit_report_job('sales_chart', {}, user)
+        run_report_job(job.pk)
+        job.refresh_from_db()
+        assert job.status == ReportJob.Status.FAILED
+        assert job.error == 'boom'
+
+    def test_job_runs_only_once(self, user, no_celery):
+        job, _ = submit_report_job('sales_chart', {}, user)
+        assert run_report_job(job.pk) == ReportJob.Status.DONE
+        assert run_report_job(job.pk) is None
+
+    def test_purge_expired(self, user, no_celery):
+        job, _ = submit_report_job('sales_chart', {}, user)
+        run_report_job(job.pk)
+        ReportJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=1))
+        assert purge_expired_jobs() == 1
+        assert not ReportJob.objects.exists()
+
+
+@pytest.mark.django_db
+class TestReportJobViews:
+    def test_submit_and_poll(self, client, user, no_celery):
+        client.force_login(user)
+        response = client.post(reverse('report_job_submit'), {'report_type': 'sales_chart', 'period': 'week'})
+        assert response.status_code == 202
+        job_id = json.loads(response.content)['id']
+
+        run_report_job(job_id)
+        data = json.loads(client.get(reverse('report_job_status', kwargs={'pk': job_id})).content)
+        assert data['status'] == 'done'
+        assert 'labels' in data['result']
+
+    def test_submit_cached_returns_result_immediately(self, client, user, no_celery):
+        client.force_login(user)
+        job, _ = submit_report_job('sales_chart', {'period': 'week'}, user)
+        run_report_job(job.pk)
+
+        response = client.post(reverse('report_job_submit'), {'report_type': 'sales_chart', 'period': 'week'})
+        assert response.status_code == 200
+        assert json.loads(response.content)['status'] == 'done'
+
+    def test_submit_validation(self, client, user):
+        client.force_login(user)
+        assert client.post(reverse('report_job_submit'), {'report_type': 'unknown'}).status_code == 400
+        response = client.post(reverse('report_job_submit'), {
+            'report_type': 'sales_by_product', 'start_date': 'bad'
+        })
+        assert response.status_code == 400
+
+    def test_file_reports_require_permission(self, client, user):
+        client.force_login(user)
+        response = client.post(reverse('report_job_submit'), {'report_type': 'movement_xlsx'})
+        assert response.status_code == 403
+
+    def test_download(self, client, admin_user, no_celery, settings):
+        settings.DEFAULT_FILE_STORAGE = 'django.core.files.storage.InMemoryStorage'
+        client.force_login(admin_user)
+        job, _ = submit_report_job('movement_csv', {}, admin_user)
+        url = reverse('report_job_download', kwargs={'pk': job.pk})
+        # Еще не готов — редирект с сообщением
+        assert client.get(url).status_code == 302
+
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.Status.DONE)
+        job.refresh_from_db()
+        job.result_file.save('test.csv', ContentFile(b'a;b\n'), save=True)
+        response = client.get(url)
+        assert response.status_code == 200
+        assert b''.join(response.streaming_content) == b'a;b\n'
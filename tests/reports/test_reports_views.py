@@ -12,6 +12,7 @@ from decimal import Decimal
 from warehouse1.models import MaterialOperation
 from warehouse2.models import ProductOperation
 from django.contrib.contenttypes.models import ContentType
+from reports.servises import get_low_stock_materials
 
 
 # ==================== ReportsHomeView ====================
@@ -168,8 +169,8 @@ class TestMovementReportView:
         assert response['Content-Type'] == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         assert 'attachment; filename="movement_report.xlsx"' in response['Content-Disposition']
         
-        # Проверяем содержимое Excel файла
-        workbook = load_workbook(io.BytesIO(response.content))
+        # Проверяем содержимое Excel файла (ответ потоковый)
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
         sheet = workbook.active
         
         # Проверяем заголовки
@@ -225,10 +226,6 @@ class TestSalesByProductApi:
     def test_sales_by_product_api_with_data(self, client, user, product, shipment):
         """Тест API топ-10 товаров с данными"""
         # Создаем отгруженный Shipment
-        shipment.status = 'shipped'
-        shipment.shipped_at = timezone.now()
-        shipment.save()
-        
         # Создаем ShipmentItem
         ShipmentItem.objects.create(
             shipment=shipment,
@@ -236,6 +233,9 @@ class TestSalesByProductApi:
             quantity=10,
             price=1000.00
         )
+
+        # Отгружаем (витрина продаж пополняется в Shipment.ship)
+        shipment.ship(user)
         
         client.force_login(user)
         url = reverse('sales_by_product_api')
@@ -290,10 +290,6 @@ class TestSalesByCategoryApi:
         product.save()
         
         # Создаем отгруженный Shipment
-        shipment.status = 'shipped'
-        shipment.shipped_at = timezone.now()
-        shipment.save()
-        
         # Создаем ShipmentItem
         ShipmentItem.objects.create(
             shipment=shipment,
@@ -301,6 +297,9 @@ class TestSalesByCategoryApi:
             quantity=5,
             price=2000.00
         )
+
+        # Отгружаем (витрина продаж пополняется в Shipment.ship)
+        shipment.ship(user)
         
         client.force_login(user)
         url = reverse('sales_by_category_api')
@@ -319,6 +318,15 @@ class TestSalesByCategoryApi:
             assert product_category.name in data['labels']
 
 
+def _run_report(report_type, user, params=None):
+    """Ставит фоновый отчет и выполняет его сразу (on_commit в тестах не срабатывает)"""
+    from reports.jobs import submit_report_job, run_report_job
+    from reports.models import ReportJob
+    job, _ = submit_report_job(report_type, params or {}, user)
+    run_report_job(job.pk)
+    return ReportJob.objects.get(pk=job.pk).result
+
+
 # ==================== LowStockReportView ====================
 @pytest.mark.django_db
 class TestLowStockReportView:
@@ -338,18 +346,13 @@ class TestLowStockReportView:
         material.min_quantity = 10.00
         material.save()
         
-        client.force_login(user)
-        url = reverse('low_stock_report')
-        response = client.get(url)
-        
-        assert response.status_code == 200
-        assert 'materials' in response.context
-        materials = response.context['materials']
-        
+        materials = _run_report('low_stock', user)['materials']
+
         # Проверяем, что материал попал в отчет
-        assert materials.count() >= 1
-        material_in_report = materials.first()
-        assert material_in_report.needed_quantity == 5.00  # 10 - 5
+        assert len(materials) >= 1
+        material_in_report = materials[0]
+        assert material_in_report['needed_quantity'] == 5  # 10 - 5
+        assert material_in_report['unit'] == material.unit.short_name
     
     def test_low_stock_report_view_without_low_stock(self, client, user, material):
         """Тест LowStockReportView без материалов с низким запасом"""
@@ -358,14 +361,8 @@ class TestLowStockReportView:
         material.min_quantity = 10.00
         material.save()
         
-        client.force_login(user)
-        url = reverse('low_stock_report')
-        response = client.get(url)
-        
-        assert response.status_code == 200
-        assert 'materials' in response.context
         # Материал не должен попасть в отчет
-        assert response.context['materials'].count() == 0
+        assert _run_report('low_stock', user)['materials'] == []
     
     def test_low_stock_report_view_ordering(self, client, user, material):
         """Тест сортировки в LowStockReportView"""
@@ -384,17 +381,12 @@ class TestLowStockReportView:
         material.min_quantity = 10.00
         material.save()
         
-        client.force_login(user)
-        url = reverse('low_stock_report')
-        response = client.get(url)
-        
-        assert response.status_code == 200
-        materials = response.context['materials']
-        
+        materials = _run_report('low_stock', user)['materials']
+
         # Проверяем сортировку по имени
-        if materials.count() >= 2:
-            names = [m.name for m in materials]
-            assert names == sorted(names)
+        names = [m['name'] for m in materials]
+        assert len(names) == 2
+        assert names == sorted(names)
 
 
 
@@ -417,20 +409,21 @@ class TestStockAgeingReportView:
         response = client.get(url)
         
         assert response.status_code == 200
-        assert 'items' in response.context
-        assert 'current_sort' in response.context
         assert response.context['current_sort'] == 'asc'
+        # Сами строки считает фоновый отчет
+        assert len(_run_report('stock_ageing', user)['items']) == 2
     
     
     def test_stock_ageing_report_view_pagination(self, client, user):
         """Тест пагинации в StockAgeingReportView"""
         client.force_login(user)
-        url = reverse('stock_ageing_report')
-        response = client.get(url)
-        
+        response = client.get(reverse('stock_ageing_report'), {'sort': 'desc', 'page': '3'})
         assert response.status_code == 200
-        assert 'paginator' in response.context
-        assert 'page_obj' in response.context
+        assert (response.context['current_sort'], response.context['current_page']) == ('desc', '3')
+
+        # Страница за пределами отчета — последняя
+        report = _run_report('stock_ageing', user, {'page': '3'})
+        assert (report['page'], report['num_pages'], report['count']) == (1, 1, 0)
     
     def test_stock_ageing_report_view_excludes_zero_quantity(self, client, user, product):
         """Тест, что товары с нулевым количеством не попадают в отчет"""
@@ -438,13 +431,8 @@ class TestStockAgeingReportView:
         product.total_quantity = 0
         product.save()
         
-        client.force_login(user)
-        url = reverse('stock_ageing_report')
-        response = client.get(url)
-        
-        assert response.status_code == 200
-        items = response.context['items']
-        
+        items = _run_report('stock_ageing', user)['items']
+
         # Продукт с нулевым количеством не должен попасть в отчет
         product_in_report = any(item['sku'] == product.sku for item in items)
         assert not product_in_report
@@ -548,11 +536,8 @@ class TestSalesApiDeepDive:
         product.price = Decimal('150.50')
         product.save()
 
-        shipment.status = 'shipped'
-        shipment.shipped_at = timezone.now()
-        shipment.save()
-
         ShipmentItem.objects.create(shipment=shipment, product=product, quantity=10, price=product.price)
+        shipment.ship(user)
         
         response = client.get(reverse('sales_by_product_api'))
         data = json.loads(response.content)
@@ -568,8 +553,7 @@ class TestLowStockEdgeCases:
         material.min_quantity = Decimal('10.00')
         material.save()
         
-        response = client.get(reverse('low_stock_report'))
-        assert material in response.context['materials']
+        assert material in get_low_stock_materials()
 
     def test_low_stock_ignore_zero_threshold(self, client, user, material):
         """Если min_quantity = 0, материал не считается дефицитным, даже если остаток 0"""
@@ -578,8 +562,7 @@ class TestLowStockEdgeCases:
         material.min_quantity = 0
         material.save()
         
-        response = client.get(reverse('low_stock_report'))
-        assert material not in response.context['materials']
+        assert material not in get_low_stock_materials()
 
 
 @pytest.mark.django_db
@@ -627,14 +610,92 @@ class TestStockAgeingLogic:
         MaterialOperation.objects.filter(id=op_m.id).update(date=new_date)
 
         # 5. Выполняем запрос
-        res_asc = client.get(reverse('stock_ageing_report'), {'sort': 'asc'})
-        items_asc = res_asc.context['items']
+        items_asc = _run_report('stock_ageing', user, {'sort': 'asc'})['items']
 
         # Проверки
         assert items_asc[0]['name'] == product.name
         assert items_asc[0]['age_days'] >= 10
 
 
+@pytest.mark.django_db
+class TestLastMovementDenormalization:
+    def _product_op(self, user, product, when=None):
+        ct = ContentType.objects.get_for_model(product)
+        op = ProductOperation.objects.create(
+            product=product, operation_type='incoming', quantity=1,
+            content_type=ct, object_id=product.id, user=user
+        )
+        if when:
+            ProductOperation.objects.filter(id=op.id).update(timestamp=when)
+        return op
+
+    def test_trigger_tracks_insert_update_and_delete(self, user, product):
+        """Триггер ведет last_movement_at при вставке, переносе даты и удалении"""
+        ProductOperation.objects.all().delete()
+        product.refresh_from_db()
+        assert product.last_movement_at is None
+
+        now = timezone.now().replace(microsecond=0)
+        old_op = self._product_op(user, product, now - timedelta(days=40))
+        new_op = self._product_op(user, product, now - timedelta(days=5))
+        product.refresh_from_db()
+        assert product.last_movement_at == now - timedelta(days=5)
+
+        # Перенос даты назад пересчитывает максимум по журналу
+        ProductOperation.objects.filter(id=new_op.id).update(timestamp=now - timedelta(days=60))
+        product.refresh_from_db()
+        assert product.last_movement_at == now - timedelta(days=40)
+
+        ProductOperation.objects.filter(id=old_op.id).delete()
+        product.refresh_from_db()
+        assert product.last_movement_at == now - timedelta(days=60)
+
+        ProductOperation.objects.all().delete()
+        product.refresh_from_db()
+        assert product.last_movement_at is None
+
+    def test_full_save_does_not_overwrite_trigger_value(self, user, product):
+        """Сохранение устаревшего экземпляра не затирает дату движения"""
+        stale = Product.objects.get(pk=product.pk)
+        self._product_op(user, product)
+        stale.name = 'Переименованный'
+        stale.save()
+
+        product.refresh_from_db()
+        assert product.name == 'Переименованный'
+        assert product.last_movement_at is not None
+
+    def test_material_trigger(self, user, material):
+        MaterialOperation.objects.all().delete()
+        op = MaterialOperation.objects.create(
+            material=material, operation_type='incoming', quantity=1, user=user
+        )
+        material.refresh_from_db()
+        assert material.last_movement_at == op.date
+
+    def test_report_buckets_and_db_pagination(self, client, user, product, material):
+        """Корзины возраста считаются в SQL, страница берется из БД"""
+        from reports.servises import get_stock_ageing_queryset
+        ProductOperation.objects.all().delete()
+        MaterialOperation.objects.all().delete()
+        now = timezone.now()
+        self._product_op(user, product, now - timedelta(days=100))
+        op_m = MaterialOperation.objects.create(
+            material=material, operation_type='incoming', quantity=1, user=user
+        )
+        MaterialOperation.objects.filter(id=op_m.id).update(date=now - timedelta(days=45))
+
+        rows = list(get_stock_ageing_queryset('asc'))
+        assert [r['ageing_bucket'] for r in rows] == ['stale', 'slow']
+        assert rows[0]['ageing_days'] == 100
+
+        report = _run_report('stock_ageing', user, {'sort': 'desc'})
+        items = report['items']
+        assert [item['sku'] for item in items] == [material.article, product.sku]
+        assert items[0]['unit'] == material.unit.short_name
+        assert report['count'] == 2
+
+
 @pytest.mark.django_db
 class TestMovementReportRobustness:
     def test_per_page_validation(self, client, admin_user):
@@ -648,4 +709,201 @@ class TestMovementReportRobustness:
         
         # Кейс 2: Не число (должно сброситься на 25)
         response = client.get(url, {'per_page': 'invalid'})
-        assert response.context['per_page'] == 25
\ No newline at end of file
+        assert response.context['per_page'] == 25
+
+@pytest.mark.django_db
+class TestMovementKeysetPagination:
+    def _make_ops(self, user, product, material, count):
+        """Создает по count операций в каждом журнале с одинаковым временем"""
+        ct = ContentType.objects.get_for_model(product)
+        moment = timezone.now().replace(microsecond=0)
+        for _ in range(count):
+            op = ProductOperation.objects.create(
+                product=product, operation_type='incoming', quantity=1,
+                content_type=ct, object_id=product.id, user=user
+            )
+            ProductOperation.objects.filter(id=op.id).update(timestamp=moment)
+            op_m = MaterialOperation.objects.create(
+                material=material, operation_type='incoming', quantity=1, user=user
+            )
+            MaterialOperation.objects.filter(id=op_m.id).update(date=moment)
+
+    def test_pages_cover_all_rows_without_duplicates(self, user, product, material):
+        """Курсор корректно проходит оба журнала даже при одинаковых timestamp"""
+        from reports.servises import get_movement_page, decode_movement_cursor
+        ProductOperation.objects.all().delete()
+        MaterialOperation.objects.all().delete()
+        self._make_ops(user, product, material, 4)
+
+        seen = []
+        cursor = None
+        while True:
+            page = get_movement_page({}, 3, cursor)
+            seen.extend((op['warehouse'], op['timestamp']) for op in page)
+            if not page.has_next:
+                break
+            cursor = decode_movement_cursor(page.next_cursor)
+
+        assert len(seen) == 8
+        assert sum(1 for w, _ in seen if w == 'Готовая продукция') == 4
+
+    def test_view_next_link(self, client, admin_user, product, material):
+        """Вьюха отдает курсор следующей страницы и принимает его"""
+        ProductOperation.objects.all().delete()
+        MaterialOperation.objects.all().delete()
+        self._make_ops(admin_user, product, material, 2)
+        client.force_login(admin_user)
+        url = reverse('movement_report')
+
+        first = client.get(url, {'per_page': 3}).context['page_obj']
+        assert first.has_next
+        second = client.get(url, {'per_page': 3, 'after': first.next_cursor}).context['page_obj']
+        assert len(second) == 1
+        assert not second.has_next
+
+    def test_invalid_cursor_falls_back_to_first_page(self, client, admin_user, product_operation_incoming):
+        client.force_login(admin_user)
+        response = client.get(reverse('movement_report'), {'after': 'garbage'})
+        assert response.status_code == 200
+        assert response.context['page_obj'].is_first
+
+    def test_invalid_filters_show_nothing(self, client, admin_user, product_operation_incoming):
+        """Ошибочный фильтр — пустая страница с ошибкой, а не весь журнал"""
+        client.force_login(admin_user)
+        url = reverse('movement_report')
+        response = client.get(url, {'start_date': 'not-a-date'})
+        assert response.status_code == 200
+        assert len(response.context['page_obj']) == 0
+        assert response.context['filter_form'].errors
+
+        export = client.get(url, {'start_date': 'not-a-date', 'export_csv': '1'})
+        assert export['Content-Type'].startswith('text/html')
+
+    def test_unbound_form_shows_whole_journal(self, client, admin_user, product_operation_incoming):
+        client.force_login(admin_user)
+        assert len(client.get(reverse('movement_report')).context['page_obj']) >= 1
+
+    def test_sources_loaded_in_bulk(self, user, product, shipment, django_assert_max_num_queries):
+        """Документы-основания грузятся одним запросом на тип, а не на строку"""
+        from reports.servises import get_movement_page
+        shipment_ct = ContentType.objects.get_for_model(shipment)
+        for _ in range(10):
+            ProductOperation.objects.create(
+                product=product, operation_type='shipment', quantity=1,
+                content_type=shipment_ct, object_id=shipment.id, user=user
+            )
+        ContentType.objects.get_for_id(shipment_ct.id)  # прогреваем кэш ContentType
+
+        with django_assert_max_num_queries(2):
+            page = get_movement_page({}, 25)
+        assert all(op['source'] == str(shipment) for op in page)
+
+
+@pytest.mark.django_db
+class TestMovementStreamingExport:
+    def test_csv_export_streams_rows(self, client, admin_user, material_operation_incoming, product_operation_incoming):
+        client.force_login(admin_user)
+        response = client.get(reverse('movement_report'), {'export_csv': '1'})
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert 'movement_report.csv' in response['Content-Disposition']
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').strip().splitlines()
+        assert lines[0].startswith('Дата и время;Склад')
+        assert len(lines) == 3
+
+    def test_excel_export_row_cap(self, client, admin_user, settings, material_operation_incoming, product_operation_incoming):
+        """При превышении лимита выгрузка обрезается и помечается"""
+        settings.REPORT_EXPORT_MAX_ROWS = 1
+        client.force_login(admin_user)
+        response = client.get(reverse('movement_report'), {'export_excel': '1'})
+
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        assert sheet.max_row == 3  # заголовок + 1 строка + пометка об обрезке
+        assert 'ограничена 1' in sheet.cell(row=3, column=1).value
+
+    def test_background_export_creates_job(self, client, admin_user, mocker):
+        """Фоновая выгрузка создает ReportJob и возвращает на страницу отчета"""
+        from reports.models import ReportJob
+        mocker.patch('reports.tasks.run_report_job.delay')
+        client.force_login(admin_user)
+        response = client.get(reverse('movement_report'), {
+            'export_excel': '1', 'export_background': '1', 'item_search': 'Тест'
+        })
+
+        assert response.status_code == 302
+        job = ReportJob.objects.get()
+        assert job.report_type == 'movement_xlsx'
+        assert job.params == {'item_search': 'Тест'}
+
+
+@pytest.mark.django_db
+class TestDailySalesFacts:
+    def test_ship_and_return_update_facts(self, client, user, shipment, product, package):
+        """Отгрузка пополняет витрину, возврат вычитает"""
+        from reports.models import DailySalesFact
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=2, price=100)
+        ShipmentItem.objects.create(shipment=shipment, package=package, quantity=1, price=500)
+        shipment.ship(user)
+
+        facts = {f.is_package: f for f in DailySalesFact.objects.all()}
+        assert facts[False].revenue == Decimal('200') and facts[False].units == 2
+        assert facts[True].revenue == Decimal('500') and facts[True].units == package.quantity
+        assert facts[True].product_id == product.id  # упаковка учитывается по базовому товару
+        assert facts[True].category_id == product.category_id
+
+        client.force_login(user)
+        client.post(reverse('shipment_return', kwargs={'pk': shipment.pk}))
+        assert all(f.revenue == 0 for f in DailySalesFact.objects.all())
+        data = json.loads(client.get(reverse('sales_by_product_api')).content)
+        assert data['data'] == []
+
+    def test_same_day_shipments_accumulate(self, user, sender, product):
+        from warehouse2.models import Shipment
+        from reports.models import DailySalesFact
+        for _ in range(2):
+            s = Shipment.objects.create(created_by=user, sender=sender)
+            ShipmentItem.objects.create(shipment=s, product=product, quantity=1, price=10)
+            s.ship(user)
+
+        fact = DailySalesFact.objects.get()
+        assert fact.quantity == 2
+        assert fact.revenue == Decimal('20')
+
+    def test_rebuild_matches_incremental(self, user, shipment, product, package):
+        from django.core.management import call_command
+        from reports.models import DailySalesFact
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=3, price=100)
+        ShipmentItem.objects.create(shipment=shipment, package=package, quantity=1, price=500)
+        shipment.ship(user)
+        incremental = sorted(DailySalesFact.objects.values_list('day', 'product', 'is_package', 'units', 'revenue'))
+
+        DailySalesFact.objects.all().delete()
+        call_command('rebuild_sales_facts')
+        rebuilt = sorted(DailySalesFact.objects.values_list('day', 'product', 'is_package', 'units', 'revenue'))
+        assert rebuilt == incremental
+
+    def test_migration_backfills_existing_shipments(self, user, shipment, product, package):
+        from importlib import import_module
+        from django.apps import apps
+        from django.db import connection
+        from reports.models import DailySalesFact
+        migration = import_module('reports.migrations.0006_backfill_daily_sales_facts')
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=3, price=100)
+        ShipmentItem.objects.create(shipment=shipment, package=package, quantity=1, price=500)
+        shipment.ship(user)
+        incremental = sorted(DailySalesFact.objects.values_list('day', 'product', 'category', 'is_package', 'units', 'revenue'))
+
+        DailySalesFact.objects.all().delete()
+        with connection.schema_editor() as schema_editor:
+            migration.backfill_daily_sales_facts(apps, schema_editor)
+        backfilled = sorted(DailySalesFact.objects.values_list('day', 'product', 'category', 'is_package', 'units', 'revenue'))
+        assert backfilled == incremental
+
+    def test_chart_reads_facts_only(self, client, user, shipment, product, django_assert_num_queries):
+        ShipmentItem.objects.create(shipment=shipment, product=product, quantity=1, price=10)
+        shipment.ship(user)
+        from reports.servises import get_sales_chart_data
+        with django_assert_num_queries(1):
+            data = get_sales_chart_data('week')
+        assert data['data'] == [10.0]
@@ -0,0 +1,72 @@
+import pytest
+from django.urls import reverse
+from todo.models import ProductionOrder, ProductionOrderItem, WorkOrder
+from todo.servises import report_production
+from warehouse2.models import Product
+
+
+@pytest.fixture
+def board(product):
+    order = ProductionOrder.objects.create(customer="Доска", due_date="2025-12-31")
+    item = ProductionOrderItem.objects.create(production_order=order, product=product,
+                                              quantity_requested=10, quantity_planned=10)
+    ProductionOrderItem.objects.create(production_order=order, product=Product.objects.create(name="P2", sku="S2"),
+                                       quantity_requested=5, quantity_produced=1)
+    wo = WorkOrder.objects.create(order_item=item, product=product, quantity_planned=10)
+    return order, wo
+
+
+def _state(client, order, wo, **headers):
+    return client.get(reverse('production_board_state'),
+                      {'orders': f'{order.pk},x', 'work_orders': str(wo.pk)}, **headers)
+
+
+@pytest.mark.django_db
+class TestProductionBoardState:
+    def test_state_matches_report_payload(self, client, user, board):
+        order, wo = board
+        _, _, data = report_production(wo.pk, 4, user)
+        client.force_login(user)
+
+        state = _state(client, order, wo).json()
+
+        assert state['work_orders'] == [{'work_order_id': wo.pk, **data}]
+        assert state['orders'] == [{
+            'order_id': order.pk, 'order_requested': 15, 'order_produced': 5,
+            'order_status': ProductionOrder.Status.PARTIAL,
+            'order_status_label': ProductionOrder.Status.PARTIAL.label,
+        }]
+
+    def test_unchanged_state_returns_304(self, client, user, board):
+        order, wo = board
+        client.force_login(user)
+        first = _state(client, order, wo)
+        assert first.status_code == 200 and first['ETag']
+
+        same = _state(client, order, wo, HTTP_IF_NONE_MATCH=first['ETag'])
+        assert same.status_code == 304 and same.content == b''
+
+        report_production(wo.pk, 2, user)
+        changed = _state(client, order, wo, HTTP_IF_NONE_MATCH=first['ETag'])
+        assert changed.status_code == 200
+        assert changed.json()['work_orders'][0]['new_produced'] == 2
+
+    def test_ids_are_capped(self, client, user, board, settings):
+        settings.PRODUCTION_BOARD_MAX_IDS = 1
+        order, wo = board
+        other = ProductionOrder.objects.create(customer="Вторая", due_date="2025-12-31")
+        client.force_login(user)
+
+        response = client.get(reverse('production_board_state'), {'orders': f'{order.pk},{other.pk}'})
+
+        assert [o['order_id'] for o in response.json()['orders']] == [order.pk]
+        assert response.json()['work_orders'] == []
+
+    def test_pages_poll_state(self, client, user, board):
+        order, _ = board
+        client.force_login(user)
+        for url in (reverse('workorder_list'), reverse('workorder_detail', args=[order.pk])):
+            assert reverse('production_board_state').encode() in client.get(url).content
+
+    def test_view_requires_login(self, client):
+        assert client.get(reverse('production_board_state')).status_code == 302
@@ -49,4 +49,86 @@ def test_production_order_status_logic(product):
 
     # Проверяем статус COMPLETED
     order.refresh_from_db()
-    assert order.status == ProductionOrder.Status.COMPLETED
\ No newline at end of file
+    assert order.status == ProductionOrder.Status.COMPLETED
+
+@pytest.mark.django_db
+def test_production_order_with_totals(product, package, user, sender):
+    """Суммы считаются подзапросами и совпадают с расчетом по строкам"""
+    from warehouse2.models import Product, Shipment, ShipmentItem
+    other = Product.objects.create(name="Второй товар", sku="TEST-SKU-002", category=product.category, total_quantity=100)
+    order = ProductionOrder.objects.create(customer="Итоги", due_date="2025-12-31")
+    ProductionOrderItem.objects.create(production_order=order, product=product,
+                                       quantity_requested=10, quantity_planned=8, quantity_produced=5)
+    ProductionOrderItem.objects.create(production_order=order, product=other,
+                                       quantity_requested=4, quantity_planned=4, quantity_produced=4)
+    shipment = Shipment.objects.create(created_by=user, sender=sender)
+    ShipmentItem.objects.create(shipment=shipment, product=product, quantity=6, price=1)
+    ShipmentItem.objects.create(shipment=shipment, product=other, quantity=3, price=1)
+    order.linked_shipment = shipment
+    order.save()
+
+    annotated = ProductionOrder.objects.with_totals().get(pk=order.pk)
+    plain = ProductionOrder.objects.get(pk=order.pk)
+
+    assert (annotated.total_requested, annotated.total_planned, annotated.total_produced, annotated.total_shipped) == (14, 12, 9, 9)
+    assert (plain.total_requested, plain.total_planned, plain.total_produced, plain.total_shipped) == (14, 12, 9, 9)
+    assert annotated.shipment_gap == 5 and annotated.is_under_shipped
+
+
+@pytest.mark.django_db
+def test_production_order_with_totals_empty_order():
+    order = ProductionOrder.objects.create(customer="Пустой", due_date="2025-12-31")
+    annotated = ProductionOrder.objects.with_totals().get(pk=order.pk)
+    assert (annotated.total_requested, annotated.total_produced, annotated.total_shipped) == (0, 0, 0)
+
+
+@pytest.mark.django_db
+class TestOrderLineCounters:
+    def _counters(self, order):
+        order.refresh_from_db()
+        return tuple(getattr(order, name) for name in ProductionOrder.COUNTER_FIELDS)
+
+    def test_counters_follow_item_changes(self, product, product_category):
+        from warehouse2.models import Product
+        other = Product.objects.create(name="Второй товар", sku="TEST-SKU-002", category=product_category)
+        order = ProductionOrder.objects.create(customer="Счетчики", due_date="2025-12-31")
+        item = ProductionOrderItem.objects.create(production_order=order, product=product, quantity_requested=10)
+        ProductionOrderItem.objects.create(production_order=order, product=other,
+                                           quantity_requested=2, quantity_planned=2)
+        assert self._counters(order) == (2, 0, 0, 1)
+
+        ProductionOrderItem.objects.filter(pk=item.pk).update(quantity_planned=10, quantity_produced=10)
+        assert self._counters(order) == (2, 1, 1, 2)
+
+        item.delete()
+        assert self._counters(order) == (1, 0, 0, 1)
+
+    def test_full_save_does_not_overwrite_counters(self, product):
+        order = ProductionOrder.objects.create(customer="Счетчики", due_date="2025-12-31")
+        ProductionOrderItem.objects.create(production_order=order, product=product, quantity_requested=5)
+        order.comment = "Изменено"  # объект в памяти еще со счетчиками = 0
+        order.save()
+        assert self._counters(order) == (1, 0, 0, 0)
+
+    def test_update_status_does_not_read_items(self, product, django_assert_num_queries):
+        order = ProductionOrder.objects.create(customer="Статус", due_date="2025-12-31")
+        ProductionOrderItem.objects.create(production_order=order, product=product,
+                                           quantity_requested=5, quantity_planned=5, quantity_produced=1)
+        # Чтение счетчиков + запись статуса
+        with django_assert_num_queries(2):
+            order.update_status()
+        assert order.status == ProductionOrder.Status.PARTIAL
+        with django_assert_num_queries(1):
+            order.update_status()
+
+    def test_repair_command(self, product):
+        from django.core.management import call_command
+        order = ProductionOrder.objects.create(customer="Ремонт", due_date="2025-12-31")
+        ProductionOrderItem.objects.create(production_order=order, product=product,
+                                           quantity_requested=5, quantity_planned=5, quantity_produced=5)
+        ProductionOrder.objects.filter(pk=order.pk).update(
+            lines_count=7, completed_lines=0, produced_lines=0, planned_lines=0
+        )
+        call_command('recalculate_order_counters')
+        assert self._counters(order) == (1, 1, 1, 1)
+        assert order.status == ProductionOrder.Status.COMPLETED
@@ -1,11 +1,11 @@
 import pytest
 import json
-from django.urls import reverse
-from todo.models import WorkOrder, ProductionOrder, ProductionOrderItem
+from django.urls import reverse, reverse_lazy
+from todo.models import WorkOrder, ProductionOrder, ProductionOrderItem, ProductionReportReceipt
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.messages import get_messages
-from warehouse2.models import Shipment, Sender, Product
+from warehouse2.models import Shipment, Sender, Product, ProductOperation
 
 
 @pytest.mark.django_db
@@ -206,6 +206,84 @@ def test_create_shipment_from_order(client, user, product):
 
 
 
+@pytest.mark.django_db
+class TestCreateShipmentFromOrders:
+    url = reverse_lazy('portfolio_create_shipment_bulk')
+
+    def _produced_order(self, product, produced, customer="Заказчик"):
+        order = ProductionOrder.objects.create(customer=customer, due_date="2025-01-01")
+        ProductionOrderItem.objects.create(production_order=order, product=product,
+                                           quantity_requested=produced, quantity_produced=produced)
+        return order
+
+    def test_several_orders_into_one_shipment(self, client, user, product, mocker, django_capture_on_commit_callbacks):
+        client.force_login(user)
+        push = mocker.patch('todo.servises.update_stocks_in_keycrm.delay')
+        other = Product.objects.create(name="P2", sku="S2", total_quantity=50)
+        first = self._produced_order(product, 10, customer="А")
+        second = self._produced_order(product, 5, customer="Б")
+        ProductionOrderItem.objects.create(production_order=second, product=other,
+                                           quantity_requested=3, quantity_produced=3)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(self.url, {'selected_orders': [first.pk, second.pk]})
+
+        shipment = Shipment.objects.get()
+        assert response.status_code == 302
+        assert response.url == reverse('shipment_items', kwargs={'pk': shipment.pk})
+        assert shipment.destination == "А, Б"
+        assert dict(shipment.items.values_list('product_id', 'quantity')) == {product.pk: 15, other.pk: 3}
+        product.refresh_from_db()
+        assert product.reserved_quantity == 20 + 15
+        for order in (first, second):
+            order.refresh_from_db()
+            assert order.linked_shipment == shipment
+            assert order.status == ProductionOrder.Status.SHIPPED
+        assert set(ProductionOrderItem.objects.values_list('status', flat=True)) == {ProductionOrderItem.Status.SHIPPED}
+        push.assert_called_once()
+        assert sorted(push.call_args.args[0]) == sorted([product.pk, other.pk])
+
+    def test_shortage_creates_nothing(self, client, user, product):
+        client.force_login(user)
+        other = Product.objects.create(name="P2", sku="S2", total_quantity=1)
+        first = self._produced_order(product, 10)
+        second = self._produced_order(other, 5)
+
+        client.post(self.url, {'selected_orders': [first.pk, second.pk]})
+
+        assert not Shipment.objects.exists()
+        product.refresh_from_db()
+        assert product.reserved_quantity == 20  # как в фикстуре
+        first.refresh_from_db()
+        assert first.linked_shipment is None
+
+    def test_already_shipped_order_is_rejected(self, client, user, product):
+        client.force_login(user)
+        order = self._produced_order(product, 5)
+        client.post(reverse('portfolio_create_shipment', kwargs={'pk': order.pk}))
+        client.post(self.url, {'selected_orders': [order.pk]})
+        assert Shipment.objects.count() == 1
+
+    def test_query_count_does_not_grow_with_lines(self, client, user, product_category):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        client.force_login(user)
+        Sender.objects.create(name="Основной")
+
+        def measure(count):
+            order = ProductionOrder.objects.create(customer="Много строк", due_date="2025-01-01")
+            for i in range(count):
+                p = Product.objects.create(name=f"Q{count}-{i}", sku=f"Q{count}-{i}",
+                                           category=product_category, total_quantity=10)
+                ProductionOrderItem.objects.create(production_order=order, product=p,
+                                                   quantity_requested=2, quantity_produced=2)
+            with CaptureQueriesContext(connection) as queries:
+                client.post(self.url, {'selected_orders': [order.pk]})
+            return len(queries)
+
+        assert measure(1) == measure(6)
+
+
 # ============================================================================
 # Тесты для ProductionOrderUpdateView
 # ============================================================================
@@ -423,19 +501,9 @@ class TestPlanWorkOrdersView:
         client.force_login(user)
         url = reverse('portfolio_plan_workorders', kwargs={'pk': production_order.pk})
         
-        # Mocking managers напрямую сложен, лучше мокать метод save модели или create менеджера
-        original_create = WorkOrder.objects.create
-        call_count = 0
-        
-        def mock_create(**kwargs):
-            nonlocal call_count
-            call_count += 1
-            if call_count == 2:  
-                raise Exception("DB Error")
-            return original_create(**kwargs)
-        
-
-        mocker.patch.object(WorkOrder.objects, 'create', side_effect=mock_create)
+        # Задания создаются пакетом (bulk_create), затем пакетом обновляются строки —
+        # роняем второй шаг: созданные задания должны откатиться
+        mocker.patch.object(ProductionOrderItem.objects, 'bulk_update', side_effect=Exception("DB Error"))
         
         product2 = Product.objects.create(name="P2", sku="S2", total_quantity=100)
         ProductionOrderItem.objects.create(production_order=production_order, product=product2, quantity_requested=75)
@@ -452,4 +520,244 @@ class TestPlanWorkOrdersView:
         # Статусы должны остаться прежними
         for item in production_order.items.all():
             item.refresh_from_db()
-            assert item.quantity_planned == 0
\ No newline at end of file
+            assert item.quantity_planned == 0
+
+
+
+@pytest.mark.django_db
+class TestReportBatchApi:
+    url = reverse_lazy('api_workorder_report_batch')
+
+    def _post(self, client, reports):
+        return client.post(self.url, data=json.dumps({'reports': reports}), content_type='application/json')
+
+    def test_batch_is_grouped_per_work_order(self, client, user, product):
+        client.force_login(user)
+        first = WorkOrder.objects.create(product=product, quantity_planned=10)
+        second = WorkOrder.objects.create(product=product, quantity_planned=10)
+
+        response = self._post(client, [
+            {'key': 'a', 'workorder_id': first.pk, 'quantity': 2},
+            {'key': 'b', 'workorder_id': second.pk, 'quantity': 4},
+            {'key': 'c', 'workorder_id': first.pk, 'quantity': 3},
+        ])
+
+        results = response.json()['results']
+        assert [r['key'] for r in results] == ['a', 'b', 'c']
+        assert {r['status'] for r in results} == {'applied'}
+        first.refresh_from_db()
+        assert first.quantity_produced == 5
+        # Одна операция на задание, а не на каждый клик
+        assert ProductOperation.objects.filter(object_id=first.pk).count() == 1
+        product.refresh_from_db()
+        assert product.total_quantity == 100 + 9
+
+    def test_retry_does_not_double_count(self, client, user, product):
+        client.force_login(user)
+        wo = WorkOrder.objects.create(product=product, quantity_planned=10)
+        reports = [{'key': 'retry-1', 'workorder_id': wo.pk, 'quantity': 3}]
+
+        self._post(client, reports)
+        response = self._post(client, reports + [{'key': 'retry-2', 'workorder_id': wo.pk, 'quantity': 1}])
+
+        results = response.json()['results']
+        assert results[0]['status'] == 'duplicate'
+        assert results[0]['original_status'] == ProductionReportReceipt.Status.APPLIED
+        assert results[1]['status'] == 'applied'
+        wo.refresh_from_db()
+        assert wo.quantity_produced == 4
+
+    def test_per_report_outcomes(self, client, user, product):
+        client.force_login(user)
+        done = WorkOrder.objects.create(product=product, quantity_planned=1, quantity_produced=1,
+                                        status=WorkOrder.Status.COMPLETED)
+        results = self._post(client, [
+            {'key': 'x', 'workorder_id': 999999, 'quantity': 1},
+            {'key': 'y', 'workorder_id': done.pk, 'quantity': 1},
+            {'key': 'z', 'workorder_id': done.pk, 'quantity': 0},
+            {'key': 'y', 'workorder_id': done.pk, 'quantity': 1},
+        ]).json()['results']
+
+        assert [r['status'] for r in results] == ['rejected', 'rejected', 'invalid', 'duplicate']
+        assert results[0]['message'] == "Задание не найдено"
+        assert ProductionReportReceipt.objects.get(key='y').status == ProductionReportReceipt.Status.REJECTED
+
+    def test_empty_and_oversized_batches(self, client, user, settings):
+        client.force_login(user)
+        settings.PRODUCTION_REPORT_BATCH_MAX = 1
+        assert self._post(client, []).status_code == 400
+        reports = [{'key': str(i), 'workorder_id': 1, 'quantity': 1} for i in range(2)]
+        assert self._post(client, reports).status_code == 400
+
+
+@pytest.mark.django_db
+class TestPlanWorkOrdersApi:
+    url = reverse_lazy('api_workorders_plan')
+
+    def _post(self, client, payload):
+        return client.post(self.url, data=json.dumps(payload), content_type='application/json')
+
+    def _make_orders(self, product, count):
+        items = []
+        for i in range(count):
+            order = ProductionOrder.objects.create(customer=f"Сетка {i}", due_date="2026-03-01")
+            items.append(ProductionOrderItem.objects.create(production_order=order, product=product, quantity_requested=10))
+        return items
+
+    def test_plans_grid_across_orders(self, client, user, product):
+        client.force_login(user)
+        first, second = self._make_orders(product, 2)
+        response = self._post(client, {'lines': [
+            {'item_id': first.pk, 'quantity': 4},
+            {'item_id': second.pk},
+        ]})
+        assert response.status_code == 200
+        assert len(response.json()['work_orders']) == 2
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert (first.quantity_planned, second.quantity_planned) == (4, 10)
+        assert first.status == ProductionOrderItem.Status.PLANNED
+        assert ProductionOrder.objects.get(pk=first.production_order_id).status == ProductionOrder.Status.PLANNED
+        assert WorkOrder.objects.filter(order_item=first).get().quantity_planned == 4
+
+    def test_query_count_does_not_grow_with_lines(self, client, user, product):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        client.force_login(user)
+
+        def measure(items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post(client, {'lines': [{'item_id': item.pk} for item in items]})
+            assert response.status_code == 200
+            return len(queries)
+
+        assert measure(self._make_orders(product, 1)) == measure(self._make_orders(product, 5))
+
+    def test_overplanning_rolls_back_whole_grid(self, client, user, product):
+        client.force_login(user)
+        first, second = self._make_orders(product, 2)
+        response = self._post(client, {'lines': [
+            {'item_id': first.pk, 'quantity': 5},
+            {'item_id': second.pk, 'quantity': 11},
+        ]})
+        assert response.status_code == 400
+        assert not WorkOrder.objects.exists()
+        first.refresh_from_db()
+        assert first.quantity_planned == 0
+
+    def test_bad_payload(self, client, user):
+        client.force_login(user)
+        assert self._post(client, {'lines': [{'quantity': 1}]}).status_code == 400
+        assert self._post(client, {'lines': [{'item_id': 999999}]}).status_code == 400
+
+    def test_requires_login(self, client):
+        response = self._post(client, {'lines': []})
+        assert response.status_code == 302
+
+
+def _count_queries(client, url):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries), response
+
+
+def _create_orders(product, count, with_workorders=False):
+    for i in range(count):
+        order = ProductionOrder.objects.create(customer=f"Заказчик {i}", due_date="2026-03-01")
+        item = ProductionOrderItem.objects.create(production_order=order, product=product, quantity_requested=10)
+        if with_workorders:
+            WorkOrder.objects.create(order_item=item, product=product, quantity_planned=10)
+
+
+@pytest.mark.django_db
+def test_portfolio_list_query_count_does_not_grow(client, user, product):
+    """Список заказов: суммы в одном запросе, а не по запросу на заказ"""
+    client.force_login(user)
+    _create_orders(product, 1)
+    single, _ = _count_queries(client, reverse('portfolio_list'))
+    _create_orders(product, 5)
+    many, response = _count_queries(client, reverse('portfolio_list'))
+
+    assert many == single
+    assert response.context['orders'][0].total_requested == 10
+
+
+@pytest.mark.django_db
+def test_dashboard_attaches_order_totals(client, user, product):
+    client.force_login(user)
+    _create_orders(product, 1, with_workorders=True)
+    single, _ = _count_queries(client, reverse('start-page'))
+    _create_orders(product, 5, with_workorders=True)
+    many, response = _count_queries(client, reverse('start-page'))
+
+    assert many == single
+    workorder = response.context['pending_workorders'][0]
+    assert workorder.order_item.production_order.annotated_requested_total == 10
+
+
+@pytest.mark.django_db
+class TestFastReportProduction:
+    def _order(self, product, requested=10):
+        order = ProductionOrder.objects.create(customer="Цех", due_date="2026-03-01")
+        item = ProductionOrderItem.objects.create(
+            production_order=order, product=product, quantity_requested=requested, quantity_planned=requested,
+            status=ProductionOrderItem.Status.PLANNED
+        )
+        order.update_status()
+        work_order = WorkOrder.objects.create(order_item=item, product=product, quantity_planned=requested)
+        return order, item, work_order
+
+    def test_matches_model_path(self, user, product):
+        """Быстрый путь приводит к тем же данным, что и WorkOrder.report_production"""
+        from todo.servises import report_production
+        order, item, work_order = self._order(product)
+
+        success, _, data = report_production(work_order.pk, 4, user)
+        assert success and data['new_produced'] == 4 and data['remaining'] == 6
+        work_order.refresh_from_db(); item.refresh_from_db(); order.refresh_from_db()
+        assert work_order.status == WorkOrder.Status.IN_PROGRESS
+        assert item.quantity_produced == 4 and item.status == ProductionOrderItem.Status.PARTIAL
+        assert order.status == ProductionOrder.Status.PARTIAL
+
+        success, _, data = report_production(work_order.pk, 6, user)
+        assert data['is_completed'] and data['status_label'] == 'Выполнен'
+        work_order.refresh_from_db(); item.refresh_from_db(); order.refresh_from_db()
+        assert work_order.status == WorkOrder.Status.COMPLETED and work_order.completed_at
+        assert item.status == ProductionOrderItem.Status.COMPLETED
+        assert order.status == ProductionOrder.Status.COMPLETED
+        product.refresh_from_db()
+        assert product.total_quantity == 110
+        assert ProductOperation.objects.filter(object_id=work_order.pk, operation_type='production').count() == 2
+
+        success, message, _ = report_production(work_order.pk, 1, user)
+        assert not success and message == "Задание уже завершено"
+
+    def test_query_budget(self, user, product, django_assert_max_num_queries):
+        from todo.servises import report_production
+        _, _, work_order = self._order(product)
+        report_production(work_order.pk, 1, user)  # первый отчет меняет статусы
+        # Дальше статусы не меняются: только счетчики, журнал и пересчет статуса заказа
+        # (счетчик поступлений для проверки работ пишет сигнал payroll — отдельный запрос)
+        with django_assert_max_num_queries(8):
+            report_production(work_order.pk, 1, user)
+
+    def test_unknown_workorder_returns_404(self, client, user):
+        client.force_login(user)
+        response = client.post(
+            reverse('api_workorder_report'),
+            data=json.dumps({'workorder_id': 999999, 'quantity': 1}),
+            content_type='application/json'
+        )
+        assert response.status_code == 404
+
+    def test_benchmark_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('benchmark_report_production', iterations=3, items=2, stdout=out)
+        assert 'Ускорение' in out.getvalue()
+        assert not WorkOrder.objects.exists()  # данные бенчмарка откатываются
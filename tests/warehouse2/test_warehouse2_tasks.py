@@ -0,0 +1,34 @@
+import pytest
+from warehouse2.models import Product
+from warehouse2.tasks import update_stock_in_keycrm, update_stocks_in_keycrm, KEYCRM_STOCKS_URL
+
+
+@pytest.mark.django_db
+class TestKeycrmStockTasks:
+    def test_single_and_batch_send_same_payload(self, mock_external_requests):
+        mock_put, _ = mock_external_requests
+        product = Product.objects.create(name="Подушка", sku="KC-1", keycrm_id=7, total_quantity=10, reserved_quantity=3)
+        Product.objects.create(name="Без CRM", sku="KC-2", total_quantity=5)
+
+        update_stock_in_keycrm(product.pk)
+        update_stocks_in_keycrm([product.pk, product.pk + 1])
+
+        single, batch = [call.kwargs['json'] for call in mock_put.call_args_list]
+        assert single == batch == {'warehouse_id': 2, 'stocks': [{'sku': 'KC-1', 'quantity': 7}]}
+        assert all(call.args[0] == KEYCRM_STOCKS_URL for call in mock_put.call_args_list)
+
+    def test_validation_error_is_reported(self, mock_external_requests):
+        mock_put, _ = mock_external_requests
+        mock_put.return_value.status_code = 422
+        mock_put.return_value.json.return_value = {'message': 'bad sku'}
+        product = Product.objects.create(name="Подушка", sku="KC-1", keycrm_id=7)
+
+        assert update_stocks_in_keycrm([product.pk]).startswith("Ошибка валидации")
+
+    def test_batch_skips_empty_keycrm_id(self, mock_external_requests):
+        mock_put, _ = mock_external_requests
+        product = Product.objects.create(name="Пустой ID", sku="KC-0", keycrm_id=0, total_quantity=5)
+
+        assert update_stock_in_keycrm(product.pk).startswith("Пропущено")
+        assert update_stocks_in_keycrm([product.pk]).startswith("Пропущено")
+        assert not mock_put.called
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from todo.models import ProductionOrder, ProductionOrderItem, WorkOrder
+from todo.models import ProductionOrder, ProductionOrderItem, WorkOrder, ProductionReportReceipt
 
 # --- Inlines (Встроенные формы для связанных моделей) ---
 
@@ -80,4 +80,19 @@ class WorkOrderAdmin(admin.ModelAdmin):
         ('Планирование и выполнение', {
             'fields': ('quantity_planned', 'quantity_produced', 'status', 'start_time', 'end_time', 'comment'),
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(ProductionReportReceipt)
+class ProductionReportReceiptAdmin(admin.ModelAdmin):
+    """Квитанции пакетных отчетов с планшетов (только просмотр)"""
+    list_display = ('key', 'work_order', 'quantity', 'status', 'user', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('key',)
+    raw_id_fields = ('work_order', 'user')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,82 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+from warehouse2.models import Product, ProductCategory, ProductOperation
+from warehouse2.signals import trigger_stock_update_on_operation, trigger_product_sync
+from todo.models import ProductionOrder, ProductionOrderItem, WorkOrder
+from todo.servises import report_production
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает старый путь регистрации выпуска (WorkOrder.report_production) '
+        'с быстрым (todo.servises.report_production). Данные создаются во временной '
+        'транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Сколько отчетов по каждому пути')
+        parser.add_argument('--items', type=int, default=20, help='Строк в тестовом заказе')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        # Синхронизация с CRM в замер не входит (и не должна уходить в очередь)
+        receivers = [(trigger_stock_update_on_operation, ProductOperation), (trigger_product_sync, Product)]
+        disconnected = [(receiver, sender) for receiver, sender in receivers
+                        if post_save.disconnect(receiver, sender=sender)]
+        try:
+            with transaction.atomic():
+                results = [
+                    self.run_path('Старый путь (модель)', self.legacy_report, iterations, options['items']),
+                    self.run_path('Быстрый путь (сервис)', self.fast_report, iterations, options['items']),
+                ]
+                transaction.set_rollback(True)
+        finally:
+            for receiver, sender in disconnected:
+                post_save.connect(receiver, sender=sender)
+
+        for name, total, queries in results:
+            self.stdout.write(
+                f'{name}: {total / iterations * 1000:.2f} мс/отчет, '
+                f'{queries / iterations:.1f} запросов/отчет'
+            )
+        legacy, fast = results[0][1], results[1][1]
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{legacy / fast:.2f}'))
+
+    @staticmethod
+    def legacy_report(work_order_id, user):
+        # Как раньше делала вьюха: get() и метод модели
+        WorkOrder.objects.get(pk=work_order_id).report_production(1, user)
+
+    @staticmethod
+    def fast_report(work_order_id, user):
+        report_production(work_order_id, 1, user)
+
+    def make_fixture(self, items):
+        user = User.objects.create(username=f'benchmark_{time.monotonic_ns()}')
+        category = ProductCategory.objects.create(name=f'Бенчмарк {user.pk}')
+        order = ProductionOrder.objects.create(customer='Бенчмарк', due_date='2030-01-01')
+        work_order = None
+        for i in range(items):
+            product = Product.objects.create(name=f'Бенчмарк {i}', sku=f'BENCH-{user.pk}-{i}', category=category)
+            item = ProductionOrderItem.objects.create(
+                production_order=order, product=product,
+                quantity_requested=10 ** 6, quantity_planned=10 ** 6,
+            )
+            # Отчитываемся по одной строке, остальные — для реалистичного пересчета статуса заказа
+            work_order = work_order or WorkOrder.objects.create(
+                order_item=item, product=product, quantity_planned=10 ** 6
+            )
+        return work_order.pk, user
+
+    def run_path(self, name, report, iterations, items):
+        work_order_id, user = self.make_fixture(items)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                report(work_order_id, user)
+            total = time.perf_counter() - started
+        return name, total, len(queries)
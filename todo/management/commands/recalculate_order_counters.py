@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from todo.models import ProductionOrder
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики строк заказов на производство и статусы по ним (восстановление после сбоев)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Пересчет счетчиков строк заказов...'))
+        with transaction.atomic():
+            fixed_counters = ProductionOrder.recount_counters()
+
+            fields = ('id', 'status', 'linked_shipment_id') + ProductionOrder.COUNTER_FIELDS
+            changed = []
+            for row in ProductionOrder.objects.values_list(*fields).iterator():
+                order_id, status, shipment_id, *counters = row
+                new_status = ProductionOrder.status_from_counters(*counters, has_shipment=shipment_id is not None)
+                if new_status != status:
+                    changed.append(ProductionOrder(pk=order_id, status=new_status))
+            ProductionOrder.objects.bulk_update(changed, ['status'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Исправлено счетчиков: {fixed_counters}, статусов: {len(changed)}.'
+        ))
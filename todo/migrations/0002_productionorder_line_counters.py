@@ -0,0 +1,105 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:44
+
+from django.db import migrations, models
+
+
+ORDER_COUNTERS_TRIGGER_SQL = """
+-- Счетчики строк заказа: на каждое изменение строки — вычесть ее старый вклад
+-- и прибавить новый. Заказ обновляется, только если вклад реально изменился.
+CREATE OR REPLACE FUNCTION todo_productionorder_apply_line_delta(
+    order_id bigint, d_lines integer, d_completed integer, d_produced integer, d_planned integer
+) RETURNS void AS $$
+BEGIN
+    IF order_id IS NULL OR (d_lines = 0 AND d_completed = 0 AND d_produced = 0 AND d_planned = 0) THEN
+        RETURN;
+    END IF;
+    UPDATE todo_productionorder SET
+        lines_count = lines_count + d_lines,
+        completed_lines = completed_lines + d_completed,
+        produced_lines = produced_lines + d_produced,
+        planned_lines = planned_lines + d_planned
+    WHERE id = order_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION todo_productionorder_touch_counters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM todo_productionorder_apply_line_delta(
+            OLD.production_order_id, -1,
+            -(OLD.quantity_produced >= OLD.quantity_requested)::int,
+            -(OLD.quantity_produced > 0)::int,
+            -(OLD.quantity_planned > 0)::int
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM todo_productionorder_apply_line_delta(
+            NEW.production_order_id, 1,
+            (NEW.quantity_produced >= NEW.quantity_requested)::int,
+            (NEW.quantity_produced > 0)::int,
+            (NEW.quantity_planned > 0)::int
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER todo_productionorderitem_counters
+AFTER INSERT OR DELETE OR UPDATE OF production_order_id, quantity_requested, quantity_planned, quantity_produced
+ON todo_productionorderitem
+FOR EACH ROW EXECUTE FUNCTION todo_productionorder_touch_counters();
+
+-- Заполняем для существующих заказов
+UPDATE todo_productionorder po SET
+    lines_count = c.lines_count,
+    completed_lines = c.completed_lines,
+    produced_lines = c.produced_lines,
+    planned_lines = c.planned_lines
+FROM (
+    SELECT production_order_id,
+           COUNT(*) AS lines_count,
+           COUNT(*) FILTER (WHERE quantity_produced >= quantity_requested) AS completed_lines,
+           COUNT(*) FILTER (WHERE quantity_produced > 0) AS produced_lines,
+           COUNT(*) FILTER (WHERE quantity_planned > 0) AS planned_lines
+    FROM todo_productionorderitem
+    GROUP BY production_order_id
+) c
+WHERE po.id = c.production_order_id;
+"""
+
+DROP_ORDER_COUNTERS_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS todo_productionorderitem_counters ON todo_productionorderitem;
+DROP FUNCTION IF EXISTS todo_productionorder_touch_counters();
+DROP FUNCTION IF EXISTS todo_productionorder_apply_line_delta(bigint, integer, integer, integer, integer);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productionorder',
+            name='completed_lines',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Выполненных строк'),
+        ),
+        migrations.AddField(
+            model_name='productionorder',
+            name='lines_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Строк в заказе'),
+        ),
+        migrations.AddField(
+            model_name='productionorder',
+            name='planned_lines',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Строк в плане'),
+        ),
+        migrations.AddField(
+            model_name='productionorder',
+            name='produced_lines',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Строк с выпуском'),
+        ),
+        migrations.RunSQL(ORDER_COUNTERS_TRIGGER_SQL, DROP_ORDER_COUNTERS_TRIGGER_SQL),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todo', '0002_productionorder_line_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductionReportReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Ключ идемпотентности')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('status', models.CharField(choices=[('pending', 'Принят'), ('applied', 'Проведен'), ('rejected', 'Отклонен')], default='pending', max_length=20, verbose_name='Статус')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Результат')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Получен')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Сотрудник')),
+                ('work_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_receipts', to='todo.workorder', verbose_name='Задание')),
+            ],
+            options={
+                'verbose_name': 'Квитанция отчета о выпуске',
+                'verbose_name_plural': 'Квитанции отчетов о выпуске',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
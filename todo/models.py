@@ -1,14 +1,70 @@
 from django.db import models
-from django.db.models import F
+from django.db.models import F, Sum, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
 from warehouse2.models import Product, ProductOperation
-from django.db import transaction
+from django.db import transaction, connection
 
 # ==============================================================================
 # Модель 1: "Шапка" Заказа
 # ==============================================================================
+def _items_total_subquery(field):
+    """Сумма поля по строкам заказа одним подзапросом (без JOIN, чтобы суммы не размножались)."""
+    totals = ProductionOrderItem.objects.filter(
+        production_order=OuterRef('pk')
+    ).order_by().values('production_order').annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+
+
+# Пересчет счетчиков строк по всем заказам (см. ProductionOrder.recount_counters)
+RECOUNT_ORDER_COUNTERS_SQL = """
+    UPDATE todo_productionorder po SET
+        lines_count = COALESCE(c.lines_count, 0),
+        completed_lines = COALESCE(c.completed_lines, 0),
+        produced_lines = COALESCE(c.produced_lines, 0),
+        planned_lines = COALESCE(c.planned_lines, 0)
+    FROM todo_productionorder o
+    LEFT JOIN (
+        SELECT production_order_id,
+               COUNT(*) AS lines_count,
+               COUNT(*) FILTER (WHERE quantity_produced >= quantity_requested) AS completed_lines,
+               COUNT(*) FILTER (WHERE quantity_produced > 0) AS produced_lines,
+               COUNT(*) FILTER (WHERE quantity_planned > 0) AS planned_lines
+        FROM todo_productionorderitem
+        GROUP BY production_order_id
+    ) c ON c.production_order_id = o.id
+    WHERE po.id = o.id AND (
+        po.lines_count, po.completed_lines, po.produced_lines, po.planned_lines
+    ) IS DISTINCT FROM (
+        COALESCE(c.lines_count, 0), COALESCE(c.completed_lines, 0),
+        COALESCE(c.produced_lines, 0), COALESCE(c.planned_lines, 0)
+    )
+"""
+
+
+class ProductionOrderQuerySet(models.QuerySet):
+    # Имена аннотаций, которые понимают свойства total_* модели
+    TOTAL_ANNOTATIONS = (
+        'annotated_requested_total', 'annotated_planned_total',
+        'annotated_produced_total', 'annotated_shipped_total',
+    )
+
+    def with_totals(self):
+        """Аннотирует заказанное, запланированное, произведенное и отгруженное количество."""
+        from warehouse2.models import ShipmentItem
+        shipped = ShipmentItem.objects.filter(
+            shipment=OuterRef('linked_shipment')
+        ).order_by().values('shipment').annotate(total=Sum('quantity')).values('total')
+        return self.annotate(
+            annotated_requested_total=_items_total_subquery('quantity_requested'),
+            annotated_planned_total=_items_total_subquery('quantity_planned'),
+            annotated_produced_total=_items_total_subquery('quantity_produced'),
+            annotated_shipped_total=Coalesce(Subquery(shipped, output_field=IntegerField()), 0),
+        )
+
+
 class ProductionOrder(models.Model):
     class Status(models.TextChoices):
         PENDING = 'pending', 'Ожидает'
@@ -24,15 +80,86 @@ class ProductionOrder(models.Model):
     comment = models.TextField(blank=True, null=True, verbose_name="Комментарий к заказу")
     linked_shipment = models.ForeignKey('warehouse2.Shipment', on_delete=models.SET_NULL, null=True, blank=True, related_name='source_orders', verbose_name="Связанная накладная")
 
+    # === Счетчики строк (ведутся триггером БД на ProductionOrderItem, см. миграцию 0002) ===
+    lines_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Строк в заказе")
+    completed_lines = models.PositiveIntegerField(default=0, editable=False, verbose_name="Выполненных строк")
+    produced_lines = models.PositiveIntegerField(default=0, editable=False, verbose_name="Строк с выпуском")
+    planned_lines = models.PositiveIntegerField(default=0, editable=False, verbose_name="Строк в плане")
+
+    COUNTER_FIELDS = ('lines_count', 'completed_lines', 'produced_lines', 'planned_lines')
+
+    objects = ProductionOrderQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # Счетчики пишет только триггер: полное сохранение не должно
+        # затирать их значениями, прочитанными до изменения строк
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def status_from_counters(cls, lines_count, completed_lines, produced_lines, planned_lines, has_shipment=False):
+        """Статус заказа за O(1) по счетчикам строк."""
+        if has_shipment:
+            return cls.Status.SHIPPED
+        if not lines_count:
+            return cls.Status.PENDING
+        if completed_lines == lines_count:
+            return cls.Status.COMPLETED
+        if produced_lines:
+            return cls.Status.PARTIAL
+        if planned_lines:
+            return cls.Status.PLANNED
+        return cls.Status.PENDING
+
+    @classmethod
+    def recount_counters(cls):
+        """Полный пересчет счетчиков по строкам (восстановление после сбоев)."""
+        with connection.cursor() as cursor:
+            cursor.execute(RECOUNT_ORDER_COUNTERS_SQL)
+            return cursor.rowcount
+
+    @classmethod
+    def attach_totals(cls, orders):
+        """
+        Проставляет суммы заказам, загруженным через select_related
+        (например, workorder.order_item.production_order): один запрос на всю страницу.
+        """
+        orders = [order for order in orders if order is not None]
+        if not orders:
+            return
+        totals = {
+            row['pk']: row for row in
+            cls.objects.filter(pk__in={order.pk for order in orders})
+            .with_totals().values('pk', *ProductionOrderQuerySet.TOTAL_ANNOTATIONS)
+        }
+        for order in orders:
+            for name in ProductionOrderQuerySet.TOTAL_ANNOTATIONS:
+                setattr(order, name, totals[order.pk][name])
+
     @property
     def total_requested(self):
         """Сумма всех запрошенных товаров в заказе"""
-        # Используем sum() по связанным объектам
+        # Берем готовое из with_totals(), иначе считаем по строкам (учитывает prefetch)
+        if hasattr(self, 'annotated_requested_total'):
+            return self.annotated_requested_total
         return sum(item.quantity_requested for item in self.items.all())
 
+    @property
+    def total_planned(self):
+        """Сумма всех запланированных товаров в заказе"""
+        if hasattr(self, 'annotated_planned_total'):
+            return self.annotated_planned_total
+        return sum(item.quantity_planned for item in self.items.all())
+
     @property
     def total_produced(self):
         """Сумма всех произведенных товаров в заказе"""
+        if hasattr(self, 'annotated_produced_total'):
+            return self.annotated_produced_total
         return sum(item.quantity_produced for item in self.items.all())
     
     @property
@@ -50,8 +177,7 @@ class ProductionOrder(models.Model):
 
     @property
     def shipment_gap(self):
-        # Python sum() работает быстро, так как items уже в памяти (prefetch_related)
-        # А total_shipped теперь берется из аннотации
+        # С with_totals() обе суммы уже посчитаны в БД
         return self.total_requested - self.total_shipped
 
     @property
@@ -68,19 +194,17 @@ class ProductionOrder(models.Model):
                 self.save()
                 return
 
-            items = self.items.all()
-            if not items.exists():
-                self.status = self.Status.PENDING
-            elif all(item.is_completed for item in items):
-                self.status = self.Status.COMPLETED
-            elif any(item.quantity_produced > 0 for item in items):
-                self.status = self.Status.PARTIAL
-            elif any(item.quantity_planned > 0 for item in items):
-                self.status = self.Status.PLANNED
-            else:
-                self.status = self.Status.PENDING
-                
-            self.save()
+            # Объект в памяти мог устареть — статус и счетчики берем из БД одной строкой
+            current_status, *counters = ProductionOrder.objects.filter(pk=self.pk).values_list(
+                'status', *self.COUNTER_FIELDS
+            ).get()
+            for name, value in zip(self.COUNTER_FIELDS, counters):
+                setattr(self, name, value)
+
+            status = self.status_from_counters(*counters)
+            if status != current_status:
+                self.status = status
+                self.save(update_fields=['status'])
 
     def get_absolute_url(self):
         return reverse('portfolio_detail', kwargs={'pk': self.pk})
@@ -259,4 +383,31 @@ class WorkOrder(models.Model):
     class Meta:
         verbose_name = "Задание на смену"
         verbose_name_plural = "Задания на смену (Доска)"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class ProductionReportReceipt(models.Model):
+    """
+    Квитанция об отчете о выпуске, присланном планшетом с ключом идемпотентности.
+    Повторная отправка того же ключа (ретрай по таймауту, сброс офлайн-буфера)
+    не проводит выпуск второй раз, а возвращает сохраненный результат.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Принят'
+        APPLIED = 'applied', 'Проведен'
+        REJECTED = 'rejected', 'Отклонен'
+
+    key = models.CharField(max_length=64, unique=True, verbose_name="Ключ идемпотентности")
+    work_order = models.ForeignKey(WorkOrder, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_receipts', verbose_name="Задание")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    message = models.CharField(max_length=255, blank=True, verbose_name="Результат")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Сотрудник")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Получен")
+
+    def __str__(self):
+        return f"Отчет {self.key} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Квитанция отчета о выпуске"
+        verbose_name_plural = "Квитанции отчетов о выпуске"
+        ordering = ['-created_at']
@@ -0,0 +1,438 @@
+"""
+Быстрый путь регистрации выпуска продукции (планшеты в цеху).
+
+Вместо цепочки save()/refresh_from_db() из WorkOrder.report_production
+счетчики увеличиваются через UPDATE ... RETURNING, новые статусы
+выводятся из возвращенных значений, и в БД пишутся только изменившиеся колонки.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, Sum, Max
+from django.utils import timezone
+from warehouse2.models import Product, ProductOperation, Sender, Shipment, ShipmentItem
+from warehouse2.tasks import update_stocks_in_keycrm
+from .models import ProductionOrder, ProductionOrderItem, WorkOrder, ProductionReportReceipt
+
+
+def _workorder_status(produced, planned):
+    """Та же логика, что и в WorkOrder.report_production."""
+    if produced >= planned:
+        return WorkOrder.Status.COMPLETED
+    if produced > 0:
+        return WorkOrder.Status.IN_PROGRESS
+    return WorkOrder.Status.NEW
+
+
+def _item_status(requested, planned, produced, has_shipment):
+    """Та же логика, что и в ProductionOrderItem.update_status."""
+    if has_shipment:
+        return ProductionOrderItem.Status.SHIPPED
+    if produced >= requested:
+        return ProductionOrderItem.Status.COMPLETED
+    if produced > 0:
+        return ProductionOrderItem.Status.PARTIAL
+    if planned > 0:
+        return ProductionOrderItem.Status.PLANNED
+    return ProductionOrderItem.Status.PENDING
+
+
+def _order_status(order_id):
+    """Статус заказа по счетчикам строк (их уже обновил триггер) — без чтения строк."""
+    counters = ProductionOrder.objects.filter(pk=order_id).values_list(*ProductionOrder.COUNTER_FIELDS).get()
+    return ProductionOrder.status_from_counters(*counters)
+
+
+def report_production(work_order_id, quantity_done, user):
+    """
+    Регистрирует выпуск по заданию.
+    Возвращает (success, message, data); data — актуальные значения задания для интерфейса.
+    """
+    workorder_table = WorkOrder._meta.db_table
+    item_table = ProductionOrderItem._meta.db_table
+    order_table = ProductionOrder._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # 1. Факт по заданию (завершенные задания не трогаем)
+        cursor.execute(
+            f"""
+            UPDATE {workorder_table} SET quantity_produced = quantity_produced + %s
+            WHERE id = %s AND status <> %s
+            RETURNING quantity_produced, quantity_planned, status, product_id, order_item_id
+            """,
+            [quantity_done, work_order_id, WorkOrder.Status.COMPLETED],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            if not WorkOrder.objects.filter(pk=work_order_id).exists():
+                raise WorkOrder.DoesNotExist
+            return False, "Задание уже завершено", None
+        produced, planned, old_status, product_id, order_item_id = row
+
+        status = _workorder_status(produced, planned)
+        if status != old_status:
+            changes = {'status': status}
+            if status == WorkOrder.Status.COMPLETED:
+                changes['completed_at'] = timezone.now()
+            WorkOrder.objects.filter(pk=work_order_id).update(**changes)
+
+        # 2. Склад: только остаток (как save(update_fields=['total_quantity']) — без синхронизации карточки)
+        cursor.execute(
+            f"UPDATE {Product._meta.db_table} SET total_quantity = total_quantity + %s WHERE id = %s",
+            [quantity_done, product_id],
+        )
+
+        # 3. Журнал через ORM: post_save запускает синхронизацию остатков с CRM
+        ProductOperation.objects.create(
+            product_id=product_id,
+            operation_type=ProductOperation.OperationType.PRODUCTION,
+            quantity=quantity_done,
+            content_type=ContentType.objects.get_for_model(WorkOrder),
+            object_id=work_order_id,
+            user=user,
+        )
+
+        # 4. Строка заказа и ее родитель
+        if order_item_id:
+            cursor.execute(
+                f"""
+                UPDATE {item_table} AS item SET quantity_produced = item.quantity_produced + %s
+                FROM {order_table} AS po
+                WHERE item.id = %s AND po.id = item.production_order_id
+                RETURNING item.quantity_requested, item.quantity_planned, item.quantity_produced,
+                          item.status, item.production_order_id, po.status, po.linked_shipment_id
+                """,
+                [quantity_done, order_item_id],
+            )
+            requested, item_planned, item_produced, old_item_status, order_id, old_order_status, shipment_id = cursor.fetchone()
+
+            item_status = _item_status(requested, item_planned, item_produced, shipment_id is not None)
+            if item_status != old_item_status:
+                ProductionOrderItem.objects.filter(pk=order_item_id).update(status=item_status)
+
+            if shipment_id is not None:
+                order_status = ProductionOrder.Status.SHIPPED
+            else:
+                order_status = _order_status(order_id)
+            if order_status != old_order_status:
+                ProductionOrder.objects.filter(pk=order_id).update(status=order_status)
+
+    data = {
+        'new_produced': produced,
+        'total_qty': planned,
+        'remaining': planned - produced,
+        'status_label': WorkOrder.Status(status).label,
+        'status_class': WorkOrder(status=status).status_badge_class,
+        'is_completed': status == WorkOrder.Status.COMPLETED,
+    }
+    return True, f"Выпуск {quantity_done} шт. зарегистрирован. Задание №{work_order_id}", data
+
+
+def get_board_state(order_ids, work_order_ids):
+    """
+    Текущие счетчики для живой доски: карточки заказов и задания, открытые на странице.
+    Поля — те же, что в ответе report_production, чтобы JS обновлял карточки одинаково.
+    """
+    orders = ProductionOrder.objects.filter(pk__in=order_ids).with_totals().order_by('pk')
+    work_orders = WorkOrder.objects.filter(pk__in=work_order_ids).order_by('pk').only(
+        'pk', 'quantity_planned', 'quantity_produced', 'status'
+    )
+    return {
+        'orders': [
+            {
+                'order_id': order.pk,
+                'order_requested': order.total_requested,
+                'order_produced': order.total_produced,
+                'order_status': order.status,
+                'order_status_label': order.get_status_display(),
+            }
+            for order in orders
+        ],
+        'work_orders': [
+            {
+                'work_order_id': wo.pk,
+                'new_produced': wo.quantity_produced,
+                'total_qty': wo.quantity_planned,
+                'remaining': wo.remaining_to_produce,
+                'status_label': wo.get_status_display(),
+                'status_class': wo.status_badge_class,
+                'is_completed': wo.status == WorkOrder.Status.COMPLETED,
+            }
+            for wo in work_orders
+        ],
+    }
+
+
+class PlanningError(ValueError):
+    """Ошибка в сетке плана: строка не найдена или количество вне допустимого."""
+
+
+def plan_work_orders(lines, comment=None):
+    """
+    Массовое планирование: задания на смену по нескольким строкам заказов сразу.
+
+    lines — список (item_id, quantity); quantity=None означает «весь остаток строки».
+    Один bulk_create заданий, один bulk_update строк, статус каждого
+    затронутого заказа пересчитывается один раз (по счетчикам строк).
+    Возвращает список созданных WorkOrder. При ошибке в любой строке не создается ничего.
+    """
+    requested = {}
+    for item_id, quantity in lines:
+        if item_id in requested:
+            raise PlanningError(f"Строка заказа #{item_id} указана в плане дважды")
+        requested[item_id] = quantity
+
+    with transaction.atomic():
+        items = (
+            ProductionOrderItem.objects
+            .select_for_update(of=('self',))
+            .select_related('production_order')
+            .filter(pk__in=requested)
+            .order_by('pk')
+        )
+        items = {item.pk: item for item in items}
+        missing = set(requested) - set(items)
+        if missing:
+            raise PlanningError(f"Строки заказа не найдены: {', '.join(map(str, sorted(missing)))}")
+
+        work_orders = []
+        changed_items = []
+        for item_id, quantity in requested.items():
+            item = items[item_id]
+            order = item.production_order
+            if quantity is None:
+                quantity = item.remaining_to_plan
+                if quantity <= 0:
+                    continue  # строка уже запланирована полностью
+            elif quantity <= 0 or quantity > item.remaining_to_plan:
+                raise PlanningError(
+                    f"Строка #{item_id}: можно запланировать от 1 до {item.remaining_to_plan} шт."
+                )
+
+            work_orders.append(WorkOrder(
+                order_item=item,
+                product_id=item.product_id,
+                quantity_planned=quantity,
+                comment=comment or f"По заказу №{order.id} (Заказчик: {order.customer})",
+            ))
+            item.quantity_planned += quantity
+            item.status = _item_status(
+                item.quantity_requested, item.quantity_planned, item.quantity_produced,
+                order.linked_shipment_id is not None,
+            )
+            changed_items.append(item)
+
+        if not work_orders:
+            return []
+
+        WorkOrder.objects.bulk_create(work_orders)
+        # Счетчики заказов обновит триггер на строках (см. todo/migrations/0002)
+        ProductionOrderItem.objects.bulk_update(changed_items, ['quantity_planned', 'status'])
+
+        order_ids = {item.production_order_id for item in changed_items}
+        fields = ('id', 'status', 'linked_shipment_id') + ProductionOrder.COUNTER_FIELDS
+        changed_orders = []
+        for order_id, status, shipment_id, *counters in ProductionOrder.objects.filter(pk__in=order_ids).values_list(*fields):
+            new_status = ProductionOrder.status_from_counters(*counters, has_shipment=shipment_id is not None)
+            if new_status != status:
+                changed_orders.append(ProductionOrder(pk=order_id, status=new_status))
+        ProductionOrder.objects.bulk_update(changed_orders, ['status'])
+
+    return work_orders
+
+
+class ShipmentFromOrdersError(ValueError):
+    """Отгрузку по заказам создать нельзя (нечего отгружать, не хватает остатка и т.п.)."""
+
+
+def get_default_sender():
+    """Отправитель по умолчанию (ID=1, иначе первый) одним запросом; если нет ни одного — создаем."""
+    sender = Sender.objects.order_by(Case(When(pk=1, then=Value(0)), default=Value(1)), 'pk').first()
+    return sender or Sender.objects.create(name="Основной склад")
+
+
+def _reserve_stock(quantities):
+    """
+    Резервирует остатки по всем товарам одним UPDATE.
+    Строки товаров блокируются самим UPDATE, условие доступности проверяется
+    на заблокированной версии строки. Возвращает id товаров, которые зарезервировать не удалось.
+    """
+    product_ids = list(quantities)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {Product._meta.db_table} AS p
+            SET reserved_quantity = p.reserved_quantity + v.qty
+            FROM unnest(%s::bigint[], %s::integer[]) AS v(product_id, qty)
+            WHERE p.id = v.product_id AND p.total_quantity - p.reserved_quantity >= v.qty
+            RETURNING p.id
+            """,
+            [product_ids, [quantities[pk] for pk in product_ids]],
+        )
+        reserved = {row[0] for row in cursor.fetchall()}
+    return set(product_ids) - reserved
+
+
+def create_shipment_from_orders(order_ids, user):
+    """
+    Одна отгрузка (Shipment) по произведенному в нескольких заказах.
+
+    Одинаковые товары из разных заказов сводятся в одну позицию. Резерв — одним
+    UPDATE по всем товарам, позиции — одним bulk_create, остатки в CRM — одной
+    задачей после коммита. Если хоть одного товара не хватает, не создается ничего.
+    """
+    with transaction.atomic():
+        orders = list(
+            ProductionOrder.objects.select_for_update()
+            .filter(pk__in=order_ids).order_by('pk')
+            .only('id', 'customer', 'linked_shipment_id')
+        )
+        if not orders:
+            raise ShipmentFromOrdersError("Заказы не найдены.")
+        shipped = [str(order.pk) for order in orders if order.linked_shipment_id]
+        if shipped:
+            raise ShipmentFromOrdersError(f"По заказам уже созданы отгрузки: №{', №'.join(shipped)}.")
+        order_ids = [order.pk for order in orders]
+
+        produced_items = ProductionOrderItem.objects.filter(production_order_id__in=order_ids, quantity_produced__gt=0)
+        lines = list(
+            produced_items.values('product_id')
+            .annotate(quantity=Sum('quantity_produced'), price=Max('product__price'), name=Max('product__name'))
+            .order_by('product_id')
+        )
+        if not lines:
+            raise ShipmentFromOrdersError("Нет товаров с зарегистрированным выпуском для отгрузки.")
+
+        shortages = _reserve_stock({line['product_id']: line['quantity'] for line in lines})
+        if shortages:
+            available = {
+                pk: total - reserved
+                for pk, total, reserved in Product.objects.filter(pk__in=shortages)
+                .values_list('pk', 'total_quantity', 'reserved_quantity')
+            }
+            details = "; ".join(
+                f"'{line['name']}' (нужно {line['quantity']}, доступно {available[line['product_id']]})"
+                for line in lines if line['product_id'] in shortages
+            )
+            raise ShipmentFromOrdersError(f"Недостаточно товара: {details}")
+
+        customers = list(dict.fromkeys(order.customer for order in orders if order.customer))
+        shipment = Shipment.objects.create(
+            created_by=user,
+            sender=get_default_sender(),
+            destination=(", ".join(customers) or "Не указан")[:Shipment._meta.get_field('destination').max_length],
+            status='pending',
+        )
+        # Резерв уже сделан выше, поэтому ShipmentItem.save() (с его резервом и задачей CRM) не нужен
+        ShipmentItem.objects.bulk_create([
+            ShipmentItem(shipment=shipment, product_id=line['product_id'], quantity=line['quantity'], price=line['price'])
+            for line in lines
+        ])
+
+        ProductionOrder.objects.filter(pk__in=order_ids).update(
+            linked_shipment=shipment, status=ProductionOrder.Status.SHIPPED
+        )
+        produced_items.update(status=ProductionOrderItem.Status.SHIPPED)
+
+        product_ids = [line['product_id'] for line in lines]
+        transaction.on_commit(lambda: update_stocks_in_keycrm.delay(product_ids))
+
+    return shipment
+
+
+def _parse_report(raw):
+    """(key, work_order_id, quantity) или None, если отчет некорректен."""
+    try:
+        key = str(raw['key']).strip()
+        work_order_id = int(raw['workorder_id'])
+        quantity = int(raw['quantity'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    max_length = ProductionReportReceipt._meta.get_field('key').max_length
+    if not key or len(key) > max_length or quantity <= 0:
+        return None
+    return key, work_order_id, quantity
+
+
+def ingest_production_reports(reports, user):
+    """
+    Пакет отчетов о выпуске с ключами идемпотентности (офлайн-буфер планшета).
+
+    reports — список {'key': ..., 'workorder_id': ..., 'quantity': ...}.
+    Ключи записываются одним INSERT ... ON CONFLICT DO NOTHING: уже виденные ключи
+    (в т.ч. из параллельного запроса) не проводятся повторно. Новые отчеты
+    суммируются по заданию и проводятся одним report_production на задание,
+    все — в одной транзакции. Возвращает результаты в порядке входного списка.
+    """
+    results = [None] * len(reports)
+    accepted = {}  # key -> (индекс в reports, id задания, количество)
+    for index, raw in enumerate(reports):
+        parsed = _parse_report(raw) if isinstance(raw, dict) else None
+        if parsed is None:
+            results[index] = {'key': raw.get('key') if isinstance(raw, dict) else None,
+                              'status': 'invalid', 'message': 'Некорректный отчет'}
+        elif parsed[0] in accepted:
+            results[index] = {'key': parsed[0], 'status': 'duplicate', 'message': 'Ключ повторяется в пакете'}
+        else:
+            key, work_order_id, quantity = parsed
+            accepted[key] = (index, work_order_id, quantity)
+
+    if not accepted:
+        return results
+
+    keys = list(accepted)
+    receipt_table = ProductionReportReceipt._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {receipt_table} (key, work_order_id, quantity, status, message, user_id, created_at)
+                SELECT v.key, w.id, v.quantity, %s, '', %s, now()
+                FROM unnest(%s::varchar[], %s::bigint[], %s::integer[]) WITH ORDINALITY AS v(key, work_order_id, quantity, ord)
+                LEFT JOIN {WorkOrder._meta.db_table} w ON w.id = v.work_order_id
+                ORDER BY v.ord
+                ON CONFLICT (key) DO NOTHING
+                RETURNING id, key, work_order_id
+                """,
+                [
+                    ProductionReportReceipt.Status.PENDING, user.pk if user else None,
+                    keys, [accepted[key][1] for key in keys], [accepted[key][2] for key in keys],
+                ],
+            )
+            inserted = cursor.fetchall()
+
+        # Уже присланные ранее ключи: отдаем сохраненный результат
+        new_keys = {key for _, key, _ in inserted}
+        seen = ProductionReportReceipt.objects.filter(key__in=[key for key in keys if key not in new_keys])
+        for key, status, message in seen.values_list('key', 'status', 'message'):
+            results[accepted[key][0]] = {'key': key, 'status': 'duplicate', 'original_status': status, 'message': message}
+
+        # Новые отчеты: по одному проведению на задание (в порядке id — меньше шансов на взаимоблокировки)
+        groups = {}
+        receipts = []
+        for receipt_id, key, work_order_id in inserted:
+            receipt = ProductionReportReceipt(pk=receipt_id, key=key)
+            receipts.append(receipt)
+            if work_order_id is None:
+                receipt.status = ProductionReportReceipt.Status.REJECTED
+                receipt.message = "Задание не найдено"
+            else:
+                groups.setdefault(work_order_id, []).append(receipt)
+
+        for work_order_id in sorted(groups):
+            group = groups[work_order_id]
+            total = sum(accepted[receipt.key][2] for receipt in group)
+            success, message, data = report_production(work_order_id, total, user)
+            for receipt in group:
+                receipt.status = ProductionReportReceipt.Status.APPLIED if success else ProductionReportReceipt.Status.REJECTED
+                receipt.message = message[:255]
+                receipt.data = data
+
+        ProductionReportReceipt.objects.bulk_update(receipts, ['status', 'message'])
+
+    for receipt in receipts:
+        result = {'key': receipt.key, 'status': receipt.status, 'message': receipt.message}
+        if getattr(receipt, 'data', None):
+            result.update(receipt.data)
+        results[accepted[receipt.key][0]] = result
+    return results
@@ -0,0 +1,13 @@
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from .models import ProductionReportReceipt
+
+
+@shared_task
+def purge_production_report_receipts():
+    """Удаляет старые ключи идемпотентности: планшет не станет досылать отчет месячной давности."""
+    border = timezone.now() - timedelta(days=settings.PRODUCTION_REPORT_KEY_TTL_DAYS)
+    deleted, _ = ProductionReportReceipt.objects.filter(created_at__lt=border).delete()
+    return deleted
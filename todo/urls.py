@@ -9,6 +9,10 @@ urlpatterns = [
     path('orders/aggregate/', views.AggregateOrdersView.as_view(), name='aggregate_orders'),
     # AJAX эндпоинт (скрытый путь для JS)
     path('api/workorder/report/', views.workorder_report_ajax, name='api_workorder_report'),
+    path('api/workorder/report/batch/', views.workorder_report_batch_ajax, name='api_workorder_report_batch'),
+    path('api/workorders/plan/', views.plan_workorders_api, name='api_workorders_plan'),
+    # Живая доска: опрос счетчиков доски и страницы заказа
+    path('board/state/', views.production_board_state, name='production_board_state'),
 
     # --- "ПЛАНИРОВАНИЕ ЗАКАЗОВ" (Backlog) ---
     path('portfolio/', views.ProductionOrderListView.as_view(), name='portfolio_list'),
@@ -19,4 +23,5 @@ urlpatterns = [
 
     path('portfolio/<int:pk>/plan/', views.PlanWorkOrdersView.as_view(), name='portfolio_plan_workorders'),
     path('portfolio/<int:pk>/create_shipment/', views.CreateShipmentFromOrderView.as_view(), name='portfolio_create_shipment'),
+    path('portfolio/create_shipment/', views.CreateShipmentFromOrdersView.as_view(), name='portfolio_create_shipment_bulk'),
 ]
\ No newline at end of file
@@ -4,17 +4,24 @@ from django.urls import reverse_lazy, reverse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.db.models import F, Q, Sum, Prefetch
 from django import forms
 from .models import ProductionOrder, ProductionOrderItem, WorkOrder
 from .forms import ProductionOrderForm
+from .servises import (
+    report_production, get_board_state, plan_work_orders, PlanningError,
+    create_shipment_from_orders, ShipmentFromOrdersError,
+    ingest_production_reports,
+)
 from django.views import View
-from warehouse2.models import Shipment, ShipmentItem, Sender, Product
+from warehouse2.models import Product
 import json
 from django.http import JsonResponse
+from django.conf import settings
 from django.views.decorators.http import require_POST
-from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response, set_response_etag
 # ==============================================================================
 # Вью для "Портфеля заказов"
 # ==============================================================================
@@ -26,27 +33,11 @@ class ProductionOrderListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        # 1. Оптимизация вложенных структур:
-        # Мы хотим загрузить items (строки заказа) И сразу products (названия товаров),
-        # чтобы не было доп. запросов при выводе имен товаров.
-        items_prefetch = Prefetch(
-            'items',
-            queryset=ProductionOrderItem.objects.select_related('product')
-        )
-
-        # 2. Формируем основной QuerySet
+        # Все суммы (заказано/произведено/отгружено) считаются подзапросами
+        # в том же SELECT — строки заказов для списка не загружаются вовсе
         queryset = ProductionOrder.objects.select_related(
             'linked_shipment'  # Сразу тянем данные накладной
-        ).prefetch_related(
-            items_prefetch     # Тянем строки заказа + товары
-        ).annotate(
-            # 3. СЧИТАЕМ СУММУ ОТГРУЗОК НА УРОВНЕ БД
-            # Coalesce превращает NULL в 0, если накладной нет
-            annotated_shipped_total=Coalesce(
-                Sum('linked_shipment__items__quantity'), 
-                0
-            )
-        ).order_by('-due_date')
+        ).with_totals().order_by('-due_date')
         
         # Фильтры
         due_date = self.request.GET.get('due_date')
@@ -65,6 +56,11 @@ class ProductionOrderDetailView(LoginRequiredMixin, DetailView):
     template_name = 'todo/portfolio_detail.html'
     context_object_name = 'order'
 
+    def get_queryset(self):
+        return ProductionOrder.objects.with_totals().prefetch_related(
+            Prefetch('items', queryset=ProductionOrderItem.objects.select_related('product'))
+        )
+
 class ProductionOrderCreateView(LoginRequiredMixin, CreateView):
     model = ProductionOrder
     form_class = ProductionOrderForm
@@ -249,34 +245,11 @@ class PlanWorkOrdersView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         order = self.portfolio_order
-        # Выбираем строки, которые нужно запланировать
-        lines_to_plan = order.items.filter(quantity_requested__gt=F('quantity_planned'))
-        
-        created_count = 0
+        # Выбираем строки, которые нужно запланировать (весь остаток каждой строки)
+        lines_to_plan = order.items.filter(quantity_requested__gt=F('quantity_planned')).values_list('pk', flat=True)
 
-        with transaction.atomic():
-            for line in lines_to_plan:
-                quantity_to_plan = line.remaining_to_plan
-                
-                if quantity_to_plan > 0:
-                    # 1. Создаем Задание на смену (WorkOrder)
-                    WorkOrder.objects.create(
-                        order_item=line, # Привязываем к строке
-                        product=line.product, # Дублируем продукт для удобства
-                        quantity_planned=quantity_to_plan,
-                        comment=f"По заказу №{order.id} (Заказчик: {order.customer})"
-                    )
-                    
-                    # 2. Обновляем строку (Items): говорим, что мы передали это кол-во в план
-                    line.quantity_planned = F('quantity_planned') + quantity_to_plan
-                    line.status = ProductionOrderItem.Status.PLANNED
-                    line.save()
-                    created_count += 1
-            
-            # 3. Обновляем статус самого Заказа (Header)
-            if created_count > 0:
-                order.status = ProductionOrder.Status.PLANNED
-                order.save()
+        # Одним пакетом: bulk_create заданий, bulk_update строк, статус заказа — один раз
+        created_count = len(plan_work_orders([(pk, None) for pk in lines_to_plan]))
 
         if created_count > 0:
             messages.success(self.request, f'Успешно создано {created_count} заданий на смену. Они появились на доске.')
@@ -302,62 +275,37 @@ class CreateShipmentFromOrderView(LoginRequiredMixin, View):
             return redirect('portfolio_detail', pk=pk)
 
         try:
-            with transaction.atomic():
-                # 1. Получаем или создаем Отправителя по умолчанию (ID=1)
-                # Если Sender с ID=1 нет, берем первого попавшегося или создаем заглушку
-                sender = Sender.objects.filter(pk=1).first()
-                if not sender:
-                    sender = Sender.objects.first()
-                    if not sender:
-                        # Если совсем нет отправителей, создаем технического
-                        sender = Sender.objects.create(name="Основной склад")
-
-                # 2. Создаем "Шапку" Отгрузки
-                shipment = Shipment.objects.create(
-                    created_by=request.user,
-                    sender=sender,
-                    # Копируем заказчика в поле 'Адрес отгрузки' (или recipient)
-                    destination=production_order.customer or "Не указан", 
-                    status='pending' # Статус "В процессе сборки"
-                )
-
-                production_order.linked_shipment = shipment
-                # Статус обновится автоматически внутри метода update_status
-                production_order.update_status() 
-                # --------------------------
-
-                # 3. Создаем строки Отгрузки
-                items_created_count = 0
-                for item in production_order.items.all():
-                    # Берем то, что реально произведено (факт)
-                    qty_to_ship = item.quantity_produced 
-                   
-                    if qty_to_ship > 0:
-                        # Важно: ShipmentItem при сохранении может уменьшить доступное кол-во на складе
-                        ShipmentItem.objects.create(
-                            shipment=shipment,
-                            product=item.product,
-                            quantity=qty_to_ship,
-                        )
-                        items_created_count += 1
-                        
-                        # Обновляем статус строки
-                        item.status = ProductionOrderItem.Status.SHIPPED
-                        item.save()
-
-                if items_created_count == 0:
-                    raise ValueError("Нет товаров с зарегистрированным выпуском для отгрузки.")
-
-                messages.success(request, f"Накладная №{shipment.id} создана и связана с заказом!")
-                return redirect('shipment_items', pk=shipment.pk)
-
-        except ValueError as e:
+            # Резерв одним UPDATE, позиции одним bulk_create (см. todo/servises.py)
+            shipment = create_shipment_from_orders([production_order.pk], request.user)
+        except ShipmentFromOrdersError as e:
             messages.error(request, str(e))
             return redirect('portfolio_detail', pk=pk)
         except Exception as e:
             messages.error(request, f"Ошибка при создании отгрузки: {e}")
             return redirect('portfolio_detail', pk=pk)
 
+        messages.success(request, f"Накладная №{shipment.id} создана и связана с заказом!")
+        return redirect('shipment_items', pk=shipment.pk)
+
+
+class CreateShipmentFromOrdersView(LoginRequiredMixin, View):
+    """Одна общая отгрузка по нескольким выбранным заказам (из сводного плана)."""
+
+    def post(self, request):
+        order_ids = [pk for pk in request.POST.getlist('selected_orders') if pk.isdigit()]
+        if not order_ids:
+            messages.warning(request, "Вы не выбрали ни одного заказа для отгрузки.")
+            return redirect('workorder_list')
+
+        try:
+            shipment = create_shipment_from_orders(order_ids, request.user)
+        except ShipmentFromOrdersError as e:
+            messages.error(request, str(e))
+            return redirect('workorder_list')
+
+        messages.success(request, f"Накладная №{shipment.id} создана по заказам: {len(order_ids)} шт.")
+        return redirect('shipment_items', pk=shipment.pk)
+
 # ==============================================================================
 # Вью для "Доски объявлений" (WorkOrder)
 # ==============================================================================
@@ -433,6 +381,11 @@ class WorkOrderListView(LoginRequiredMixin, ListView):
         # Передаем статус фильтрации в шаблон
         # Улучшенная проверка: true, если хотя бы один из параметров был задан и корректен
         context['is_filtered'] = bool(self.request.GET.get('due_date') or self.request.GET.get('production_order_id'))
+        # Суммы по заказам для заголовков групп — одним запросом на страницу
+        ProductionOrder.attach_totals(
+            wo.order_item.production_order for wo in context['workorders'] if wo.order_item
+        )
+        context['board_poll_seconds'] = settings.PRODUCTION_BOARD_POLL_SECONDS
         return context
 
 
@@ -457,6 +410,7 @@ class WorkorderOrderDetailView(LoginRequiredMixin, MultipleObjectMixin, DetailVi
         context = super().get_context_data(object_list=queryset, **kwargs)
         context['workorders'] = context['page_obj']
         context['order'] = self.object
+        context['board_poll_seconds'] = settings.PRODUCTION_BOARD_POLL_SECONDS
         
         return context
 
@@ -470,28 +424,17 @@ def workorder_report_ajax(request):
         data = json.loads(request.body)
         workorder_id = data.get('workorder_id')
         quantity_input = int(data.get('quantity', 0))
-        
-        work_order = WorkOrder.objects.get(pk=workorder_id)
 
         # Валидация
         if quantity_input <= 0:
             return JsonResponse({'success': False, 'message': 'Количество должно быть > 0'})
 
-        # Вызываем твой метод логики (он должен быть в модели)
-        success, message = work_order.report_production(quantity_input, request.user)
+        # Быстрый путь: UPDATE ... RETURNING вместо цепочки save() (см. todo/servises.py)
+        success, message, result = report_production(workorder_id, quantity_input, request.user)
         
         if success:
             # Возвращаем обновленные данные для перерисовки интерфейса
-            return JsonResponse({
-                'success': True,
-                'message': message,
-                'new_produced': work_order.quantity_produced,
-                'total_qty': work_order.quantity_planned,
-                'remaining': work_order.remaining_to_produce,
-                'status_label': work_order.get_status_display(),
-                'status_class': work_order.status_badge_class, # Свойство из модели
-                'is_completed': work_order.status == 'completed'
-            })
+            return JsonResponse({'success': True, 'message': message, **result})
         else:
             return JsonResponse({'success': False, 'message': message})
 
@@ -501,6 +444,88 @@ def workorder_report_ajax(request):
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
     
 
+@login_required
+@require_POST
+def workorder_report_batch_ajax(request):
+    """
+    Пакет отчетов о выпуске от планшета (в т.ч. накопленных офлайн).
+    Принимает JSON: {'reports': [{'key': 'uuid', 'workorder_id': 123, 'quantity': 5}, ...]}
+    Повторная отправка с теми же ключами безопасна — выпуск не задвоится.
+    """
+    try:
+        reports = json.loads(request.body).get('reports')
+    except (ValueError, AttributeError):
+        reports = None
+    if not isinstance(reports, list) or not reports:
+        return JsonResponse({'success': False, 'message': 'Ожидается непустой список reports'}, status=400)
+    if len(reports) > settings.PRODUCTION_REPORT_BATCH_MAX:
+        return JsonResponse(
+            {'success': False, 'message': f'Не больше {settings.PRODUCTION_REPORT_BATCH_MAX} отчетов за раз'},
+            status=400,
+        )
+
+    results = ingest_production_reports(reports, request.user)
+    return JsonResponse({'success': True, 'results': results})
+
+
+def _id_list(raw):
+    """'1,2,3' -> [1, 2, 3]; нечисловые значения пропускаются."""
+    ids = [int(part) for part in raw.split(',') if part.strip().isdigit()]
+    return ids[:settings.PRODUCTION_BOARD_MAX_IDS]
+
+
+@login_required
+def production_board_state(request):
+    """
+    Живая доска: счетчики карточек, открытых на странице (опрос из production_board.js).
+    ?orders=1,2 — карточки заказов, ?work_orders=3,4 — задания.
+    Ответ с ETag: если ничего не изменилось, браузер получает пустой 304.
+    """
+    state = get_board_state(
+        _id_list(request.GET.get('orders', '')),
+        _id_list(request.GET.get('work_orders', '')),
+    )
+    response = JsonResponse(state)
+    response['Cache-Control'] = 'no-cache'
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+@login_required
+@require_POST
+def plan_workorders_api(request):
+    """
+    Массовое планирование из сетки плана.
+    Принимает JSON: {'lines': [{'item_id': 1, 'quantity': 5}, ...], 'comment': '...'}
+    quantity можно не указывать — тогда планируется весь остаток строки.
+    """
+    try:
+        data = json.loads(request.body)
+        lines = [
+            (int(line['item_id']), None if line.get('quantity') is None else int(line['quantity']))
+            for line in data.get('lines', [])
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Некорректный формат плана'}, status=400)
+
+    if not lines:
+        return JsonResponse({'success': False, 'message': 'План пуст'}, status=400)
+
+    try:
+        work_orders = plan_work_orders(lines, comment=data.get('comment'))
+    except PlanningError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Создано заданий на смену: {len(work_orders)}',
+        'work_orders': [
+            {'id': wo.pk, 'item_id': wo.order_item_id, 'quantity_planned': wo.quantity_planned}
+            for wo in work_orders
+        ],
+    })
+
+
 class AggregateOrdersView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         # Получаем список ID выбранных заказов из POST-запроса
@@ -0,0 +1,155 @@
+"""
+Маршрутизация чтения на реплику для тяжелых отчетов.
+
+По умолчанию все запросы идут в 'default'. На реплику уходят только чтения
+внутри явно помеченного кода: представления с ReplicaReadMixin/@read_from_replica,
+фоновые выгрузки (use_replica()). Если реплика недоступна или отстает больше
+REPLICA_MAX_LAG_SECONDS — читаем с основной базы.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.utils import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DB_ALIAS = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+# Результат последней проверки реплики: (время проверки, пригодна ли)
+_replica_state = {'checked_at': None, 'healthy': False}
+
+# Отставание в секундах; 0, если это не реплика или все полученное уже применено
+# (на простаивающем мастере pg_last_xact_replay_timestamp давно в прошлом — это не отставание)
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _check_replica():
+    try:
+        with connections[REPLICA_DB_ALIAS].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning("Реплика недоступна, читаем с основной базы: %s", e)
+        connections[REPLICA_DB_ALIAS].close()
+        return False
+
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 30)
+    if lag > max_lag:
+        logger.warning("Реплика отстает на %.1f с (лимит %s с), читаем с основной базы", lag, max_lag)
+        return False
+    return True
+
+
+def replica_is_usable():
+    """Проверка реплики не чаще, чем раз в REPLICA_CHECK_INTERVAL секунд."""
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        return False
+    now = time.monotonic()
+    checked_at = _replica_state['checked_at']
+    if checked_at is None or now - checked_at >= getattr(settings, 'REPLICA_CHECK_INTERVAL', 10):
+        _replica_state['healthy'] = _check_replica()
+        _replica_state['checked_at'] = now
+    return _replica_state['healthy']
+
+
+def reset_replica_state():
+    """Сбрасывает кэш проверки (для тестов и после смены настроек)."""
+    _replica_state['checked_at'] = None
+    _replica_state['healthy'] = False
+
+
+@contextmanager
+def use_replica():
+    """Чтения внутри блока уходят на реплику (если она пригодна)."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Чтения внутри блока идут с основной базы, даже внутри представления с репликой:
+    для кода, который пишет и сразу читает свое (постановка фоновых задач).
+    """
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def _wrap_streaming(iterator):
+    # Тело StreamingHttpResponse читается уже после выхода из view
+    with use_replica():
+        yield from iterator
+
+
+def _run_on_replica(request, view_func, *args, **kwargs):
+    # Пишущие запросы (POST и т.п.) целиком остаются на основной базе
+    if request.method not in ('GET', 'HEAD'):
+        return view_func(request, *args, **kwargs)
+    with use_replica():
+        response = view_func(request, *args, **kwargs)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = _wrap_streaming(response.streaming_content)
+        elif hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+            # TemplateResponse выполняет ленивые queryset'ы при рендере
+            response.render()
+    return response
+
+
+def read_from_replica(view_func):
+    """Декоратор для функций-представлений, которые только читают данные."""
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        return _run_on_replica(request, view_func, *args, **kwargs)
+    return _wrapped
+
+
+class ReplicaReadMixin:
+    """Миксин для CBV: GET/HEAD читают с реплики."""
+
+    def dispatch(self, request, *args, **kwargs):
+        return _run_on_replica(request, super().dispatch, *args, **kwargs)
+
+
+class ReplicaChangelistMixin:
+    """Миксин для ModelAdmin: список объектов в админке читается с реплики."""
+
+    def changelist_view(self, request, extra_context=None):
+        return _run_on_replica(request, super().changelist_view, extra_context)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get():
+            return None
+        # Внутри транзакции читаем то, что сами же и записали
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA_DB_ALIAS if replica_is_usable() else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — та же база, связи между объектами допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
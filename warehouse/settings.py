@@ -108,6 +108,18 @@ DATABASES = {
         'HOST':'localhost',
         'PORT':'5432',}}
 
+# Реплика для тяжелых отчетов и выгрузок (см. warehouse/db_router.py).
+# Без DB_REPLICA_HOST алиас указывает на ту же базу — маршрутизация работает, нагрузка не разносится.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+    'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['warehouse.db_router.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = 30 # При большем отставании реплики читаем с основной базы
+REPLICA_CHECK_INTERVAL = 10 # Как часто (сек) проверять доступность и отставание реплики
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -184,6 +196,40 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# --- Выгрузки отчетов ---
+REPORT_EXPORT_MAX_ROWS = 100000 # Лимит строк в одной выгрузке журнала движения
+REPORT_EXPORT_IN_BACKGROUND = False # True — все выгрузки формируются через Celery
+REPORT_JOB_TTL = 900 # Сколько секунд готовый фоновый отчет считается свежим
+REPORT_JOB_STALE_AFTER = 1800 # Через сколько секунд незавершенная задача считается зависшей
+STOCK_PROJECTION_WINDOW_DAYS = 28 # Окно (дней) для среднего расхода в прогнозе исчерпания
+STOCK_PROJECTION_HORIZON_DAYS = 14 # Позиции, которых хватит меньше чем на столько дней, — в зоне риска
+
+# --- Живая доска производства (опрос с ETag) ---
+PRODUCTION_BOARD_POLL_SECONDS = 5 # Как часто страница запрашивает счетчики; без изменений ответ — пустой 304
+PRODUCTION_BOARD_MAX_IDS = 200 # Сколько карточек одного вида отдается за один запрос
+PRODUCTION_REPORT_BATCH_MAX = 500 # Максимум отчетов о выпуске в одном пакете от планшета
+PRODUCTION_REPORT_KEY_TTL_DAYS = 30 # Сколько дней хранить ключи идемпотентности отчетов
+PAYROLL_RATE_CACHE_SECONDS = 60 # Время жизни кэша ставок в памяти процесса (изменения из других процессов)
+PRODUCT_SEARCH_CACHE_SECONDS = 30 # Кэш найденных id поиска товаров (автокомплит, RemoteSelect); остаток читается всегда свежий
+INVENTORY_SCAN_BATCH_MAX = 500 # Максимум сканов в одном пакете ввода переучета
+INVENTORY_ITEMS_PAGE_SIZE = 100 # Позиций переучета на странице (остальное догружается по кнопке)
+
+# Периодические задачи: нужен процесс celery beat (см. beat в Procfile)
+CELERY_BEAT_SCHEDULE = {
+    'purge-expired-report-jobs': {
+        'task': 'reports.tasks.purge_expired_report_jobs',
+        'schedule': 3600,
+    },
+    'refresh-stock-projections': {
+        'task': 'reports.tasks.refresh_stock_projections',
+        'schedule': 3600,
+    },
+    'purge-production-report-receipts': {
+        'task': 'todo.tasks.purge_production_report_receipts',
+        'schedule': 86400,
+    },
+}
+
 # --- Axes Configuration ---
 AXES_FAILURE_LIMIT = 5 # Количество неудачных попыток до блокировки
 AXES_COOLOFF_TIME = 1 # Блокировка на 2 часа
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from warehouse.db_router import ReplicaChangelistMixin
 from .models import MaterialCategory, UnitOfMeasure, Material, MaterialOperation, OperationOutgoingCategory
 
 @admin.register(MaterialCategory)
@@ -23,7 +24,7 @@ class MaterialAdmin(admin.ModelAdmin):
     search_fields = ('name', 'article', 'barcode')
 
 @admin.register(MaterialOperation)
-class MaterialOperationAdmin(admin.ModelAdmin):
+class MaterialOperationAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('material', 'operation_type', 'outgoing_category', 'quantity', 'date', 'user')
     list_filter = ('operation_type', 'outgoing_category', 'date')
     search_fields = ('material__name', 'material__article')
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+LAST_MOVEMENT_TRIGGER_SQL = """
+-- Дата последнего движения: при вставке — только сдвиг вперед,
+-- при изменении даты/товара или удалении операции — пересчет по журналу.
+CREATE OR REPLACE FUNCTION warehouse1_material_touch_last_movement() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE warehouse1_material SET last_movement_at = NEW.date
+        WHERE id = NEW.material_id AND (last_movement_at IS NULL OR last_movement_at < NEW.date);
+        RETURN NULL;
+    END IF;
+
+    UPDATE warehouse1_material t SET last_movement_at = (
+        SELECT MAX(o.date) FROM warehouse1_materialoperation o WHERE o.material_id = t.id
+    ) WHERE t.id = OLD.material_id;
+
+    IF TG_OP = 'UPDATE' AND NEW.material_id <> OLD.material_id THEN
+        UPDATE warehouse1_material t SET last_movement_at = (
+            SELECT MAX(o.date) FROM warehouse1_materialoperation o WHERE o.material_id = t.id
+        ) WHERE t.id = NEW.material_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER warehouse1_materialoperation_last_movement
+AFTER INSERT OR DELETE OR UPDATE OF date, material_id ON warehouse1_materialoperation
+FOR EACH ROW EXECUTE FUNCTION warehouse1_material_touch_last_movement();
+
+-- Заполняем для существующих данных
+UPDATE warehouse1_material t SET last_movement_at = (
+    SELECT MAX(o.date) FROM warehouse1_materialoperation o WHERE o.material_id = t.id
+);
+"""
+
+DROP_LAST_MOVEMENT_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS warehouse1_materialoperation_last_movement ON warehouse1_materialoperation;
+DROP FUNCTION IF EXISTS warehouse1_material_touch_last_movement();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse1', '0003_delete_materialcolor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='last_movement_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Последнее движение'),
+        ),
+        migrations.AddIndex(
+            model_name='materialoperation',
+            index=models.Index(fields=['material', 'date'], name='materialop_material_date_idx'),
+        ),
+        migrations.RunSQL(LAST_MOVEMENT_TRIGGER_SQL, DROP_LAST_MOVEMENT_TRIGGER_SQL),
+    ]
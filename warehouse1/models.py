@@ -47,6 +47,18 @@ class Material(ContentTypeAware, models.Model):
     unit = models.ForeignKey(UnitOfMeasure, on_delete=models.PROTECT, verbose_name="Единица измерения")
     image = models.ImageField(upload_to='material/', blank=True, null=True, verbose_name="Изображение")
     description = models.TextField(blank=True, verbose_name="Описание")
+    # Ведется триггером БД на журнале MaterialOperation (см. миграцию 0004)
+    last_movement_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True, verbose_name="Последнее движение")
+
+    def save(self, *args, **kwargs):
+        # last_movement_at пишет только триггер: полное сохранение не должно
+        # затирать его значением, прочитанным до последней операции
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'last_movement_at'
+            ]
+        super().save(*args, **kwargs)
 
     def add_quantity(self, quantity):
         """Увеличение количества материала (прием)"""
@@ -112,3 +124,6 @@ class MaterialOperation(models.Model):
     class Meta:
         verbose_name = "Операция с материалом"
         verbose_name_plural = "Операции с материалами"
+        indexes = [
+            models.Index(fields=['material', 'date'], name='materialop_material_date_idx'),
+        ]
@@ -3,6 +3,7 @@ from .models import (
     ProductCategory, Product,
     Shipment, ShipmentItem, ProductOperation, Sender)
 from django.urls import reverse
+from warehouse.db_router import ReplicaChangelistMixin
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
@@ -87,7 +88,7 @@ class ShipmentInline(admin.TabularInline):
 
 
 @admin.register(ProductOperation)
-class ProductOperationAdmin(admin.ModelAdmin):
+class ProductOperationAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('product', 'timestamp', 'operation_type', 'quantity', 'user', 'source')
     list_filter = ('operation_type', 'timestamp', 'product__category')
     search_fields = ('product__name', 'product__sku', 'user__username')
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+LAST_MOVEMENT_TRIGGER_SQL = """
+-- Дата последнего движения: при вставке — только сдвиг вперед,
+-- при изменении даты/товара или удалении операции — пересчет по журналу.
+CREATE OR REPLACE FUNCTION warehouse2_product_touch_last_movement() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE warehouse2_product SET last_movement_at = NEW.timestamp
+        WHERE id = NEW.product_id AND (last_movement_at IS NULL OR last_movement_at < NEW.timestamp);
+        RETURN NULL;
+    END IF;
+
+    UPDATE warehouse2_product t SET last_movement_at = (
+        SELECT MAX(o.timestamp) FROM warehouse2_productoperation o WHERE o.product_id = t.id
+    ) WHERE t.id = OLD.product_id;
+
+    IF TG_OP = 'UPDATE' AND NEW.product_id <> OLD.product_id THEN
+        UPDATE warehouse2_product t SET last_movement_at = (
+            SELECT MAX(o.timestamp) FROM warehouse2_productoperation o WHERE o.product_id = t.id
+        ) WHERE t.id = NEW.product_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER warehouse2_productoperation_last_movement
+AFTER INSERT OR DELETE OR UPDATE OF timestamp, product_id ON warehouse2_productoperation
+FOR EACH ROW EXECUTE FUNCTION warehouse2_product_touch_last_movement();
+
+-- Заполняем для существующих данных
+UPDATE warehouse2_product t SET last_movement_at = (
+    SELECT MAX(o.timestamp) FROM warehouse2_productoperation o WHERE o.product_id = t.id
+);
+"""
+
+DROP_LAST_MOVEMENT_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS warehouse2_productoperation_last_movement ON warehouse2_productoperation;
+DROP FUNCTION IF EXISTS warehouse2_product_touch_last_movement();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse2', '0008_sender_stamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_movement_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Последнее движение'),
+        ),
+        migrations.AddIndex(
+            model_name='productoperation',
+            index=models.Index(fields=['product', 'timestamp'], name='productop_product_ts_idx'),
+        ),
+        migrations.RunSQL(LAST_MOVEMENT_TRIGGER_SQL, DROP_LAST_MOVEMENT_TRIGGER_SQL),
+    ]
@@ -64,6 +64,18 @@ class Product(ContentTypeAware, models.Model):
     # === Складской учет ===
     total_quantity = models.IntegerField(default=0, verbose_name="На балансе")
     reserved_quantity = models.IntegerField(default=0, verbose_name="Зарезервировано")
+    # Ведется триггером БД на журнале ProductOperation (см. миграцию 0009)
+    last_movement_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True, verbose_name="Последнее движение")
+
+    def save(self, *args, **kwargs):
+        # last_movement_at пишет только триггер: полное сохранение не должно
+        # затирать его значением, прочитанным до последней операции
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'last_movement_at'
+            ]
+        super().save(*args, **kwargs)
 
     @property
     def get_image_url(self):
@@ -191,6 +203,9 @@ class ProductOperation(models.Model):
         verbose_name = "Операция с продукцией"
         verbose_name_plural = "Журнал операций с продукцией"
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['product', 'timestamp'], name='productop_product_ts_idx'),
+        ]
         permissions = [
             ("can_return_product", "Может делать возврат накладных"),
         ]
@@ -348,6 +363,10 @@ class Shipment(models.Model):
             self.processed_by = user
             self.shipped_at = timezone.now()
             self.save()
+
+            # Пополняем витрину продаж для отчетов
+            from reports.models import DailySalesFact
+            DailySalesFact.record_shipment(self)
     
     def __str__(self):
         return f"Отгрузка №{self.id} от {self.created_at.strftime('%Y-%m-%d')}"
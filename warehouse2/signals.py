@@ -30,6 +30,7 @@ def trigger_stock_update_on_operation(sender, instance, created, **kwargs):
     """
     Синхронизация остатков при создании операции (приход/расход).
     """
-    if created and instance.product:
+    if created and instance.product_id:
         # Запускаем специальную задачу для остатков (PUT /offers/stocks)
-        update_stock_in_keycrm.apply_async(args=[instance.product.id], countdown=2)
\ No newline at end of file
+        # product_id, а не product.id: не догружаем товар лишним запросом
+        update_stock_in_keycrm.apply_async(args=[instance.product_id], countdown=2)
\ No newline at end of file
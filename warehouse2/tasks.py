@@ -1,47 +1,81 @@
+import logging
 import requests
 from celery import shared_task
 from django.conf import settings
 from .models import Product
 
+logger = logging.getLogger(__name__)
+
+KEYCRM_STOCKS_URL = "https://openapi.keycrm.app/v1/offers/stocks"
+KEYCRM_WAREHOUSE_ID = 2 # ваш проверенный ID
+
+
+def _put_stocks_to_keycrm(stocks):
+    """
+    PUT /offers/stocks для списка [{'sku': ..., 'quantity': ...}].
+    Возвращает текст ошибки валидации (422) или None при успехе.
+    """
+    headers = {
+        "Authorization": f"Bearer {settings.KEYCRM_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    payload = {
+        "warehouse_id": KEYCRM_WAREHOUSE_ID,
+        "stocks": stocks, # SKU — главный идентификатор
+    }
+
+    response = requests.put(KEYCRM_STOCKS_URL, json=payload, headers=headers)
+
+    if response.status_code == 422:
+        logger.error("Ошибка валидации остатков KeyCRM: %s", response.json())
+        return f"Ошибка валидации: {response.json()}"
+
+    response.raise_for_status()
+    return None
+
+
 @shared_task(bind=True, default_retry_delay=300, max_retries=3)
 def update_stock_in_keycrm(self, product_id):
     try:
         product = Product.objects.get(pk=product_id)
-        product.refresh_from_db() # Подтягиваем свежие цифры из БД
-        current_stock = product.available_quantity
         if not product.keycrm_id:
             return f"Пропущено: нет KeyCRM ID."
 
-        API_KEY = settings.KEYCRM_API_KEY
-        url = "https://openapi.keycrm.app/v1/offers/stocks"
-        headers = { 
-            "Authorization": f"Bearer {API_KEY}", 
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
-        payload = {
-            "warehouse_id": 2, # ваш проверенный ID
-            "stocks": [
-                {
-                    "sku": product.sku,  # Используем SKU как главный идентификатор
-                    "quantity": int(current_stock)
-                }
-            ]
-        }
-        
-        response = requests.put(url, json=payload, headers=headers)
-        
-        if response.status_code == 422:
-            print(f"!!! Ошибка валидации остатков: {response.json()}")
-            return f"Ошибка валидации: {response.json()}"
+        error = _put_stocks_to_keycrm([{"sku": product.sku, "quantity": int(product.available_quantity)}])
+        if error:
+            return error
 
-        response.raise_for_status() 
-        
         return f"Остатки для '{product.name}' успешно обовлены до {product.available_quantity} шт."
 
     except Exception as e:
-        print(f"!!! Ошибка обновления склада: {e}")
+        logger.exception("Ошибка обновления остатков в KeyCRM (товар %s)", product_id)
+        return f"Ошибка API KeyCRM: {e}"
+
+
+@shared_task(bind=True, default_retry_delay=300, max_retries=3)
+def update_stocks_in_keycrm(self, product_ids):
+    """Пакетная версия update_stock_in_keycrm: остатки нескольких товаров одним запросом."""
+    try:
+        # Как и `if not product.keycrm_id` в одиночной задаче: пустой (0) ID тоже пропускаем
+        products = Product.objects.filter(pk__in=product_ids).exclude(keycrm_id__isnull=True).exclude(
+            keycrm_id=0
+        ).only('sku', 'total_quantity', 'reserved_quantity')
+        stocks = [
+            {"sku": product.sku, "quantity": int(product.available_quantity)}
+            for product in products
+        ]
+        if not stocks:
+            return "Пропущено: нет товаров с KeyCRM ID."
+
+        error = _put_stocks_to_keycrm(stocks)
+        if error:
+            return error
+
+        return f"Остатки обновлены для {len(stocks)} товаров."
+
+    except Exception as e:
+        logger.exception("Ошибка пакетного обновления остатков в KeyCRM (%s товаров)", len(product_ids))
         return f"Ошибка API KeyCRM: {e}"
 
 
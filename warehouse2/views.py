@@ -15,6 +15,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import transaction
 from django.conf import settings
 from django.template.loader import render_to_string
+from django.core.cache import cache
+import hashlib
 from weasyprint import HTML
 
 # ==============================================================================
@@ -171,17 +173,36 @@ class ProductIncomingView(LoginRequiredMixin, FormView):
 
         return redirect(self.get_success_url())
     
+def _search_product_ids(query, tech_card_only):
+    products = Product.objects.filter(
+        Q(name__icontains=query) |
+        Q(sku__icontains=query) |
+        Q(barcode__exact=query)
+    )
+    if tech_card_only:
+        products = products.filter(tech_card__isnull=False)
+    return list(products.distinct().values_list('id', flat=True)[:10])
+
+
 def product_search_json(request):
+    """
+    Поиск товаров для автокомплита и RemoteSelect (main/widgets.py).
+    tech_card=1 — только товары с техкартой. На PRODUCT_SEARCH_CACHE_SECONDS кэшируется
+    только список найденных id (дорогой поиск по подстроке); сами товары и остаток
+    читаются заново по pk — после прихода/отгрузки форма видит актуальный остаток.
+    """
     query = request.GET.get('q', '').strip()
     results = []
     if len(query) >= 2:
-        products = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(sku__icontains=query) |
-            Q(barcode__exact=query)
-        ).distinct()[:10]
-
-        for product in products:
+        tech_card_only = request.GET.get('tech_card') == '1'
+        digest = hashlib.md5(query.encode()).hexdigest()
+        ids = cache.get_or_set(
+            f'warehouse2:product_search_ids:{int(tech_card_only)}:{digest}',
+            lambda: _search_product_ids(query, tech_card_only),
+            timeout=getattr(settings, 'PRODUCT_SEARCH_CACHE_SECONDS', 30),
+        )
+        products = Product.objects.select_related('category').in_bulk(ids)
+        for product in (products[pk] for pk in ids if pk in products):
             results.append({
                 'id': product.id,
                 'name': str(product),
@@ -516,6 +537,10 @@ class ReturnShipmentView(LoginRequiredMixin, DetailView):
                 
                 shipment.status = 'returned'
                 shipment.save()
+
+                # Возврат вычитается из витрины продаж (в день исходной отгрузки)
+                from reports.models import DailySalesFact
+                DailySalesFact.record_shipment(shipment, sign=-1)
                 messages.success(request, f"Товары по отгрузке №{shipment.id} успешно возвращены на склад.")
         except Exception as e:
             messages.error(request, f"Произошла ошибка при оформлении возврата: {e}")